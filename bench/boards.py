@@ -0,0 +1,90 @@
+"""
+building and walking very large boards, main.json repeated until it has the given number of spaces
+
+    python bench/boards.py --spaces 1000 10000 100000
+
+run from the repository root so ./boards resolves. for every size it times compiling the board file,
+building a game's spaces from it, the Board a game makes of them (the first one also compiles the
+event chains every later game shares), walking the ring, and moving a player all the way around it.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+import boardbuilder
+from board import Board
+from client import NullClient
+from player import Player
+
+BOARDS = os.path.join(os.path.dirname(__file__), "..", "boards")
+SIDES = boardbuilder.SIDES
+
+
+def writeBoard(boardsPath: str, name: str, spaces: int):
+    """main.json's ring of spaces, repeated and cut to `spaces` spaces split over the four sides"""
+    path = f"{BOARDS}/main.json"
+    with open(path) as f:
+        data = json.load(f)
+    ring = [rules.name for rules in boardbuilder.compileSpaces(data, path)]
+    names = (ring * (spaces // len(ring) + 1))[:spaces]
+    side = -(-spaces // len(SIDES))
+    for i, key in enumerate(SIDES):
+        data[key] = " -> ".join(names[i * side:(i + 1) * side])
+    with open(f"{boardsPath}/{name}.json", "w") as f:
+        json.dump(data, f)
+
+
+def timed(results: dict[str, float], name: str, fn):
+    start = time.perf_counter()
+    value = fn()
+    results[name] = time.perf_counter() - start
+    return value
+
+
+def measure(boardsPath: str, spaces: int):
+    name = f"party-{spaces}"
+    writeBoard(boardsPath, name, spaces)
+    results: dict[str, float] = {}
+
+    template = timed(results, "compile", lambda: boardbuilder.loadTemplate(boardsPath, name))
+    first = timed(results, "build", lambda: template.build(0))
+    timed(results, "first Board", lambda: Board(0, name, template.handlers, first, list(template.cards), template=template))
+    start = template.build(1)
+    board = timed(results, "Board", lambda: Board(1, name, template.handlers, start, list(template.cards), template=template))
+    assert len(board.spaces) == spaces and start.isloop()
+
+    timed(results, "iterSpaces", lambda: sum(1 for _ in start.iterSpaces()))
+    timed(results, "getLast", start.getLast)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        timed(results, "print", start.print)
+        player = Player("0", 0, NullClient())
+        board.addPlayer(player)
+        timed(results, "move around", lambda: list(board.move(player, spaces)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spaces", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as boardsPath:
+        # the handlers and chance deck are the generic ones
+        for file in ("generic.py", "generic-chance.json"):
+            os.symlink(os.path.abspath(f"{BOARDS}/{file}"), f"{boardsPath}/{file}")
+        rows = {spaces: measure(boardsPath, spaces) for spaces in args.spaces}
+
+    columns = list(next(iter(rows.values())))
+    print(f"{'spaces':>8} " + " ".join(f"{c:>12}" for c in columns))
+    for spaces, results in rows.items():
+        print(f"{spaces:>8} " + " ".join(f"{results[c] * 1000:>10.1f}ms" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+how many players can a running server take before action latency breaks an SLO?
+
+    python server                                  # in another shell, or pass --spawn
+    python bench/load.py --slo-p99-ms 100 --duration 20
+
+every simulated player is a real websocket client: it sends its details when prompted (Lobby.moveToGame),
+waits for its turn, then rolls, buys, sometimes auctions instead or proposes a trade, and ends its turn.
+everyone else bids while an auction runs. the load doubles, 4 players per game, until p99 latency or the
+error rate breaks the SLO, and every level reports p50/p99/p999 latency, actions/s and errors.
+
+run from the repository root. latency is from sending an action to the first frame with its answer.
+the server gives a reconnecting address back its old seat, so the players of a game connect from
+127.0.0.1-127.0.0.4, which only works against a server on this machine (see --no-bind).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Any
+
+from websockets.asyncio.client import ClientConnection, connect
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+import wire
+
+PLAYERS_PER_GAME = 4
+
+# what answers each action, the first frame with one of these ends its latency sample
+ANSWERS = {
+    "roll": {"roll-complete"},
+    "buy": {"next-turn", "notification"},
+    "end-turn": {"turn-ended", "notification"},
+    "start-game": {"lobby-state"},
+    "start-auction": {"auction-status"},
+    "bid": {"auction-status", "notification"},
+    "propose-trade": {"next-turn", "notification"},
+}
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Stats:
+    latencies: dict[str, list[float]]
+    errors: dict[str, int]
+    rejected: int
+
+    def __init__(self):
+        self.latencies = {action: [] for action in ANSWERS}
+        self.errors = {"timeout": 0, "connection": 0, "server": 0}
+        self.rejected = 0
+
+    @property
+    def actions(self):
+        return sum(map(len, self.latencies.values()))
+
+
+class LoadClient:
+    """one player: a socket, what it knows about the game, and a script for its turns"""
+
+    ws: ClientConnection | None
+    stats: Stats
+    args: argparse.Namespace
+    rng: random.Random
+    id: str | None
+    gameId: float | None
+    spaces: dict[int, dict[str, Any]]
+    players: dict[str, dict[str, Any]]
+    turn: str | None
+    auction: dict[str, Any] | None
+    bids: int
+    waiting: set[str]
+    answer: asyncio.Future[None] | None
+    changed: asyncio.Event
+    reader: asyncio.Task[None] | None
+
+    def __init__(self, stats: Stats, args: argparse.Namespace, seed: int):
+        self.ws = None
+        self.stats = stats
+        self.args = args
+        self.rng = random.Random(seed)
+        self.id = None
+        self.gameId = None
+        self.spaces = {}
+        self.players = {}
+        self.turn = None
+        self.auction = None
+        self.bids = 0
+        self.waiting = set()
+        self.answer = None
+        self.changed = asyncio.Event()
+        self.reader = None
+
+    async def connect(self, path: str, localHost: str | None):
+        query = "?wire=msgpack" if self.args.wire == "msgpack" else ""
+        extra: dict[str, Any] = {"local_addr": (localHost, 0)} if localHost else {}
+        self.ws = await connect(f"{self.args.url}{path}{query}", max_size=None, **extra)
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self):
+        assert self.ws
+        try:
+            async for frame in self.ws:
+                message = wire.unpack(frame) if isinstance(frame, bytes) else json.loads(frame)
+                self.receive(message if isinstance(message, list) else [message])
+        except Exception:
+            self.stats.errors["connection"] += 1
+        finally:
+            if self.answer and not self.answer.done():
+                self.answer.cancel()
+
+    def receive(self, messages: list[dict[str, Any]]):
+        answered = False
+        for message in messages:
+            response: str | None = message.get("response")
+            value: Any = message.get("value")
+            answered = answered or response in self.waiting
+            match response:
+                case "prompt" if self.ws:
+                    asyncio.create_task(self.ws.send(json.dumps({"details": {"name": f"load {self.rng.random():.4f}", "piece": "PIECE"}})))
+                case "assignment":
+                    self.id = value
+                case "board":
+                    self.spaces = {space["id"]: space for space in value["spaces"]}
+                    if value["spaces"]:
+                        self.gameId = value["spaces"][0]["gameId"]
+                case "player-list":
+                    self.players = {player["id"]: player for player in value}
+                case "next-turn":
+                    self.players[value["id"]] = value
+                    self.turn = value["id"]
+                case "state-patch":
+                    for space in value["spaces"]:
+                        self.spaces[space["id"]] = space
+                    for player in value["players"]:
+                        self.players[player["id"]] = player
+                case "auction-status":
+                    if self.auction is None or self.auction["space"] != value["space"]:
+                        self.bids = 0
+                    self.auction = value
+                case "auction-end":
+                    self.auction = None
+                case "notification" if isinstance(value, str):
+                    self.stats.rejected += 1
+                case "error":
+                    self.stats.errors["server"] += 1
+        if answered and self.answer and not self.answer.done():
+            self.answer.set_result(None)
+        self.changed.set()
+
+    async def act(self, action: dict[str, Any]) -> bool:
+        """sends an action and waits for its answer, False if it timed out"""
+        self.waiting = ANSWERS[action["action"]]
+        self.answer = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        assert self.ws, "act before connect"
+        await self.ws.send(json.dumps(action))
+        try:
+            await asyncio.wait_for(self.answer, self.args.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self.stats.errors["timeout"] += 1
+            return False
+        finally:
+            self.waiting = set()
+        self.stats.latencies[action["action"]].append(time.perf_counter() - start)
+        return True
+
+    async def think(self):
+        await asyncio.sleep(self.rng.expovariate(1000 / self.args.think_ms) if self.args.think_ms else 0)
+
+    async def waitFor(self, condition):
+        while not condition():
+            self.changed.clear()
+            await self.changed.wait()
+
+    async def play(self, until: float):
+        while time.time() < until and self.reader and not self.reader.done():
+            if self.auction:
+                await self.bidOnce()
+                continue
+            if self.turn != self.id:
+                try:
+                    await asyncio.wait_for(self.waitFor(lambda: self.turn == self.id or self.auction is not None), max(until - time.time(), 0))
+                except asyncio.TimeoutError:
+                    return
+                continue
+            await self.playTurn()
+
+    async def bidOnce(self):
+        auction = self.auction
+        assert auction
+        me = self.players.get(self.id or "", {})
+        bid = auction["current_bid"] + 10
+        if auction["bidder"] != self.id and self.bids < self.args.max_bids and me.get("money", 0) >= bid and self.rng.random() < 0.5:
+            self.bids += 1
+            await self.think()
+            await self.act({"action": "bid", "bid": bid})
+        else:
+            # the auction runs out on the server's clock
+            await asyncio.sleep(0.05)
+
+    async def playTurn(self):
+        args = self.args
+        await self.think()
+        if not await self.act({"action": "roll"}):
+            return
+        me = self.players.get(self.id or "", {})
+        space = self.spaces.get(me.get("space", -1), {})
+        if space.get("purchaseable") and space.get("owner") is None and me.get("money", 0) >= space.get("cost", 0):
+            await self.think()
+            if self.rng.random() < args.auction_rate:
+                await self.act({"action": "start-auction", "spaceid": space["id"]})
+                await self.waitFor(lambda: self.auction is None)
+            elif self.rng.random() < args.buy_rate:
+                await self.act({"action": "buy", "spaceid": space["id"]})
+        if self.rng.random() < args.trade_rate and (trade := self.tradeFor(me)):
+            await self.think()
+            await self.act({"action": "propose-trade", **trade})
+        await self.think()
+        await self.act({"action": "end-turn"})
+
+    def tradeFor(self, me: dict[str, Any]) -> dict[str, Any] | None:
+        others = [p for p in self.players.values() if p["id"] != self.id and not p.get("bankrupt")]
+        if not others:
+            return None
+        other = self.rng.choice(others)
+        want = [space["id"] for space in other.get("ownedSpaces", [])][:1]
+        give = {"money": min(50, me.get("money", 0))}
+        return {"playerid": other["id"], "trade": {"give": give, "want": {"properties": want}}}
+
+    async def close(self):
+        if self.ws:
+            await self.ws.close()
+        if self.reader:
+            await asyncio.gather(self.reader, return_exceptions=True)
+
+
+async def runGame(stats: Stats, args: argparse.Namespace, seed: int, until: float):
+    clients = [LoadClient(stats, args, seed * PLAYERS_PER_GAME + i) for i in range(PLAYERS_PER_GAME)]
+    bind = [None if args.no_bind else f"127.0.0.{i + 1}" for i in range(PLAYERS_PER_GAME)]
+    try:
+        host = clients[0]
+        await host.connect("/rooms/new", bind[0])
+        await asyncio.wait_for(host.waitFor(lambda: host.gameId is not None and host.id is not None), args.timeout)
+        for client, local in zip(clients[1:], bind[1:]):
+            await client.connect(f"/rooms/{host.gameId!r}", local)
+        await asyncio.wait_for(host.waitFor(lambda: len(host.players) == PLAYERS_PER_GAME), args.timeout)
+        await host.act({"action": "start-game"})
+        await asyncio.gather(*(client.play(until) for client in clients))
+    except (OSError, asyncio.TimeoutError):
+        stats.errors["connection"] += 1
+    finally:
+        await asyncio.gather(*(client.close() for client in clients if client.reader), return_exceptions=True)
+
+
+async def runLevel(games: int, args: argparse.Namespace):
+    stats = Stats()
+    start = time.time()
+    await asyncio.gather(*(runGame(stats, args, games * 1000 + i, start + args.duration) for i in range(games)))
+    elapsed = time.time() - start
+    latencies = [latency for values in stats.latencies.values() for latency in values]
+    errors = sum(stats.errors.values())
+    return {
+        "games": games,
+        "players": games * PLAYERS_PER_GAME,
+        "actions": stats.actions,
+        "actions_per_sec": stats.actions / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "p999_ms": percentile(latencies, 0.999) * 1000,
+        "error_rate": errors / max(stats.actions + errors, 1),
+        "errors": stats.errors,
+        "rejected": stats.rejected,
+        "by_action": {
+            action: {"count": len(values), "p50_ms": percentile(values, 0.5) * 1000, "p99_ms": percentile(values, 0.99) * 1000}
+            for action, values in stats.latencies.items()
+            if values
+        },
+    }
+
+
+async def waitForServer(url: str, timeout: float = 10):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            async with connect(f"{url}/rooms"):
+                return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://127.0.0.1:8765")
+    parser.add_argument("--spawn", action="store_true", help="start the server for the run, in memory and without metrics")
+    parser.add_argument("--wire", choices=("json", "msgpack"), default="json")
+    parser.add_argument("--slo-p99-ms", type=float, default=100)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--start-games", type=int, default=1)
+    parser.add_argument("--max-games", type=int, default=1024)
+    parser.add_argument("--duration", type=float, default=20, help="seconds each load level runs")
+    parser.add_argument("--think-ms", type=float, default=200, help="mean pause before each action, 0 for none")
+    parser.add_argument("--timeout", type=float, default=5, help="seconds an action may wait for its answer")
+    parser.add_argument("--buy-rate", type=float, default=0.7)
+    parser.add_argument("--auction-rate", type=float, default=0.02, help="an auction holds up the game for its 10s timer")
+    parser.add_argument("--trade-rate", type=float, default=0.05)
+    parser.add_argument("--max-bids", type=int, default=3, help="bids per player per auction")
+    parser.add_argument("--no-bind", action="store_true", help="do not bind every player of a game to its own loopback address")
+    parser.add_argument("--json", help="write every level's report here")
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        env = os.environ | {"MONOPOLY_WAL": "", "MONOPOLY_METRICS_PORT": "0"}
+        server = subprocess.Popen([sys.executable, "server"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        asyncio.run(waitForServer(args.url))
+
+    reports = []
+    best = None
+    try:
+        print(f"{'players':>7} {'actions/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} {'errors':>7} {'rejected':>8}")
+        games = args.start_games
+        while games <= args.max_games:
+            report = asyncio.run(runLevel(games, args))
+            reports.append(report)
+            print(
+                f"{report['players']:>7} {report['actions_per_sec']:>10.1f} {report['p50_ms']:>8.2f} {report['p99_ms']:>8.2f}"
+                f" {report['p999_ms']:>8.2f} {report['error_rate']:>7.2%} {report['rejected']:>8}"
+            )
+            if report["p99_ms"] > args.slo_p99_ms or report["error_rate"] > args.max_error_rate:
+                break
+            best = report
+            games *= 2
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    if best:
+        print(f"{best['players']} players ({best['games']} games) stayed within p99 {args.slo_p99_ms}ms and {args.max_error_rate:.1%} errors")
+    else:
+        print("the first level already broke the SLO")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "levels": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+memory one game holds, measured with tracemalloc over many games alive at once
+
+    python bench/memory.py --games 1000
+
+run from the repository root so ./boards resolves. every game gets 4 players, and with --turns plays that
+many turns first, which adds the frames it keeps for replays and reconnects. the allocations still alive
+are split by the source line that made them, to show where a game's memory goes.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from client import NullClient
+from game import Game
+from gameregistry import removegame
+from player import Player
+
+TOP = 10
+
+
+async def makeGame(turns: int):
+    game = Game("main")
+    for i in range(4):
+        game.addPlayer(Player(str(i), i, NullClient()))
+    game.started = True
+    game.players["0"].host = True
+    for _ in range(turns):
+        player = game.curPlayer
+        await game.handleAction({"action": "roll"}, player)
+        if player.space and player.space.purchaseable and not player.space.owner and player.money > player.space.cost:
+            await game.handleAction({"action": "buy", "spaceid": player.space.id}, player)
+        await game.handleAction({"action": "end-turn"}, player)
+    return game
+
+
+async def measure(games: int, turns: int):
+    # the first game compiles the board and imports its handlers, which every later game shares
+    warm = await makeGame(turns)
+    warm.stop()
+    removegame(warm.id)
+    gc.collect()
+
+    tracemalloc.start(1)
+    before = tracemalloc.take_snapshot()
+    live = [await makeGame(turns) for _ in range(games)]
+    await asyncio.sleep(0)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "lineno")
+    total = sum(stat.size_diff for stat in stats)
+    for game in live:
+        game.stop()
+        removegame(game.id)
+    return total, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=0, help="turns each game plays before it is measured")
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        total, stats = asyncio.run(measure(args.games, args.turns))
+
+    print(f"{args.games} games: {total / 2**20:.1f} MiB, {total / args.games / 1024:.1f} KiB per game")
+    for stat in stats[:TOP]:
+        frame = stat.traceback[0]
+        print(f"{stat.size_diff / args.games / 1024:>8.1f} KiB  {os.path.relpath(frame.filename)}:{frame.lineno}")
+
+
+if __name__ == "__main__":
+    main()
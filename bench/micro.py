@@ -0,0 +1,217 @@
+"""
+micro benchmarks for the server hot paths, fully offline
+
+    python bench/micro.py run --out before.json
+    python bench/micro.py run --out after.json
+    python bench/micro.py compare before.json after.json --threshold 0.10
+
+run from the repository root so ./boards resolves. compare looks at the fastest sample of each
+benchmark, which is the least noisy on a busy machine, and exits with 1 if any benchmark
+got slower by more than the threshold.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Awaitable, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+import actions
+from client import MemoryClient
+from game import Game
+from gameregistry import removegame
+from player import Player
+from rooms import RoomManager
+
+# each sample runs for about this long
+SAMPLE_SECONDS = 0.05
+SAMPLES = 7
+
+
+def calibrate(fn: Callable[[], Any]):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= SAMPLE_SECONDS:
+            return number
+        number *= 2
+
+
+def timeSync(fn: Callable[[], Any]):
+    number = calibrate(fn)
+    samples = []
+    for _ in range(SAMPLES):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+async def timeAsync(fn: Callable[[], Awaitable[Any]], number: int = 200):
+    samples = []
+    for _ in range(SAMPLES):
+        start = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def makeGame(players: int = 4):
+    game = Game("main")
+    for i in range(players):
+        game.addPlayer(Player(str(i), i, MemoryClient()))
+    if not players:
+        return game
+    board = game.board
+    owner = game.players["0"]
+    # a finished brown set and a few loose properties so the set queries have something to chew on
+    for space in board.spaces:
+        if space.color == "brown" or space.name in ("Boardwalk", "Reading Railroad", "Electric Company"):
+            owner.takeOwnership(space)
+    owner.sets.append("brown")
+    return game
+
+
+def syncBenchmarks(game: Game) -> dict[str, Callable[[], Any]]:
+    board = game.board
+    player = game.players["0"]
+    mover = game.players["1"]
+    brown = board.getSpaceByName("Baltic Avenue")
+    assert brown
+    property = board.getSpaceByName("Boardwalk")
+    assert property
+
+    def dirtyState():
+        player.money += 1
+        return actions.getUpdatedState(game)
+
+    return {
+        "Space.toJson": board.startSpace.toJson,
+        "Board.toJson": board.toJson,
+        "Player.toJson": player.toJson,
+        "getFullState": lambda: actions.getFullState(game),
+        "getUpdatedState": dirtyState,
+        "Board.move(7)": lambda: list(board.move(mover, 7)),
+        "Board.runevent(onpass)": lambda: list(board.runevent("onpass", property, mover)),
+        "Player.hasSet": lambda: player.hasSet("brown", 2),
+        "Player.canBuyHouse": lambda: player.canBuyHouse(brown),
+    }
+
+
+async def asyncBenchmarks(results: dict[str, list[float]]):
+    rooms = RoomManager()
+
+    async def createRoom():
+        game = rooms.create()
+        game.stop()
+        removegame(game.id)
+
+    results["RoomManager.create"] = await timeAsync(createRoom)
+
+    game = makeGame()
+    player = game.players["0"]
+    for action in ("send-player-info", "request-space", "roll"):
+        results[f"Game.handleAction({action})"] = await timeAsync(lambda: game.handleAction({"action": action}, player))
+
+    message = actions.getFullState(game)
+    for clients in (2, 8, 64, 512):
+        game = makeGame(0)
+        game.clients = [MemoryClient() for _ in range(clients)]
+
+        async def broadcast():
+            await game.broadcast(message)
+
+        async def broadcastAndDrain():
+            await game.broadcast(message)
+            while any(c.sendQueue and c.sendQueue.depth for c in game.clients):
+                await asyncio.sleep(0)
+
+        results[f"Game.broadcast({clients})"] = await timeAsync(broadcast, 50)
+        results[f"Game.broadcast+drain({clients})"] = await timeAsync(broadcastAndDrain, 50)
+        for client in game.clients:
+            client.closeQueue()
+
+
+def run(out: str | None):
+    results: dict[str, list[float]] = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        game = makeGame()
+        for name, fn in syncBenchmarks(game).items():
+            results[name] = timeSync(fn)
+        asyncio.run(asyncBenchmarks(results))
+
+    report: dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.time(),
+        },
+        "results": {
+            name: {
+                "min_ns": min(samples) * 1e9,
+                "median_ns": statistics.median(samples) * 1e9,
+                "stdev_ns": statistics.stdev(samples) * 1e9,
+            }
+            for name, samples in results.items()
+        },
+    }
+
+    width = max(map(len, results))
+    for name, r in report["results"].items():
+        print(f"{name:<{width}} {r['median_ns'] / 1000:>12.2f} us  (min {r['min_ns'] / 1000:.2f})")
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def compare(before: str, after: str, threshold: float):
+    with open(before) as f:
+        old = json.load(f)["results"]
+    with open(after) as f:
+        new = json.load(f)["results"]
+
+    regressions = 0
+    width = max(map(len, old | new))
+    for name in sorted(old.keys() & new.keys()):
+        ratio = new[name]["min_ns"] / old[name]["min_ns"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "faster"
+        print(f"{name:<{width}} {old[name]['min_ns'] / 1000:>10.2f} -> {new[name]['min_ns'] / 1000:>10.2f} us  {ratio:>6.2f}x {flag}")
+    for name in sorted(old.keys() ^ new.keys()):
+        print(f"{name:<{width}} only in {'before' if name in old else 'after'}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    runParser = sub.add_parser("run")
+    runParser.add_argument("--out", help="write the results here as json")
+    compareParser = sub.add_parser("compare")
+    compareParser.add_argument("before")
+    compareParser.add_argument("after")
+    compareParser.add_argument("--threshold", type=float, default=0.10, help="slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args.out)
+        return 0
+    return compare(args.before, args.after, args.threshold)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+how many concurrent 4 player games can one process (one core) keep under a target action latency?
+
+    python bench/rooms.py --target-ms 50
+
+run from the repository root so ./boards resolves. every game gets its own task from the
+RoomManager and four in-memory clients that take turns rolling and ending their turn.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import sys
+import time
+from typing import Any, override
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from client import MemoryClient
+from encoding import frame_t
+from player import Player
+from rooms import RoomManager
+
+
+class BenchClient(MemoryClient):
+    expecting: bytes
+    waiter: asyncio.Future[None] | None
+
+    def __init__(self):
+        super().__init__()
+        self.expecting = b""
+        self.waiter = None
+
+    @override
+    async def writeFrame(self, frame: frame_t):
+        # no need to decode every frame just to spot the response we are waiting on
+        if self.waiter and not self.waiter.done() and self.expecting in frame:
+            self.waiter.set_result(None)
+
+    async def request(self, action: dict[str, Any], expect: str):
+        self.expecting = f'"{expect}"'.encode()
+        self.waiter = asyncio.get_running_loop().create_future()
+        self.send(action)
+        await self.waiter
+
+
+async def playGame(rooms: RoomManager, rounds: int, latencies: list[float]):
+    game = rooms.create()
+    clients: dict[str, BenchClient] = {}
+    for i in range(4):
+        client = BenchClient()
+        player = Player(f"{game.id}-{i}", i, client)
+        clients[player.id] = client
+        asyncio.create_task(game.join(player))
+    await asyncio.sleep(0)
+
+    for _ in range(rounds):
+        for action, expect in (({"action": "roll"}, "roll-complete"), ({"action": "end-turn"}, "next-turn")):
+            client = clients[game.curPlayer.id]
+            start = time.perf_counter()
+            await client.request(action, expect)
+            latencies.append(time.perf_counter() - start)
+
+    for client in clients.values():
+        client.send(None)
+    await rooms.close(game.id)
+
+
+async def runLevel(games: int, rounds: int):
+    rooms = RoomManager(maxRooms=0)
+    latencies: list[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(playGame(rooms, rounds, latencies) for _ in range(games)))
+    elapsed = time.perf_counter() - start
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "games": games,
+        "actions": len(latencies),
+        "actions_per_sec": len(latencies) / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=50, help="p99 action latency budget")
+    parser.add_argument("--rounds", type=int, default=10, help="turns each game plays per level")
+    parser.add_argument("--max-games", type=int, default=4096)
+    args = parser.parse_args()
+
+    best = 0
+    games = 1
+    print(f"{'games':>6} {'actions/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    while games <= args.max_games:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = asyncio.run(runLevel(games, args.rounds))
+        print(f"{result['games']:>6} {result['actions_per_sec']:>10.0f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+        if result["p99_ms"] > args.target_ms:
+            break
+        best = games
+        games *= 2
+
+    print(f"{best} concurrent games stayed under a p99 of {args.target_ms}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+what the write-ahead log costs: actions per second through Game.handleAction with and without it,
+and how long recovering the log takes
+
+    python bench/wal.py --actions 5000
+
+run from the repository root so ./boards resolves.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from client import NullClient
+from game import Game
+from gameregistry import removegame
+from player import Player
+from wal import ActionLog, recoverGame
+
+
+def makeGame():
+    game = Game("main")
+    for i in range(4):
+        game.addPlayer(Player(str(i), i, NullClient()))
+    game.started = True
+    game.players["0"].host = True
+    return game
+
+
+async def play(game: Game, actions: int):
+    start = time.perf_counter()
+    for _ in range(actions // 2):
+        player = game.curPlayer
+        await game.handleAction({"action": "roll"}, player)
+        await game.handleAction({"action": "end-turn"}, player)
+        # Game.loop waits on its inbox between actions, which is when the log writer gets to run
+        await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+async def bench(actions: int, flushInterval: float, snapshotEvery: int):
+    plain = await play(makeGame(), actions)
+
+    directory = tempfile.mkdtemp()
+    try:
+        game = makeGame()
+        game.log = ActionLog(game, f"{directory}/{game.id}", flushInterval=flushInterval, snapshotEvery=snapshotEvery)
+        game.log.snapshot()
+        game.log.start()
+        logged = await play(game, actions)
+        log = game.log
+        await log.close()
+        removegame(game.id)
+
+        start = time.perf_counter()
+        _, recoveredLog = await recoverGame(log.directory)
+        recovery = time.perf_counter() - start
+        await recoveredLog.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "plain": actions / plain,
+        "logged": actions / logged,
+        "batches": log.batches,
+        "recovery": recovery,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--actions", type=int, default=5000)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    parser.add_argument("--snapshot-every", type=int, default=1000)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = asyncio.run(bench(args.actions, args.flush_interval, args.snapshot_every))
+
+    cost = 1 - result["logged"] / result["plain"]
+    print(f"without log  {result['plain']:>10.0f} actions/s")
+    print(f"with log     {result['logged']:>10.0f} actions/s  ({cost:.1%} slower, {result['batches']} fsync batches)")
+    print(f"recovery     {result['recovery'] * 1000:>10.1f} ms  (snapshot + up to {args.snapshot_every} actions of log)")
+
+
+if __name__ == "__main__":
+    main()
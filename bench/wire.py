@@ -0,0 +1,115 @@
+"""
+bytes per frame and encode/decode time of the json and messagepack wire formats, on frames a real game sends
+
+    python bench/wire.py --turns 200
+
+run from the repository root so ./boards resolves. the frames are grouped by their first response, and
+keys that show up in them but are missing from wire.KEYS are listed so the table can be kept up to date.
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import os
+import sys
+import time
+from typing import Any
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+import actions
+import encoding
+import wire
+from client import MemoryClient
+from encoding import WIRE_JSON, WIRE_MSGPACK
+from game import Game
+from player import Player
+
+REPEAT = 5
+
+
+async def collectFrames(turns: int) -> list[Any]:
+    """everything a client sees over `turns` turns of a 4 player game, plus a full state at the start and end"""
+    frames: list[Any] = []
+    game = Game("main", seed=1)
+    for i in range(4):
+        client = MemoryClient(frames.append)
+        player = Player(str(i), i, client)
+        player.gameid = game.id
+        game.addPlayer(player)
+    # one listener is enough, they all get the same broadcasts
+    game.clients.append(game.players["0"].client)
+    game.started = True
+    game.players["0"].host = True
+
+    frames.extend(actions.getFullState(game))
+    for _ in range(turns):
+        player = game.curPlayer
+        await game.handleAction({"action": "roll"}, player)
+        if player.space and player.space.purchaseable and not player.space.owner and player.money > player.space.cost:
+            await game.handleAction({"action": "buy", "spaceid": player.space.id}, player)
+        await game.handleAction({"action": "end-turn"}, player)
+    await asyncio.sleep(0.01)
+    frames.extend(actions.getFullState(game))
+    return frames
+
+
+def best(fn, frames: list[Any]) -> float:
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for frame in frames:
+            fn(frame)
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+
+def missingKeys(o: Any, out: collections.Counter[str]):
+    if isinstance(o, dict):
+        for k, v in o.items():
+            # player ids are data, not schema
+            if k not in wire.KEY_INDEX and not k.isdigit():
+                out[k] += 1
+            missingKeys(v, out)
+    elif isinstance(o, list):
+        for v in o:
+            missingKeys(v, out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        frames = asyncio.run(collectFrames(args.turns))
+
+    groups: dict[str, list[Any]] = collections.defaultdict(list)
+    for frame in frames:
+        first = frame[0] if isinstance(frame, list) and frame else frame
+        groups[first.get("response", "?") if isinstance(first, dict) else "?"].append(frame)
+    groups["all"] = frames
+
+    formats = [WIRE_JSON, WIRE_MSGPACK]
+    print(f"{len(frames)} frames from {args.turns} turns, json encoded with {encoding.encode.__module__}.{encoding.encode.__name__}")
+    print(f"{'response':<16} {'frames':>6} {'json B':>9} {'msgpack B':>10} {'size':>6} {'json enc':>9} {'mp enc':>9} {'json dec':>9} {'mp dec':>9}")
+    for name, group in sorted(groups.items(), key=lambda item: -len(item[1])):
+        encoded = {f: [encoding.wireEncoders[f](frame) for frame in group] for f in formats}
+        for frame, packed in zip(group, encoded[WIRE_MSGPACK]):
+            assert wire.unpack(packed) == encoding.decode(encoding.wireEncoders[WIRE_JSON](frame)), f"{name} does not round trip"
+        size = {f: sum(map(len, encoded[f])) / len(group) for f in formats}
+        enc = {f: best(encoding.wireEncoders[f], group) / len(group) * 1e6 for f in formats}
+        dec = {f: best(encoding.wireDecoders[f], encoded[f]) / len(group) * 1e6 for f in formats}
+        print(
+            f"{name:<16} {len(group):>6} {size[WIRE_JSON]:>9.0f} {size[WIRE_MSGPACK]:>10.0f} {size[WIRE_MSGPACK] / size[WIRE_JSON]:>6.0%}"
+            f" {enc[WIRE_JSON]:>7.1f}us {enc[WIRE_MSGPACK]:>7.1f}us {dec[WIRE_JSON]:>7.1f}us {dec[WIRE_MSGPACK]:>7.1f}us"
+        )
+
+    missing: collections.Counter[str] = collections.Counter()
+    missingKeys(frames, missing)
+    if missing:
+        print("keys not in wire.KEYS: " + ", ".join(f"{k} ({n})" for k, n in missing.most_common()))
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,10 @@ type _responses = {
     "game-end": Player
     "loan-proposal": Loan
     "lobby-state": LobbyState
+    "state-patch": StatePatch
+    "state-version": number
+    "seq": number
+    "session": { "token": string, "seq": number }
 }
 type ServerResponse = { response: infer A extends keyof _responses, value: _responses[A] } | { response: infer A extends keyof _responses, value: _responses[A] }[]
 
@@ -39,7 +43,7 @@ type Trade = {
     }
     sender: string
     recipient: string
-    status: "declined" | "accepted" | "proposed"
+    status: "declined" | "accepted" | "proposed" | "expired" | "invalid"
     id?: number
 
 }
@@ -51,6 +55,16 @@ export interface Auction {
     space: spaceid_t
 }
 
+export interface StatePatch {
+    base: number
+    version: number
+    spaces: Space[]
+    players: Player[]
+    playerSpaces: Record<string, Space>
+    trades: Trade[]
+    loans: Loan[]
+}
+
 export interface LobbyState {
     host: playerid_t
     started: boolean
@@ -118,7 +132,7 @@ export interface Loan {
     interestType: "simple" | "compound"
     loanee: str
     loaner: str | null
-    status: "declined" | "accepted" | "proposed"
+    status: "declined" | "accepted" | "proposed" | "settled"
     id?: string
     turnsPassed?: number
     remainingToPay?: number
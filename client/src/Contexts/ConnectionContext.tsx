@@ -7,8 +7,24 @@ interface ConnectionContext {
 
 const ConnectionContext = createContext<ConnectionContext>(undefined)
 
+//where the seat we have on the server at ip is kept, see the "session" response
+export function sessionKey(ip: string) {
+    return `session:${ip.split("?")[0]}`
+}
+
+//ip with the seat's token, and the last seq we got if we still have everything before it
+export function resumeUrl(ip: string, token: string, seq: number | null = null) {
+    let url = `${ip.split("?")[0]}?session=${encodeURIComponent(token)}`
+    return seq === null ? url : `${url}&seq=${seq}`
+}
+
 export function ConnectionProvider({ children }: { children: ReactNode }) {
-    const [ip, setIp] = useState((localStorage.getItem("cachedIp") ?? ''))
+    const [ip, setIp] = useState(() => {
+        const cached = localStorage.getItem("cachedIp") ?? ''
+        const token = cached && localStorage.getItem(sessionKey(cached))
+        //a reloaded page has none of the state, so it only takes its seat back and gets the full state
+        return token ? resumeUrl(cached, token) : cached
+    })
 
     const contextValue = {
         ip,
@@ -1,5 +1,5 @@
 import { useState, useEffect, useRef, useContext } from "react"
-import {  Space, Player, ServerResponse, Trade, Auction, playerid_t, spaceid_t, Loan } from "../../index"
+import {  Space, Player, ServerResponse, Trade, Auction, playerid_t, spaceid_t, Loan, StatePatch } from "../../index"
 import PlayerCard from "./PlayerCard"
 import useWebSocket, { ReadyState } from "react-use-websocket/dist"
 import GameBoard from "./board"
@@ -7,16 +7,28 @@ import Alert from "./alert"
 import TradeMenu from "./TradeMenu"
 import MonopolyContext from "../../src/Contexts/MonopolyContext"
 import AuctionMenu from "./Auction"
-import ConnectionContext from "../../src/Contexts/ConnectionContext"
+import ConnectionContext, { resumeUrl, sessionKey } from "../../src/Contexts/ConnectionContext"
 import LoanMenu from "./LoanMenu"
 import LoanPaymentMenu from "./LoanPaymentMenu"
 import LoanList from "./LoanList"
 import Lobby from "./Lobby"
 
+function replaceById<T extends { id?: any }>(list: T[], updates: T[]) {
+    const byId = new Map(updates.map(u => [u.id, u]))
+    const merged = list.map(item => byId.get(item.id) ?? item)
+    for (const u of updates) {
+        if (!list.some(item => item.id === u.id)) merged.push(u)
+    }
+    return merged
+}
+
 const tradeStatuses = {
     declined: "❌",
     accepted: "✅",
-    proposed: "🕕"
+    proposed: "🕕",
+    expired: "⌛",
+    invalid: "🚫",
+    settled: "💰"
 }
 
 function Monopoly({ playerDetails }: any) {
@@ -32,7 +44,7 @@ function Monopoly({ playerDetails }: any) {
     const [currentTrade, setCurrentTrade] = useState<Trade | null>(null)
     const [auction, setAuction] = useState<Auction | null>(null)
 
-    const { ip } = useContext(ConnectionContext)
+    const { ip, setIp } = useContext(ConnectionContext)
     const { board, player, players, setBoard, setPlayers, playerLoaded, setPlayer, lobbyState, setLobbyState } = useContext(MonopolyContext)
     const activePlayers = players.filter(p => !p.bankrupt)
 
@@ -55,6 +67,12 @@ function Monopoly({ playerDetails }: any) {
     const [trades, setTrades] = useState<Trade[]>([])
     const [loans, setLoans] = useState<Loan[]>([])
     const [loan, setLoan] = useState<Loan | null>(null)
+    //the state version we have, patches only apply on top of it
+    const stateVersion = useRef<number | null>(null)
+    const resyncPending = useRef(false)
+    //our seat's token and the last frame we got, a dropped connection resumes from there
+    const session = useRef<string | null>(null)
+    const lastSeq = useRef<number | null>(null)
 
     const { sendJsonMessage, lastJsonMessage, readyState, } = useWebSocket(ip, {
         share: true
@@ -126,6 +144,19 @@ function Monopoly({ playerDetails }: any) {
         setAQ(currentQueue => currentQueue.concat([text]))
     }
 
+    function applyPatch(patch: StatePatch) {
+        setBoard(b => ({ ...b, spaces: replaceById(b.spaces, patch.spaces), playerSpaces: { ...b.playerSpaces, ...patch.playerSpaces } }))
+        setPlayers(ps => replaceById(ps, patch.players))
+        setTrades(ts => replaceById(ts, patch.trades))
+        setLoans(ls => replaceById(ls, patch.loans))
+        for (let p of patch.players) {
+            if (playerLoaded && p.id === player.id) {
+                setPlayer(p)
+                if (patch.playerSpaces[p.id]) setCurrentSpace(patch.playerSpaces[p.id])
+            }
+        }
+    }
+
     function loanMenuClose() {
         setShowLoanMenu(false)
         if (loan) setLoan(null)
@@ -152,6 +183,10 @@ function Monopoly({ playerDetails }: any) {
         if (readyState === ReadyState.OPEN) {
             sendJsonMessage({ "action": "set-details", "details": playerDetails })
         }
+        //every component shares the socket for ip, so a new ip reconnects all of them
+        if (readyState === ReadyState.CLOSED && session.current !== null) {
+            setIp(resumeUrl(ip, session.current, lastSeq.current))
+        }
     }, [readyState])
 
     function endTurn() {
@@ -202,6 +237,30 @@ function Monopoly({ playerDetails }: any) {
                 case "lobby-state":
                     setLobbyState(message.value)
                     break
+                case "session":
+                    session.current = message.value.token
+                    lastSeq.current = message.value.seq
+                    localStorage.setItem(sessionKey(ip), message.value.token)
+                    break
+                case "seq":
+                    lastSeq.current = message.value
+                    break
+                case "state-version":
+                    stateVersion.current = message.value
+                    resyncPending.current = false
+                    break
+                case "state-patch": {
+                    const patch = message.value as StatePatch
+                    if (resyncPending.current) break
+                    if (stateVersion.current !== patch.base) {
+                        resyncPending.current = true
+                        sendJsonMessage({ "action": "resync" })
+                        break
+                    }
+                    stateVersion.current = patch.version
+                    applyPatch(patch)
+                    break
+                }
                 case "trade-list":
                     setTrades(message.value)
                     break
@@ -20,14 +20,10 @@ export default function usePlayer() {
     useEffect(() => {
         const message = lastJsonMessage as ServerResponse
         if (!message) return
-        if (Array.isArray(message)) {
-            if (message[0].response === "player-info") {
-                setPlayer(message[0].value)
-                setPlayerLoaded(true)
-            }
-        } else {
-            if (message.response === "player-info") {
-                setPlayer(message.value)
+        // the server batches what an action sends into one frame, player-info can be anywhere in it
+        for (const m of Array.isArray(message) ? message : [message]) {
+            if (m.response === "player-info") {
+                setPlayer(m.value)
                 setPlayerLoaded(true)
             }
         }
@@ -1,14 +1,22 @@
 import asyncio
 import json
+import os
 import sys
 
 from typing import Any, Callable
+from urllib.parse import parse_qs, urlsplit
 from websockets.asyncio.server import ServerConnection, serve
 
 
 from player import Player
 from client import WSClient, TermClient
+from encoding import WIRE_JSON, WIRE_MSGPACK
 from game import Game
+from rooms import RoomLimitError, RoomManager
+from gameregistry import getgame, listgames
+from metrics import metrics, serveMetrics
+from timers import timers
+# (game id, remote ip) -> player
 ipConnections: dict[Any, Player] = {}
 
 
@@ -34,25 +42,101 @@ class Lobby:
 
 
 
-game = Game("main")
+# MONOPOLY_WAL=<dir> logs every game under dir so a restart brings them back, unset keeps games in memory only
+# MONOPOLY_WAL_KEEP=1 keeps whole games around for server/replay.py
+rooms = RoomManager(
+    walDir=os.environ.get("MONOPOLY_WAL") or None,
+    keepHistory=os.environ.get("MONOPOLY_WAL_KEEP") == "1",
+)
 lobby = Lobby()
 
 async def gameServer(ws: ServerConnection):
-    c = WSClient(ws)
-
-    if ws.remote_address[0] in ipConnections:
-        player = ipConnections[ws.remote_address[0]]
-        game.disconnectClient(player.client)
-        player.client = c
-        await player.client.write({"response": "reconnect", "value": {"name": player.name, "piece": player.piece}})
-        await game.rejoin(player)
+    path = ws.request.path if ws.request else "/"
+    # ?wire=msgpack asks for binary frames, anything else gets json
+    query = parse_qs(urlsplit(path).query)
+    c = WSClient(ws, WIRE_MSGPACK if query.get("wire") == [WIRE_MSGPACK] else WIRE_JSON)
+    await c.hello()
+
+    if urlsplit(path).path == "/rooms":
+        await c.write({"response": "room-list", "value": rooms.list()})
+        return
+
+    # /rooms/<id>/watch follows a game without taking a seat
+    parts = urlsplit(path).path.strip("/").split("/")
+    if len(parts) == 3 and parts[0] == "rooms" and parts[2] == "watch":
+        watched = rooms.route(f"/rooms/{parts[1]}") if parts[1] != "new" else None
+        if not watched:
+            await c.write({"response": "error", "value": f"no game at {path}"})
+            return
+        try:
+            await watched.spectators.watch(c)
+        finally:
+            rooms.release(watched)
+        return
+
+    try:
+        game = rooms.route(path, ws.remote_address[0])
+    except RoomLimitError as e:
+        await c.write({"response": "error", "value": str(e)})
+        return
+    if not game:
+        await c.write({"response": "error", "value": f"no game at {path}"})
+        return
+    try:
+        await play(ws, c, game, query)
+    finally:
+        # the connection is gone, a game left with nobody in it is closed after a while
+        game.disconnectClient(c)
+        rooms.release(game)
+
+
+async def play(ws: ServerConnection, c: WSClient, game: Game, query: dict[str, list[str]]):
+    # seats of closed games
+    for stale in [k for k in ipConnections if not getgame(k[0])]:
+        del ipConnections[stale]
+    # ?session=<token>&seq=<last seq seen> resumes a seat, clients without a token get theirs back by address
+    key = (game.id, ws.remote_address[0])
+    resumed = game.sessions.get(query.get("session", [""])[0])
+    player = resumed or ipConnections.get(key)
+    if player:
+        seq = query.get("seq", [""])[0]
+        await c.write({"response": "reconnect", "value": {"name": player.name, "piece": player.piece}})
+        # only a client that kept its token can be trusted to know what it saw
+        await game.rejoin(player, int(seq) if resumed and seq.isdigit() else None, c)
     else:
-        player = Player(str(ws.id), len(game.clients), c)
+        player = Player(str(ws.id), len(game.players), c)
+        player.address = ws.remote_address[0]
         lobby.join(player)
-        await lobby.moveToGame(player, game, onjoin=lambda: ipConnections.__setitem__(ws.remote_address[0], player))
+        await lobby.moveToGame(player, game, onjoin=lambda: ipConnections.__setitem__(key, player))
         
 
+def registerGauges():
+    metrics.gauge("monopoly_active_games", "games in the registry", lambda: len(listgames()))
+    metrics.gauge("monopoly_connected_clients", "clients across all games", lambda: sum(len(g.clients) for g in listgames()))
+    metrics.gauge("monopoly_active_auctions", "games with an auction running", lambda: sum(g.activeAuction is not None for g in listgames()))
+    metrics.gauge(
+        "monopoly_outstanding_loans", "loans that are proposed or not paid back",
+        lambda: sum(len(g.ledger.loans) for g in listgames()),
+    )
+    metrics.gauge("monopoly_outstanding_trades", "trades waiting on an answer", lambda: sum(len(g.tradebook.trades) for g in listgames()))
+    metrics.gauge("monopoly_spectators", "read-only connections across all games", lambda: sum(len(g.spectators) for g in listgames()))
+    metrics.gauge("monopoly_pending_timers", "auction and turn deadlines waiting to fire", lambda: len(timers))
+    metrics.gauge(
+        "monopoly_send_queue_depth", "frames waiting in client send queues",
+        lambda: sum(c.sendQueue.depth for g in listgames() for c in g.clients if c.sendQueue),
+    )
+
+
 async def main():
+    for recovered in await rooms.recover():
+        for player in recovered.players.values():
+            if player.address:
+                ipConnections[(recovered.id, player.address)] = player
+    game = rooms.default or rooms.create()
+    # MONOPOLY_METRICS_PORT=0 turns the endpoint off
+    if port := int(os.environ.get("MONOPOLY_METRICS_PORT", "9100")):
+        registerGauges()
+        await serveMetrics(os.environ.get("MONOPOLY_METRICS_HOST", "127.0.0.1"), port)
     if len(sys.argv) > 1 and sys.argv[1] == "t":
         c = TermClient()
         player = Player("1", len(game.clients), c)
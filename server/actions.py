@@ -1,7 +1,7 @@
-from typing import TYPE_CHECKING
-import asyncio
+from typing import TYPE_CHECKING, Any
 from status import BANKRUPT
 from trade import Trade
+from tradebook import checkTrade
 
 from loan import Loan
 
@@ -9,7 +9,7 @@ if TYPE_CHECKING:
     from game import Game
     from player import Player
 
-def getUpdatedState(game: "Game"):
+def getFullState(game: "Game"):
     return [
         {"response": "next-turn", "value": game.curPlayer.toJson()},
         {"response": "board", "value": game.board.toJson()},
@@ -17,15 +17,98 @@ def getUpdatedState(game: "Game"):
             "response": "player-list",
             "value": [player.toJson() for player in game.players.values()],
         },
-        {"response": "trade-list", "value": [trade.toJson() for trade in game.trades]},
-        {"response": "loan-list", "value": [loan.toJson() for loan in game.loans]},
-        {"response": "lobby-state", "value": game.toJson()}
+        {"response": "trade-list", "value": [trade.toJson() for trade in game.tradebook.trades.values()]},
+        {"response": "loan-list", "value": [loan.toJson() for loan in game.ledger.loans.values()]},
+        {"response": "lobby-state", "value": game.toJson()},
+        {"response": "state-version", "value": game.version},
     ]
 
 
+def getStatePatch(game: "Game") -> dict[str, Any] | None:
+    """
+    serializes only the spaces, players, trades and loans that changed since the last patch,
+    returns None if nothing did. a client applies the patch on top of version `base`
+    and asks for a resync if that is not the version it has
+    """
+    # drained even when nobody is listening, or it would only ever grow
+    closedLoans = game.ledger.takeClosed()
+    closedTrades = game.tradebook.takeClosed()
+    spaces = {space: None for space in game.board.spaces if space.dirty}
+    players = {player: None for player in game.players.values() if player.dirty}
+    trades = [trade for trade in game.tradebook.trades.values() if trade.dirty] + closedTrades
+    loans = [loan for loan in game.ledger.loans.values() if loan.dirty] + closedLoans
+    if not (spaces or players or trades or loans):
+        return None
+
+    # a player's json has its owned spaces and loans in it,
+    # and a space's json has the players standing on it
+    for space in list(spaces):
+        if space.owner:
+            players[space.owner] = None
+    for loan in loans:
+        players[loan.loanee] = None
+    # and playerSpaces has the space each player stands on, stale if that space changed
+    playerSpaces = game.board.playerSpaces
+    for id, space in playerSpaces.items():
+        if space in spaces and id in game.players:
+            players[game.players[id]] = None
+    for player in players:
+        if player.space:
+            spaces[player.space] = None
+
+    for entity in (*spaces, *players, *trades, *loans):
+        entity.markClean()
+
+    game.version += 1
+    return {
+        "response": "state-patch",
+        "value": {
+            "base": game.version - 1,
+            "version": game.version,
+            "spaces": [space.toJson() for space in spaces],
+            "players": [player.toJson() for player in players],
+            "playerSpaces": {player.id: playerSpaces[player.id].toJson() for player in players if player.id in playerSpaces},
+            "trades": [trade.toJson() for trade in trades],
+            "loans": [loan.toJson() for loan in loans],
+        },
+    }
+
+
+def getUpdatedState(game: "Game"):
+    state: list[dict[str, Any]] = [{"response": "next-turn", "value": game.curPlayer.toJson()}]
+    if patch := getStatePatch(game):
+        state.append(patch)
+    state.append({"response": "lobby-state", "value": game.toJson()})
+    return state
+
+
+def getTurnEnded(game: "Game", prevPlayer: "Player"):
+    return [
+        {"response": "turn-ended", "value": prevPlayer.toJson()},
+        {"response": "next-turn", "value": game.curPlayer.toJson()},
+    ]
+
+
+def resync(game: "Game", action, player: "Player"):
+    yield False, getFullState(game)
+
+
+def requestBoardAnalysis(game: "Game", action, player: "Player"):
+    try:
+        import markov
+    except ImportError:
+        yield False, {"response": "notification", "value": "board analysis needs numpy on the server"}
+        return
+    analysis = markov.analyzeBoard(game.board.boardName, game.boards_path, game.dSides)
+    yield False, {"response": "board-analysis", "value": analysis}
+
+
 def endTurn(game: "Game", action, player: "Player"):
     if game.activeAuction:
         return
+    if player is not game.curPlayer:
+        yield False, {"response": "notification", "value": "It is not your turn"}
+        return
     if game.curPlayer.bankrupt:
         yield False, {
             "response": "notification",
@@ -35,10 +118,7 @@ def endTurn(game: "Game", action, player: "Player"):
     prevPlayer = game.curPlayer
     
     game.advanceTurn()
-    yield True, [
-        {"response": "turn-ended", "value": prevPlayer.toJson()},
-        {"response": "next-turn", "value": game.curPlayer.toJson()},
-    ]
+    yield True, game.turnEnded(prevPlayer)
 
 
 def sendPlayerInfo(game: "Game", action, player: "Player"):
@@ -52,7 +132,7 @@ def payBail(game: "Game", action, player: "Player"):
     assert player.space, f"{player} is not on a space"
     player.payBail(player.space)
     yield True, {"response": "notification", "value": f"{player.name} paid bail"}
-    yield True, getUpdatedState(game)
+    yield True, game.updatedState()
 
 
 def setBail(game: "Game", action, player: "Player"):
@@ -67,8 +147,8 @@ def setBail(game: "Game", action, player: "Player"):
     elif not isinstance(amount, int):
         yield False, {"response": "error", "value": f"{amount} is not an integer"}
     else:
-        space.attrs["bailcost"] = amount
-        yield True, getUpdatedState(game)
+        space.setAttr("bailcost", amount)
+        yield True, game.updatedState()
 
 
 def connect(game: "Game", action, player: "Player"):
@@ -86,6 +166,26 @@ def connect(game: "Game", action, player: "Player"):
     if game.activeAuction is not None:
         yield True, ({"response": "auction-status", "value": game.activeAuction})
         
+def addBot(game: "Game", action, player: "Player"):
+    # bots import the game, so they can only be imported once it is
+    from bots import DEFAULT_STRATEGY, MAX_SEATS, addBot, policies
+    strategy = action.get("strategy", DEFAULT_STRATEGY)
+    if game.started:
+        yield False, {"response": "notification", "value": "Bots can only join before the game starts"}
+        return
+    if game.host != player.id:
+        yield False, {"response": "notification", "value": "Only the host can add bots"}
+        return
+    if len(game.activePlayers) >= MAX_SEATS:
+        yield False, {"response": "notification", "value": f"The game is full, it seats {MAX_SEATS}"}
+        return
+    if strategy not in policies:
+        yield False, {"response": "notification", "value": f"There is no {strategy} bot"}
+        return
+    # the bot joins like a connection does, which sends everyone the new player
+    addBot(game, strategy)
+
+
 def startGame(game: "Game", action, player: "Player"):
 
     if len(game.activePlayers) > 1:
@@ -106,7 +206,7 @@ def teleport(game, action, player: "Player"):
         for status in game.board.moveTo(game.players[playerId], space):
             yield status.broadcast, status
         yield True, {"response": "board", "value": game.board.toJson()}
-        yield True, getUpdatedState(game)
+        yield True, game.updatedState()
 
 
 def roll(game: "Game", action, player: "Player"):
@@ -115,7 +215,7 @@ def roll(game: "Game", action, player: "Player"):
     for status in game.board.rollPlayer(player, game.dSides):
         yield status.broadcast, status
     yield False, {"response": "roll-complete", "value": None}
-    yield True, getUpdatedState(game)
+    yield True, game.updatedState()
 
 
 def setDetails(game: "Game", action, player: "Player"):
@@ -138,11 +238,13 @@ def bankrupt(game: "Game", action, player: "Player"):
 
     if len(game.activePlayers) < 2:
         yield True, {"response": "game-end", "value": game.activePlayers[0].toJson()}
+        if game.onFinish:
+            game.onFinish()
 
     if game.curTurn >= len(game.activePlayers):
         game.curTurn = 0
 
-    yield True, getUpdatedState(game)
+    yield True, game.updatedState()
 
 
 def setMoney(game: "Game", action, player: "Player"):
@@ -157,7 +259,7 @@ def buy(game: "Game", action, player: "Player"):
     property = game.board.spaces[action["spaceid"]]
     result = player.buy(property)
     yield True, result
-    yield True, getUpdatedState(game)
+    yield True, game.updatedState()
 
 
 def startAuction(game: "Game", action, player: "Player"):
@@ -166,7 +268,7 @@ def startAuction(game: "Game", action, player: "Player"):
     game.createAuction(space.id, end_time=10000)
 
     yield True, {"response": "auction-status", "value": game.activeAuction}
-    asyncio.create_task(game.auctionTimer())
+    game.startAuctionTimer()
 
 
 def bid(game: "Game", action, player: "Player"):
@@ -189,55 +291,68 @@ def buyHouse(game: "Game", action, player: "Player"):
     property = game.board.spaces[action["spaceid"]]
     result = player.buyHouse(property)
     yield True, result
-    yield True, getUpdatedState(game)
+    yield True, game.updatedState()
 
 
 def buyHotel(game: "Game", action, player: "Player"):
     property = game.board.spaces[action["spaceid"]]
     result = player.buyHotel(property)
     yield True, result
-    yield True, getUpdatedState(game)
+    yield True, game.updatedState()
 
 
 def sellHouse(game: "Game", action, player: "Player"):
     property = game.board.spaces[action["spaceid"]]
     result = player.sellHouse(property)
     yield True, result
-    yield True, getUpdatedState(game)
+    yield True, game.updatedState()
 
 
 # trade obj should look like
 # {"want": {"properties": ["id 1", "id2", "id3"], "money": 432483}, "give": {"money": 3432}}
 def proposeTrade(game: "Game", action, player: "Player"):
-    trade = Trade(action["trade"], player.id, action["playerid"], "proposed")
-    p = game.players.get(trade.recipient)
-    game.trades.append(trade)
-    if not p:
-        yield False, {"response": "notification", "value": "invalid player id"}
-    else:
-        yield p.client, (
-            {
-                "response": "trade-proposal",
-                "value": trade.toJson(),
-            }
-        )
-        yield True, getUpdatedState(game)
+    if error := checkTrade(game.board, game.players, player.id, action["playerid"], action["trade"]):
+        yield False, {"response": "notification", "value": error}
+        return
+    trade = Trade(action["trade"], player.id, action["playerid"], "proposed", game.rng.random())
+    game.tradebook.propose(trade)
+    p = game.players[trade.recipient]
+    yield p.client, (
+        {
+            "response": "trade-proposal",
+            "value": trade.toJson(),
+        }
+    )
+    yield True, game.updatedState()
 
 
 def acceptTrade(game: "Game", action, player: "Player"):
-    trade = next(trade for trade in game.trades if trade.id == action["id"])
-    trade.status = "accepted"
-    otherPlayer = game.players.get(trade.sender)
-    if otherPlayer:
-        # we do otherPlayer.trade(player) because otherPlayer is the player who initialized the trade in the first place
-        otherPlayer.trade(game.board, player, trade)
-    yield True, getUpdatedState(game)
+    trade = game.tradebook.get(action["id"])
+    if not trade or trade.recipient != player.id:
+        yield False, {"response": "notification", "value": "That trade is not on offer"}
+        return
+    # things may have changed hands since it was proposed
+    if error := checkTrade(game.board, game.players, trade.sender, trade.recipient, trade.trade):
+        game.tradebook.close(trade, "invalid")
+        yield False, {"response": "notification", "value": error}
+        yield True, game.updatedState()
+        return
+    otherPlayer = game.players[trade.sender]
+    # we do otherPlayer.trade(player) because otherPlayer is the player who initialized the trade in the first place
+    otherPlayer.trade(game.board, player, trade)
+    game.tradebook.close(trade, "accepted")
+    game.tradebook.dropInvalid(game.board, game.players, (trade.sender, trade.recipient))
+    yield True, game.updatedState()
 
 
 def declineTrade(game: "Game", action, player: "Player"):
-    trade = next(trade for trade in game.trades if trade.id == action["id"])
-    trade.status = "declined"
-    yield True, getUpdatedState(game)
+    trade = game.tradebook.get(action["id"])
+    # the sender can take it back too
+    if not trade or player.id not in (trade.sender, trade.recipient):
+        yield False, {"response": "notification", "value": "That trade is not on offer"}
+        return
+    game.tradebook.close(trade, "declined")
+    yield True, game.updatedState()
    
 
 
@@ -245,14 +360,14 @@ def mortgage(game: "Game", action, player: "Player"):
     space = game.board.getSpaceById(action["spaceid"])
     assert space, f"Space@:{action["spaceid"]} does not exist"
     yield True, player.mortgage(space)
-    yield True, getUpdatedState(game)
+    yield True, game.updatedState()
 
 
 def unmortgage(game: "Game", action, player: "Player"):
     space = game.board.getSpaceById(action["spaceid"])
     assert space, f"Space@:{action["spaceid"]} does not exist"
     yield True, player.unmortgage(space)
-    yield True, getUpdatedState(game)
+    yield True, game.updatedState()
 
 
 def loan(game: "Game", action, player: "Player"):
@@ -282,11 +397,12 @@ def loan(game: "Game", action, player: "Player"):
             loan["amountPerTurn"],
             deadline,
         )
-        game.loans.append(loan)
+        game.ledger.add(loan)
         player.loans.append(loan)
         player.money += loan.amount
+        game.ledger.accept(loan)
         yield True, {"response": "accepted-loan", "value": loan.toJson()}
-        yield True, getUpdatedState(game)
+        yield True, game.updatedState()
         return
 
     loanee = game.players.get(action["loan"]["loaner"])
@@ -304,35 +420,40 @@ def loan(game: "Game", action, player: "Player"):
         loan["deadline"],
     )
     action["loan"]["id"] = loan.id
-    game.loans.append(loan)
+    game.ledger.add(loan)
     
     yield loanee.client, ({"response": "loan-proposal", "value": loan.toJson()})
-    yield True, getUpdatedState(game)
+    yield True, game.updatedState()
 
 
 def acceptLoan(game: "Game", action, player: "Player"):
-    loanId = action["loan"]
-    loan: Loan = next(loan for loan in game.loans if loan.id == loanId)
-    loan.status = "accepted"
+    loan = game.ledger.get(action["loan"])
+    if not loan or loan.status != "proposed":
+        yield False, {"response": "notification", "value": "That loan is not on offer"}
+        return
     if loan.loaner:
         loaner = game.players.get(loan.loaner.id)
         assert loaner, f"Player@:{action["loan"]["loaner"]} does not exist"
         loaner.loanPlayer(loan.loanee, loan)
+    game.ledger.accept(loan)
     yield True, {"response": "accepted-loan", "value": loan.toJson()}
-    yield True, getUpdatedState(game)
+    yield True, game.updatedState()
 
 
 def declineLoan(game: "Game", action, player: "Player"):
-    loanId = action["loan"]
-    loan = next(loan for loan in game.loans if loan.id == loanId)
-    loan.status = "declined"
-    yield True, getUpdatedState(game)
+    loan = game.ledger.get(action["loan"])
+    if not loan or loan.status != "proposed":
+        yield False, {"response": "notification", "value": "That loan is not on offer"}
+        return
+    game.ledger.close(loan, "declined")
+    yield True, game.updatedState()
     
 def payLoan(game: "Game", action, player: "Player"):
-    loanId = action["loan"]
     amount = action["amount"]
-    loan: Loan = next(loan for loan in game.loans if loan.id == loanId)
+    loan = game.ledger.get(action["loan"])
+    if not loan or loan.status != "accepted":
+        yield False, {"response": "notification", "value": "There is nothing owed on that loan"}
+        return
     player.payLoan(loan, amount)
     if loan.totalOwed <= 0:
-        player.loans.remove(loan)
-        player.increaseCreditScore(loan.amount)
+        game.ledger.settleIfPaid(loan)
@@ -1,17 +1,27 @@
-from collections.abc import Generator
+# Space.__init__ fills its slots with object.__setattr__, past Tracked, which the checker cannot follow
+# pyright: reportUninitializedInstanceVariable=false
+from collections.abc import Generator, Mapping
+from dataclasses import dataclass, field
+from operator import attrgetter
 import re
-from types import ModuleType
+from types import MappingProxyType, ModuleType
 from typing import Any, Callable, Self, TYPE_CHECKING
 import random
 
 from monopolytypes import *
 from status import *
+from tracking import Tracked
 
 if TYPE_CHECKING:
+    from boardbuilder import BoardTemplate
+    from ledger import Ledger
     from player import Player
 
 type statusreturn_t = status_t
 
+# what runevent calls for one (event, space) pair: the method of the space's class, then the handler
+type eventchain_t = tuple[Callable[..., Any] | None, Callable[..., Any] | None]
+
 type spacetype_t = int
 
 ST_PROPERTY: spacetype_t = 0
@@ -45,71 +55,101 @@ def str2spacetype(str: str):
     }[str.lower()]
 
 
-class SpaceAttr:
+# what a property charges by building level: no houses, 1 to 4 houses, a hotel
+RENT_LEVELS = ("rent", "house1", "house2", "house3", "house4", "hotel")
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class SpaceRules:
+    """
+    what a space is, as its board file defines it. one is shared by that space in every game built from the
+    same file, so nothing in it changes; a game that changes a space's attrs gets a copy of its own (see Space.attrs)
+    """
+
+    spaceType: spacetype_t
+    cost: int
     name: str
-    default_factory: Callable[[], Any]
+    purchaseable: bool
+    # never changed in place, a space hands it out read-only
+    attrs: dict[str, Any]
+    color: str = field(init=False)
+    set_size: int = field(init=False)
+    house_cost: int = field(init=False)
+    hotel_cost: int = field(init=False)
+    # rent by building level (see RENT_LEVELS), empty for anything that is not a property
+    rents: tuple[int, ...] = field(init=False)
 
-    def __init__(self, default_factory: Callable[[], Any]):
-        self.name = ""
-        self.default_factory = default_factory
+    def __post_init__(self):
+        attrs = self.attrs
+        object.__setattr__(self, "color", attrs.get("color", ""))
+        object.__setattr__(self, "set_size", attrs.get("set_size", 0))
+        object.__setattr__(self, "house_cost", attrs.get("house_cost", 0))
+        object.__setattr__(self, "hotel_cost", attrs.get("hotel_cost", 0))
+        object.__setattr__(self, "rents", tuple(attrs.get(k, 0) for k in RENT_LEVELS) if self.spaceType == ST_PROPERTY else ())
 
-    def __set_name__(self, owner, name: str):
-        self.name = name
+    def withAttrs(self, attrs: Mapping[str, Any]):
+        return SpaceRules(self.spaceType, self.cost, self.name, self.purchaseable, dict(attrs))
 
-    def __get__(self, obj: "Space", objtype=None):
-        if self.name in obj.attrs:
-            return obj.attrs[self.name]
-        else:
-            return self.default_factory()
 
+def rule(name: str) -> Any:
+    """a field of the space's SpaceRules, read-only on the space"""
+    return property(attrgetter(f"rules.{name}"))
 
-class Space:
-    spaceType: spacetype_t
+
+class Space(Tracked):
+    # what a game changes, the rest is in rules
+    __slots__ = ("rules", "next", "prev", "players", "owner", "id", "houses", "hotel", "mortgaged", "gameId", "_dirty")
+
+    rules: SpaceRules
     next: "Space | None"
     prev: "Space | None"
     players: list["Player"]
-    cost: int
-    name: str
     owner: "Player | None"
-    attrs: dict[str, Any]
     id: int
-    house_cost: SpaceAttr = SpaceAttr(int)
-    hotel_cost: SpaceAttr = SpaceAttr(int)
-    purchaseable: bool
     houses: int
     hotel: bool
-    color: SpaceAttr = SpaceAttr(str)
-    set_size: SpaceAttr = SpaceAttr(int)
     mortgaged: bool
 
     gameId: float
 
-    def __init__(
-        self,
-        gameid: float,
-        spaceType: spacetype_t,
-        cost: int,
-        name: str,
-        purchaseable: bool,
-        **kwargs,
-    ):
-        self.spaceType = spaceType
-        self.players = []
-        self.cost = cost
-        self.name = name
-        self.next = None
-        self.prev = None
-        self.mortgaged = False
-        self.attrs = kwargs
-        self.owner = None
-        self.id = random.randint(1, 10000)
-
-        self.gameId = gameid
-
-        self.purchaseable = purchaseable
-
-        self.houses = 0
-        self.hotel = False
+    spaceType: spacetype_t = rule("spaceType")
+    cost: int = rule("cost")
+    name: str = rule("name")
+    purchaseable: bool = rule("purchaseable")
+    color: str = rule("color")
+    set_size: int = rule("set_size")
+    house_cost: int = rule("house_cost")
+    hotel_cost: int = rule("hotel_cost")
+
+    def __init__(self, gameid: float, rules: SpaceRules):
+        # a new space is dirty already, its fields skip Tracked.__setattr__ since boards can have many thousands
+        init = object.__setattr__
+        init(self, "_dirty", True)
+        init(self, "rules", rules)
+        init(self, "players", [])
+        init(self, "next", None)
+        init(self, "prev", None)
+        init(self, "mortgaged", False)
+        init(self, "owner", None)
+        # the board gives every space its index as its id
+        init(self, "id", 0)
+
+        init(self, "gameId", gameid)
+
+        init(self, "houses", 0)
+        init(self, "hotel", False)
+
+    @property
+    def attrs(self) -> Mapping[str, Any]:
+        return MappingProxyType(self.rules.attrs)
+
+    @attrs.setter
+    def attrs(self, attrs: Mapping[str, Any]):
+        if attrs != self.rules.attrs:
+            self.rules = self.rules.withAttrs(attrs)
+
+    def setAttr(self, name: str, value: Any):
+        self.attrs = {**self.rules.attrs, name: value}
 
     def __next__(self):
         if self.next == None:
@@ -122,34 +162,29 @@ class Space:
     def calculatePropertyRent(self, set: bool):
         if self.spaceType != ST_PROPERTY or self.mortgaged is True:
             return 0
-        if not self.hotel:
-            match self.houses:
-                case 0:
-                    if set:
-                        return self.attrs["rent"] * 2
-                    return self.attrs["rent"]
-                case n:
-                    return self.attrs[f"house{n}"]
-        return self.attrs["hotel"]
-
+        rents = self.rules.rents
+        if self.hotel:
+            return rents[5]
+        if self.houses == 0 and set:
+            return rents[0] * 2
+        return rents[self.houses]
+
+    # prints this space and the ones after it, up to stopat, the end of the list or back around to this one
     def print(self, stopat: "Space | None"=None):
-        if self.next is stopat or not self.next:
-            return
-        self.next.print(self)
+        for space in self.iterSpaces():
+            if space is stopat:
+                break
+            print(space)
 
+    # the space before this one around the board, or the end of the list if it is not a loop
     def getLast(self):
-        if self.next is None:
-            return self
-        return self.next.getLast()
+        cur = self
+        while cur.next is not None and cur.next is not self:
+            cur = cur.next
+        return cur
 
     def isloop(self):
-        start = self
-        cur = self
-        while cur := next(cur):
-            if cur is start:
-                return True
-            if cur is None:
-                return False
+        return self.getLast().next is self
 
     def isUnowned(self):
         if self.owner is None:
@@ -157,14 +192,7 @@ class Space:
         return False
 
     def copy(self, withId: space_t | bool=False):
-        space = Space(
-            self.gameId,
-            self.spaceType,
-            cost=self.cost,
-            name=self.name,
-            purchaseable=self.purchaseable,
-            **self.attrs,
-        )
+        space = Space(self.gameId, self.rules)
         if withId:
             space.id = self.id
         return space
@@ -184,15 +212,18 @@ class Space:
 
     def put(self, player: "Player"):
         self.players.append(player)
+        self.markDirty()
         player.space = self
 
     def onland(self, player: "Player") -> Generator[statusreturn_t]:
         self.players.append(player)
+        self.markDirty()
         player.space = self
         yield NONE()
 
     def onleave(self, player: "Player"):
         self.players.remove(player)
+        self.markDirty()
         yield NONE()
 
     def onpass(self, player: "Player") -> Generator[statusreturn_t]:
@@ -203,39 +234,29 @@ class Space:
         # which is the opposite of what we want
         cur = self
         yield self
-        while (cur := next(cur)) is not self:
+        while (cur := cur.next) is not None and cur is not self:
             yield cur
 
     def toJson(self):
-        dict = {}
-        dict["attrs"] = self.attrs
-        for key in self.__dict__:
-            if not callable(self.__dict__[key]) and not key.startswith("_"):
-                if self.__dict__[key].__class__.__name__ == "Player":
-                    dict[key] = self.__dict__[key].id
-                    continue
-                if type(self.__dict__[key]) is Space:
-                    continue
-                if key == "players":
-                    dict[key] = [player.toJson() for player in self.__dict__[key]]
-                    continue
-                dict[key] = self.__dict__[key]
-        return dict
+        json: dict[str, Any] = self.toJsonForPlayer()
+        json["players"] = [player.toJson() for player in self.players]
+        return json
 
     def toJsonForPlayer(self):
-        dict = {}
-        dict["attrs"] = self.attrs
-        for key in self.__dict__:
-            if not callable(self.__dict__[key]) and not key.startswith("_"):
-                if self.__dict__[key].__class__.__name__ == "Player":
-                    dict[key] = self.__dict__[key].id
-                    continue
-                if type(self.__dict__[key]) is Space:
-                    continue
-                if key == "players":
-                    continue
-                dict[key] = self.__dict__[key]
-        return dict
+        rules = self.rules
+        return {
+            "attrs": rules.attrs,
+            "spaceType": rules.spaceType,
+            "cost": rules.cost,
+            "name": rules.name,
+            "mortgaged": self.mortgaged,
+            "owner": self.owner.id if self.owner else None,
+            "id": self.id,
+            "gameId": self.gameId,
+            "purchaseable": rules.purchaseable,
+            "houses": self.houses,
+            "hotel": self.hotel,
+        }
 
 
 class Board:
@@ -245,12 +266,24 @@ class Board:
     startSpace: Space
     playerSpaces: dict[player_t, Space]
     players: dict[player_t, "Player"]
-    spaces: dict[int, Space]
+    # every space in board order starting at startSpace, a space's id is its index
+    spaces: list[Space]
+    # lowercase name -> the spaces with that name in board order
+    spacesByName: dict[str, list[Space]]
+    spacesByType: dict[spacetype_t, list[Space]]
 
     eventHandlers: dict[str, ModuleType]
+    # event name -> the chain for every space, indexed by space id (see compileEvent)
+    eventTable: dict[str, list[eventchain_t]]
     boardName: str
+    # what the board was built from, its event chains are shared with every game on the same board
+    template: "BoardTemplate | None"
 
     chanceCards: list[Chance]
+    # the game's random stream (see Game.rng), every roll and draw goes through it
+    rng: random.Random
+    # the game's loans, a roll runs the ones that fall due
+    ledger: "Ledger | None"
 
     gameId: float
 
@@ -261,24 +294,37 @@ class Board:
         eventHandlers: dict[str, ModuleType],
         startSpace: Space,
         chanceCards: list[Chance],
+        rng: random.Random | None = None,
+        ledger: "Ledger | None" = None,
+        template: "BoardTemplate | None" = None,
     ):
         self.startSpace = startSpace
+        self.template = template
+        self.rng = rng or random.Random()
+        self.ledger = ledger
 
         self.playerSpaces = {}
         self.players = {}
 
         self.gameId = gameid
 
-        self.spaces = {space.id: space for space in startSpace.iterSpaces()}
+        self.spaces = list(startSpace.iterSpaces())
+        self.spacesByName = {}
+        self.spacesByType = {}
+        for i, space in enumerate(self.spaces):
+            space.id = i
+            self.spacesByName.setdefault(space.name.lower(), []).append(space)
+            self.spacesByType.setdefault(space.spaceType, []).append(space)
 
         self.eventHandlers = eventHandlers
         self.boardName = name
+        self.compileEvents()
 
         self.chanceCards = chanceCards
 
     def drawChance(self, player: "Player"):
         if self.chanceCards:
-            return random.choice(self.chanceCards)
+            return self.rng.choice(self.chanceCards)
         return Chance("None", "gain", 0)
 
     def executeChanceCard(self, player: "Player", card: Chance):
@@ -304,20 +350,17 @@ class Board:
                 player.money -= int(card.data)
             case "teleport":
                 spaceName = card.data.lower().strip()
-                pickedSpace = False
                 if not self.isValidSpaceName(spaceName):
                     return
                 if match := re.match(r"n=(\d+)", spaceName):
-                    n = int(match.group(1))
                     spaceName = spaceName.replace(match.group(0), "").strip()
+                    space = self.getSpaceByName(spaceName, int(match.group(1)))
                 elif spaceName == "_random":
-                    pickedSpace = True
-                    n = 0
-                    space = random.choice(list(self.spaces.values()))
+                    space = self.rng.choice(self.spaces)
                 else:
-                    n = 1
-                if not pickedSpace:
-                    space = self.getSpaceByName(spaceName, n)
+                    space = self.getSpaceByName(spaceName, 1)
+                if not space:
+                    return
                 yield from self.moveTo(player, space)
             case "teleport-next-type":
                 ty = str2spacetype(card.data)
@@ -330,9 +373,7 @@ class Board:
                         break
 
     def isValidSpaceName(self, name: str):
-        for space in self.startSpace.iterSpaces():
-            if space.name.lower() == name.lower():
-                return True
+        return name.lower() in self.spacesByName
 
     def addPlayer(self, player: "Player"):
         self.startSpace.put(player)
@@ -340,26 +381,23 @@ class Board:
         self.playerSpaces[player.id] = self.startSpace
 
     def getSpaceById(self, id: int):
-        for space in self.startSpace.iterSpaces():
-            if space.id == id:
-                return space
+        if type(id) is int and 0 <= id < len(self.spaces):
+            return self.spaces[id]
         return None
 
+    # gets the count'th space called name
     def getSpaceByName(self, name: str, count: int = 1):
-        curSpace = self.startSpace
-        nth = 0
-        name = name.lower()
-        while nth < count:
-            if curSpace.name.lower():
-                nth += 1
-            curSpace = next(curSpace)
-        return curSpace.prev
+        spaces = self.spacesByName.get(name.lower(), [])
+        if 0 < count <= len(spaces):
+            return spaces[count - 1]
+        return None
+
+    def getSpacesByType(self, ty: spacetype_t):
+        return self.spacesByType.get(ty, [])
 
     def findJail(self):
-        for space in self.startSpace.iterSpaces():
-            if space.spaceType == ST_JAIL:
-                return space
-        return None
+        jails = self.getSpacesByType(ST_JAIL)
+        return jails[0] if jails else None
 
     def moveTo(self, player: "Player", space: Space):
         yield from self.runevent("onleave", self.playerSpaces[player.id], player)
@@ -368,17 +406,14 @@ class Board:
 
     # rolls the dice for a player
     def rollPlayer(self, player: "Player", dSides: int) -> Generator[statusreturn_t]:
-        d1 = random.randint(1, dSides)
-        d2 = random.randint(1, dSides)
+        d1 = self.rng.randint(1, dSides)
+        d2 = self.rng.randint(1, dSides)
         amount = d1 + d2
 
         player.lastRoll = amount
 
-        player.compoundLoans()
-        for dueLoan in player.incLoanDeadline():
-            player.payLoan(dueLoan, dueLoan.totalOwed)
-            player.creditScore -= 100
-            yield DUE_LOAN(dueLoan.id, player.id)
+        if self.ledger:
+            yield from self.ledger.onTurn(player)
 
         assert player.space, "Player is not on a space"
         yield from self.runevent("onroll", player.space, player, amount, d1, d2)
@@ -389,21 +424,48 @@ class Board:
     # <generic>.onland_<spae-name>()
     # <board-name>.onland()
     # <generic>.onland()
-    def runevent(self, name: str, space: Space, player: "Player", *args: Any):
-        if hasattr(space, name):
-            yield from getattr(space, name)(player, *args)
+    def resolveEvent(self, name: str, space: Space) -> eventchain_t:
+        return getattr(type(space), name, None), self.resolveHandler(name, space)
 
+    def resolveHandler(self, name: str, space: Space) -> Callable[..., Any] | None:
         for fn in (f"{name}_{space.name.replace(" ", "_").lower()}", name):
             if hasattr(self.eventHandlers.get(self.boardName), fn):
-                yield from getattr(self.eventHandlers[self.boardName], fn)(
-                    self, space, player, *args
-                )
-                return
+                return getattr(self.eventHandlers[self.boardName], fn)
             elif hasattr(self.eventHandlers["generic"], fn):
-                yield from getattr(self.eventHandlers["generic"], fn)(
-                    self, space, player, *args
-                )
-                return
+                return getattr(self.eventHandlers["generic"], fn)
+        return None
+
+    def compileEvent(self, name: str):
+        if (chains := self.eventTable.get(name)) is None:
+            # a space's chain depends on its name, and big boards repeat their names a lot
+            byName: dict[str, eventchain_t] = {}
+            chains = []
+            for space in self.spaces:
+                if (chain := byName.get(space.name)) is None:
+                    chain = byName[space.name] = self.resolveEvent(name, space)
+                chains.append(chain)
+            self.eventTable[name] = chains
+        return chains
+
+    # resolves every event the spaces and handler modules know about up front,
+    # anything else is compiled the first time it runs
+    def compileEvents(self):
+        # the chains only depend on the board, so games built from the same template share the table,
+        # and all of them compile again once boardbuilder.reloadHandlers clears it
+        self.eventTable = self.template.eventTable if self.template else {}
+        names = {"onland", "onleave", "onpass", "onroll"}
+        for module in self.eventHandlers.values():
+            names.update(attr.split("_")[0] for attr in dir(module) if attr.startswith("on"))
+        for name in names:
+            self.compileEvent(name)
+
+    def runevent(self, name: str, space: Space, player: "Player", *args: Any):
+        chains = self.eventTable.get(name) or self.compileEvent(name)
+        spaceMethod, handler = chains[space.id]
+        if spaceMethod:
+            yield from spaceMethod(space, player, *args)
+        if handler:
+            yield from handler(self, space, player, *args)
 
     # moves the player DOES NOT ROLL DICE
     def move(self, player: "Player", amount: int) -> Generator[statusreturn_t]:
@@ -423,7 +485,7 @@ class Board:
 
     def toJson(self):
         dict = {
-            "spaces": [space.toJson() for space in self.startSpace.iterSpaces()],
+            "spaces": [space.toJson() for space in self.spaces],
             "playerSpaces": {k: v.toJson() for k, v in self.playerSpaces.items()},
         }
         return dict
@@ -1,28 +1,172 @@
+"""
+board files are compiled once: the json is parsed and checked, the chance deck loaded and the handler modules
+imported into a BoardTemplate, kept by the hash of those files. a game builds its spaces from the template,
+and the files are only read again when their size or modification time changes
+"""
+import hashlib
+import importlib.util
 import json
+import os
+import sys
+from types import ModuleType
+from typing import Any
 
 import board
 
+# the board file lists its spaces along these, in this order
+SIDES = ("start", "left", "top", "right")
+
+
+class BoardTemplate:
+    # hash of every file the board is compiled from
+    key: str
+    name: str
+    # in board order, a space's id is its index. every game's spaces share these
+    spaces: list[board.SpaceRules]
+    cards: list[board.Chance]
+    handlers: dict[str, ModuleType]
+    # event name -> what each space runs for it, indexed by space id. every game built from the template
+    # uses this one as its Board.eventTable, reloadHandlers clears it
+    eventTable: dict[str, list[board.eventchain_t]]
+
+    def __init__(self, key: str, name: str, spaces: list[board.SpaceRules], cards: list[board.Chance], handlers: dict[str, ModuleType]):
+        self.key = key
+        self.name = name
+        self.spaces = spaces
+        self.cards = cards
+        self.handlers = handlers
+        self.eventTable = {}
+
+    def build(self, gameid: float) -> board.Space:
+        return buildSpaces(gameid, self.spaces)
+
+
+# content hash -> template, and (boards path, board name) -> (file signature, content hash)
+_templates: dict[str, BoardTemplate] = {}
+_seen: dict[tuple[str, str], tuple[Any, str]] = {}
+# board file hash -> its spaces, for buildFromFile
+_layouts: dict[str, list[board.SpaceRules]] = {}
+# (path, content hash) -> the module executed from it
+_modules: dict[tuple[str, str], ModuleType] = {}
+
+
+def import_from_path(module_name: str, file_path: str):
+    spec = importlib.util.spec_from_file_location(module_name, file_path)
+    if not spec:
+        raise ImportError()
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    assert spec.loader, "spec.loader does not exist, cannot load board and associated data (like chance cards)"
+    spec.loader.exec_module(module)
+    return module
+
+
+def reloadHandlers():
+    """
+    runs every handler module again in place, and throws away the chains compiled from them so running games
+    resolve their events against the new functions the next time those run
+    """
+    for module in _modules.values():
+        assert module.__spec__ and module.__spec__.loader, f"{module} cannot be reloaded"
+        module.__spec__.loader.exec_module(module)
+    for template in _templates.values():
+        template.eventTable.clear()
+
+
+def compileSpaces(data: dict[str, Any], path: str) -> list[board.SpaceRules]:
+    defs: dict[str, board.SpaceRules] = {}
+    for name, s in data["spaces"].items():
+        spaceType = getattr(board, f"ST_{s.get("type")}", None)
+        assert isinstance(spaceType, int), f"{path}: {name} has an unknown type {s.get("type")!r}"
+        cost = s.get("cost", 0)
+        assert isinstance(cost, int), f"{path}: {name} costs {cost!r}"
+        attrs = {k: v for k, v in s.items() if k not in ("cost", "not_purchaseable", "type")}
+        defs[name] = board.SpaceRules(spaceType, cost, name, False if s.get("not_purchaseable") else True, attrs)
+
+    spaces = []
+    for side in SIDES:
+        for name in (x.strip() for x in data[side].split("->")):
+            assert name in defs, f"{path}: {side} lists {name!r}, which is not one of its spaces"
+            spaces.append(defs[name])
+    assert spaces, "The board has no spaces"
+    return spaces
+
+
+def buildSpaces(gameid: float, spaces: list[board.SpaceRules]) -> board.Space:
+    """links up a fresh Space for every definition and returns the first one"""
+    first = prev = None
+    for rules in spaces:
+        space = board.Space(gameid, rules)
+        if prev is None:
+            first = space
+        else:
+            prev.setNext(space)
+        prev = space
+    assert first and prev, "The board has no spaces"
+    prev.setNext(first)
+    return first
+
+
 def buildFromFile(gameid: float, path: str) -> board.Space:
+    with open(path, "rb") as f:
+        content = f.read()
+    key = hashlib.sha256(content).hexdigest()
+    if key not in _layouts:
+        _layouts[key] = compileSpaces(json.loads(content), path)
+    return buildSpaces(gameid, _layouts[key])
+
+
+# the board's own chance deck if it has one, otherwise the generic deck
+def chanceFile(boardsPath: str, boardname: str):
+    path = f"{boardsPath}/{boardname}-chance.json"
+    if os.path.isfile(path):
+        return path
+    return f"{boardsPath}/generic-chance.json"
+
+
+def loadChance(path: str) -> list[board.Chance]:
     with open(path) as f:
-        data = json.load(f)
-        spacesData = data["spaces"]
-        spaces = {}
-        for space in spacesData:
-            s = spacesData[space]
-            attrs = {k: v for k, v in s.items() if k not in ("cost", "not_purchaseable", "type")}
-            spaces[space] = board.Space(gameid, getattr(board, f"ST_{s["type"]}"), s.get("cost", 0), space, False if s.get("not_purchaseable") else True, **attrs)
-
-        sideNames = ("start", "left", "top", "right")
-        firstSpace = None
-        for side in sideNames:
-            spaceNames = [x.strip() for x in data[side].split("->")]
-            for name in spaceNames:
-                if not firstSpace:
-                    firstSpace = spaces[name]
-                else:
-                    firstSpace.getLast().setNext(spaces[name].copy())
-
-        assert firstSpace, "The board has no spaces"
-        firstSpace.getLast().setNext(firstSpace)
-
-        return firstSpace
+        return [board.Chance(**v) for v in json.load(f)]
+
+
+def loadTemplate(boardsPath: str, boardname: str) -> BoardTemplate:
+    """the compiled boards/<boardname>.json with its chance deck and handlers, raises OSError if it is missing"""
+    boardFile = f"{boardsPath}/{boardname}.json"
+    cardsFile = chanceFile(boardsPath, boardname)
+    # generic first, a board's handlers may import it. Board.resolveEvent tries the board's own before it
+    handlerFiles = {"generic": f"{boardsPath}/generic.py"}
+    if os.path.isfile(f"{boardsPath}/{boardname}.py"):
+        handlerFiles[boardname] = f"{boardsPath}/{boardname}.py"
+    paths = [boardFile, cardsFile, *handlerFiles.values()]
+
+    signature = tuple((path, st.st_mtime_ns, st.st_size) for path in paths for st in (os.stat(path),))
+    seen = _seen.get((boardsPath, boardname))
+    if seen and seen[0] == signature:
+        return _templates[seen[1]]
+
+    contents = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            contents[path] = f.read()
+    digests = {path: hashlib.sha256(content).hexdigest() for path, content in contents.items()}
+    key = hashlib.sha256("".join(digests[path] for path in paths).encode()).hexdigest()
+
+    if key not in _templates:
+        handlers = {}
+        for name, path in handlerFiles.items():
+            if (path, digests[path]) not in _modules:
+                try:
+                    _modules[path, digests[path]] = import_from_path(name, path)
+                except Exception as e:
+                    # a board plays with the generic handlers alone if its own do not load
+                    if name == "generic":
+                        raise
+                    print(e)
+                    continue
+            handlers[name] = _modules[path, digests[path]]
+        if digests[boardFile] not in _layouts:
+            _layouts[digests[boardFile]] = compileSpaces(json.loads(contents[boardFile]), boardFile)
+        cards = [board.Chance(**v) for v in json.loads(contents[cardsFile])]
+        _templates[key] = BoardTemplate(key, boardname, _layouts[digests[boardFile]], cards, handlers)
+    _seen[boardsPath, boardname] = (signature, key)
+    return _templates[key]
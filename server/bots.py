@@ -0,0 +1,190 @@
+"""
+players the server plays itself, to fill seats nobody took
+
+a BotClient sits where a connection would and goes through Game.join and Game.run like one, but it never
+reads what the game sends it: a message only wakes it up, and it decides from the game state. the
+strategies are headless.Policy subclasses, so simulate.py plays the same ones
+"""
+import asyncio
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, override
+
+from client import Client
+from encoding import WIRE_NONE, frame_t
+from game import Game
+from gameregistry import getgame
+from headless import Policy, policies
+from player import Player
+from sendqueue import framekind_t
+
+DEFAULT_STRATEGY = "set-completer"
+# how long a decision waits on a strategy's prepare before going with what is ready, in ms
+BOT_BUDGET = float(os.environ.get("MONOPOLY_BOT_BUDGET", "50")) / 1000
+# players a game can have once bots are added, people and bots together
+MAX_SEATS = int(os.environ.get("MONOPOLY_MAX_SEATS", "8"))
+# what a bot raises an auction by
+BID_STEP = 10
+
+# strategies prepare here, off the game's loop
+pool = ThreadPoolExecutor(2, thread_name_prefix="bots")
+# joins in flight, kept so they are not collected while running
+tasks: set[asyncio.Task[Any]] = set()
+
+
+class BotClient(Client):
+    wireFormat = WIRE_NONE
+    policy: Policy
+    game: Game
+    player: Player
+    wake: asyncio.Event
+    closed: bool
+    preparing: asyncio.Future[None] | None
+    # what it has done this turn
+    rolled: bool
+    offered: bool
+    # (space id, money) of the builds and mortgages tried, the same one again means the last try did nothing
+    tried: set[tuple[int, int]]
+
+    def __init__(self, policy: Policy, game: Game):
+        self.policy = policy
+        self.game = game
+        self.wake = asyncio.Event()
+        self.closed = False
+        self.preparing = None
+        self.rolled = False
+        self.offered = False
+        self.tried = set()
+        self.bot = policy.name
+
+    @override
+    async def read(self, prompt: str) -> str:
+        raise EOFError("a bot has no details to send")
+
+    @override
+    async def write(self, data: dict[Any, Any] | list[dict[Any, Any]]):
+        self.wake.set()
+
+    @override
+    def post(self, data: dict[Any, Any] | list[dict[Any, Any]]) -> bool:
+        self.wake.set()
+        return True
+
+    @override
+    def postFrame(self, frame: frame_t, kind: framekind_t) -> bool:
+        self.wake.set()
+        return True
+
+    @override
+    def closeQueue(self):
+        self.closed = True
+        self.wake.set()
+
+    @override
+    async def __anext__(self) -> dict[str, Any]:
+        game = self.game
+        while True:
+            # everything sent so far, this bot's last action included, has been handled
+            await game.inbox.join()
+            if self.closed or getgame(game.id) is not game:
+                raise StopAsyncIteration
+            if not self.policy.ready(game):
+                await self.prepare()
+            if action := self.decide():
+                return action
+            self.wake.clear()
+            await self.wake.wait()
+
+    async def prepare(self):
+        if self.preparing is None:
+            self.preparing = asyncio.get_running_loop().run_in_executor(pool, self.policy.prepare, self.game)
+        try:
+            await asyncio.wait_for(asyncio.shield(self.preparing), BOT_BUDGET)
+        except TimeoutError:
+            pass
+
+    def decide(self) -> dict[str, Any] | None:
+        """the next action, None to wait for something to change"""
+        game, player, policy = self.game, self.player, self.policy
+        if not game.started or player.bankrupt:
+            return None
+
+        for trade in game.tradebook.forPlayer(player.id):
+            if trade.recipient == player.id and trade.status == "proposed":
+                return {"action": "accept-trade" if policy.acceptsTrade(game, player, trade) else "decline-trade", "id": trade.id}
+        for loan in game.ledger.loans.values():
+            if loan.status == "proposed" and loan.loaner is player:
+                return {"action": "accept-loan" if policy.acceptsLoan(game, player, loan) else "decline-loan", "loan": loan.id}
+
+        if auction := game.activeAuction:
+            space = game.board.spaces[auction["space"]]
+            bid = auction["current_bid"] + BID_STEP
+            if auction["bidder"] != player.id and bid <= min(policy.bidLimit(game, player, space), player.money):
+                return {"action": "bid", "bid": bid}
+            return None
+
+        if game.curPlayer is not player:
+            self.rolled = False
+            return None
+        if not self.rolled:
+            self.rolled, self.offered = True, False
+            self.tried.clear()
+            return {"action": "roll"}
+
+        space = player.space
+        if space and not self.offered and space.purchaseable and space.owner is None:
+            self.offered = True
+            if policy.wantsToBuy(game, player, space):
+                return {"action": "buy", "spaceid": space.id}
+            return {"action": "start-auction", "spaceid": space.id}
+
+        if player.money < 0:
+            for space in policy.toMortgage(game, player):
+                if self.attempt(space):
+                    return {"action": "mortgage", "spaceid": space.id}
+            self.rolled = False
+            return {"action": "bankrupt"}
+
+        if (space := policy.nextBuild(game, player)) and self.attempt(space):
+            return {"action": "buy-hotel" if space.houses == 4 else "buy-house", "spaceid": space.id}
+
+        self.rolled = False
+        return {"action": "end-turn"}
+
+    def attempt(self, space: Any) -> bool:
+        """False if this space was tried with the money the player has now, so it got nowhere"""
+        attempt = (space.id, self.player.money)
+        if attempt in self.tried:
+            return False
+        self.tried.add(attempt)
+        return True
+
+
+def newBot(game: Game, strategy: str, id: str | None = None) -> Player:
+    policy = policies[strategy]()
+    client = BotClient(policy, game)
+    player = Player(id or f"bot-{secrets.token_hex(4)}", len(game.players), client)
+    player.name = f"{policy.name} bot"
+    player.piece = "🤖"
+    player.gameid = game.id
+    client.player = player
+    return player
+
+
+def addBot(game: Game, strategy: str = DEFAULT_STRATEGY) -> Player:
+    """seats a bot the way a connection joins, see Game.join"""
+    player = newBot(game, strategy)
+    task = asyncio.create_task(game.join(player))
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return player
+
+
+def resumeBots(game: Game):
+    """restarts the bots of a game recovered from its log, they rejoin like a reconnecting player"""
+    for player in game.players.values():
+        if isinstance(player.client, BotClient) and not player.bankrupt:
+            task = asyncio.create_task(game.rejoin(player))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
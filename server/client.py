@@ -1,8 +1,24 @@
 import abc
+import asyncio
 import json
-from typing import Any, override
+from typing import Any, Callable, override
+
+import encoding
+import wire
+from encoding import WIRE_JSON, frame_t
+from sendqueue import SEND_QUEUE_SIZE, SLOW_CONSUMER_POLICY, SendQueue, frameKind, framekind_t
 
 class Client(abc.ABC):
+    # outbound frames go through a bounded queue with its own writer task (see post)
+    # and reach the socket already encoded (see writeFrame)
+    sendQueueSize: int = SEND_QUEUE_SIZE
+    slowConsumerPolicy: str = SLOW_CONSUMER_POLICY
+    sendQueue: SendQueue | None = None
+    # what the frames it gets are encoded as, see encoding.wireEncoders
+    wireFormat: str = WIRE_JSON
+    # the strategy playing for this client if it is a bot, see bots.py
+    bot: str | None = None
+
     @abc.abstractmethod
     async def read(self, prompt: str) -> str: ...
 
@@ -15,22 +31,66 @@ class Client(abc.ABC):
     def __aiter__(self):
         return self
 
+    async def writeFrame(self, frame: frame_t):
+        """writes an already encoded frame, clients that can send it as is should override this"""
+        await self.write(encoding.wireDecoders[self.wireFormat](frame))
+
+    def post(self, data: dict[Any, Any] | list[dict[Any, Any]]) -> bool:
+        """queues data for this client's writer task and returns immediately"""
+        return self.postFrame(encoding.wireEncoders[self.wireFormat](data), frameKind(data))
+
+    def postFrame(self, frame: frame_t, kind: framekind_t) -> bool:
+        """queues a frame that may be shared with other clients, see Game.broadcast"""
+        if self.sendQueue is None:
+            self.sendQueue = SendQueue(
+                self.writeFrame, self.sendQueueSize, self.slowConsumerPolicy, self.close,
+                encoding.wireDecoders[self.wireFormat], encoding.wireEncoders[self.wireFormat],
+            )
+        return self.sendQueue.put(frame, kind)
+
+    def closeQueue(self):
+        if self.sendQueue:
+            self.sendQueue.close()
+
+    def close(self):
+        """drops the connection, called when the client falls too far behind"""
+        self.closeQueue()
+
 class WSClient(Client):
-    def __init__(self, ws):
+    def __init__(self, ws, wireFormat: str = WIRE_JSON):
         self.ws = ws
+        self.wireFormat = wireFormat
+
+    async def hello(self):
+        """tells a client that asked for messagepack how to read it, as json since it cannot yet"""
+        if self.wireFormat != WIRE_JSON:
+            await self.ws.send(json.dumps({"response": "wire", "value": {"format": self.wireFormat, "keys": wire.KEYS}}))
 
     @override
     async def read(self, prompt: str) -> str:
-        await self.ws.send(json.dumps({"response": "prompt", "value": prompt}))
-        return await self.ws.recv()
+        await self.write({"response": "prompt", "value": prompt})
+        message = await self.ws.recv()
+        return json.dumps(wire.unpack(message)) if isinstance(message, bytes) else message
 
     @override
     async def write(self, data: dict[Any, Any] | list[dict[Any, Any]]):
-        await self.ws.send(json.dumps(data))
-    
+        await self.writeFrame(encoding.wireEncoders[self.wireFormat](data))
+
+    @override
+    async def writeFrame(self, frame: frame_t):
+        # text=True sends the utf-8 bytes as a text frame without decoding them first
+        await self.ws.send(frame, text=self.wireFormat == WIRE_JSON)
+
     @override
     async def __anext__(self) -> dict[str, Any]:
-        return json.loads(await self.ws.recv())
+        # a messagepack client may still send json, the frame type tells them apart
+        message = await self.ws.recv()
+        return wire.unpack(message) if isinstance(message, bytes) else json.loads(message)
+
+    @override
+    def close(self):
+        super().close()
+        asyncio.create_task(self.ws.close())
 
 class TermClient(Client):
 
@@ -47,9 +107,76 @@ class TermClient(Client):
     async def write(self, data: dict[Any, Any] | list[dict[Any, Any]]):
         print(data)
 
+    @override
+    async def writeFrame(self, frame: frame_t):
+        print(frame.decode())
+
     @override
     async def __anext__(self) -> dict[str, Any]:
         res = input("> ")
         if res == "end-turn":
             return {"action": "end-turn"}
         return {"action": "start-turn"}
+
+
+class MemoryClient(Client):
+    """
+    an in-process client for driving a game without sockets (benchmarks, tools).
+    actions are pushed with send(), and everything the game writes is handed to onwrite
+    """
+    inbox: asyncio.Queue[dict[str, Any] | None]
+    onwrite: Callable[[Any], Any] | None
+
+    def __init__(self, onwrite: Callable[[Any], Any] | None = None):
+        self.inbox = asyncio.Queue()
+        self.onwrite = onwrite
+
+    def send(self, action: dict[str, Any] | None):
+        """queues an action for the game, None disconnects the client"""
+        self.inbox.put_nowait(action)
+
+    @override
+    async def read(self, prompt: str) -> str:
+        return json.dumps(await self.inbox.get())
+
+    @override
+    async def write(self, data: dict[Any, Any] | list[dict[Any, Any]]):
+        if self.onwrite:
+            self.onwrite(data)
+
+    @override
+    async def writeFrame(self, frame: frame_t):
+        # nothing to decode for if nobody is listening
+        if self.onwrite:
+            self.onwrite(encoding.wireDecoders[self.wireFormat](frame))
+
+    @override
+    async def __anext__(self) -> dict[str, Any]:
+        action = await self.inbox.get()
+        if action is None:
+            raise StopAsyncIteration
+        return action
+
+
+class NullClient(Client):
+    """a client that drops everything, for players driven without any connection (see headless.py)"""
+
+    @override
+    async def read(self, prompt: str) -> str:
+        raise EOFError("NullClient cannot be read from")
+
+    @override
+    async def write(self, data: dict[Any, Any] | list[dict[Any, Any]]):
+        pass
+
+    @override
+    async def __anext__(self) -> dict[str, Any]:
+        raise StopAsyncIteration
+
+    @override
+    def post(self, data: dict[Any, Any] | list[dict[Any, Any]]) -> bool:
+        return True
+
+    @override
+    def postFrame(self, frame: frame_t, kind: framekind_t) -> bool:
+        return True
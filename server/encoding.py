@@ -0,0 +1,76 @@
+import json
+import os
+import time
+from typing import Any, Callable
+
+import wire
+
+# a frame is an encoded message, encoded once and shared by every client it goes to
+type frame_t = bytes
+type encoder_t = Callable[[Any], frame_t]
+
+
+def jsonEncode(data: Any) -> frame_t:
+    return json.dumps(data).encode()
+
+
+encoders: dict[str, encoder_t] = {"json": jsonEncode}
+
+try:
+    import orjson  # pyright: ignore[reportMissingImports]
+
+    # json.dumps turns int dict keys into strings, orjson only does with this option
+    encoders["orjson"] = lambda data: orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    pass
+
+encode: encoder_t = jsonEncode
+
+
+def setEncoder(name: str):
+    """picks the encoder every frame goes through, falls back to json if name is not installed"""
+    global encode
+    if name not in encoders:
+        print(f"encoder {name} is not available, using json")
+        name = "json"
+    encode = encoders[name]
+
+
+def decode(frame: frame_t) -> Any:
+    return json.loads(frame)
+
+
+# the formats a client can ask for when it connects, json goes through whichever encoder setEncoder picked
+WIRE_JSON = "json"
+WIRE_MSGPACK = "msgpack"
+# for in-process clients that read the game instead of what it sends them, see bots.py
+WIRE_NONE = "none"
+
+wireEncoders: dict[str, encoder_t] = {WIRE_JSON: lambda data: encode(data), WIRE_MSGPACK: wire.pack, WIRE_NONE: lambda data: b""}
+wireDecoders: dict[str, Callable[[frame_t], Any]] = {WIRE_JSON: decode, WIRE_MSGPACK: wire.unpack, WIRE_NONE: lambda frame: None}
+
+
+class Frame:
+    """a message encoded at most once per wire format, however many clients it goes to"""
+
+    __slots__ = ("data", "frames", "seconds")
+
+    data: Any
+    frames: dict[str, frame_t]
+    # spent encoding it so far
+    seconds: float
+
+    def __init__(self, data: Any):
+        self.data = data
+        self.frames = {}
+        self.seconds = 0
+
+    def get(self, wireFormat: str) -> frame_t:
+        if (frame := self.frames.get(wireFormat)) is None:
+            start = time.perf_counter()
+            frame = self.frames[wireFormat] = wireEncoders[wireFormat](self.data)
+            self.seconds += time.perf_counter() - start
+        return frame
+
+
+setEncoder(os.environ.get("MONOPOLY_ENCODER", "json"))
@@ -1,33 +1,45 @@
 import asyncio
 import dataclasses
-import importlib.util
 import json
 import os
 import random
-import sys
+import secrets
 import time
 import traceback
-from types import ModuleType
-from typing import Any, Callable
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable
 from board import Board, Chance, player_t, spacetype_t, status_t
-from loan import Loan
-from player import Player
-from trade import Trade
-from boardbuilder import buildFromFile
+from ledger import Ledger
+from player import CHECK_INDEXES, Player
+from tradebook import TradeBook
+from spectators import SpectatorStream
+from timers import Timer, timers
+from boardbuilder import loadTemplate
 from client import Client
 
 import actions as Actions
+import encoding
+from sendqueue import dedupe, frameKind, framekind_t
+from metrics import metrics
 from gameregistry import addgame, gameid_t
 
-def import_from_path(module_name: str, file_path: str):
-    spec = importlib.util.spec_from_file_location(module_name, file_path)
-    if not spec:
-        raise ImportError()
-    module = importlib.util.module_from_spec(spec)
-    sys.modules[module_name] = module
-    assert spec.loader, "spec.loader does not exist, cannot load board and associated data (like chance cards)"
-    spec.loader.exec_module(module)
-    return module
+if TYPE_CHECKING:
+    from wal import ActionLog
+
+# seconds a player can sit on their turn before it is ended for them, 0 never ends it
+TURN_TIMEOUT = float(os.environ.get("MONOPOLY_TURN_TIMEOUT", "0"))
+# milliseconds the messages of an action wait for those of the next ones before they go out together,
+# 0 sends them when the action is done
+FLUSH_WINDOW = float(os.environ.get("MONOPOLY_FLUSH_WINDOW", "0"))
+# frames a game keeps for clients that reconnect, one that missed more gets the full state instead
+RESUME_BUFFER = int(os.environ.get("MONOPOLY_RESUME_BUFFER", "256"))
+# actions the write-ahead log leaves out, what they do is logged as its own event (add-bot logs the bot's join)
+UNLOGGED_ACTIONS = {"add-bot"}
+
+# "buy-house" -> actions.buyHouse, None if there is no such action
+def actionHandler(name: str) -> Callable[..., Any] | None:
+    fn = getattr(Actions, "".join(k.title() if i > 0 else k for i, k in enumerate(name.split("-"))), None)
+    return fn if callable(fn) else None
 
 
 class Game:
@@ -43,9 +55,42 @@ class Game:
     activeAuction: dict[str, Any] | None
     activePlayers: list[Player]
     id: gameid_t
-    loans: list[Loan]
-    trades: list[Trade]
+    ledger: Ledger
+    tradebook: TradeBook
     started: bool
+    # bumped by every state patch, see actions.getStatePatch
+    version: int
+    # every connection pushes its actions here, and the game's own task
+    # (see Game.start) handles them one at a time
+    inbox: asyncio.Queue[tuple[dict[str, Any], Player]]
+    task: asyncio.Task[None] | None
+    # deadlines on the shared timer heap, see timers.py
+    auctionTimer: Timer | None
+    turnTimer: Timer | None
+    # whose turn turnTimer is timing
+    turnTimerFor: Player | None
+    # every random decision in the game (dice, chance cards, ids, colors) comes from rng,
+    # so the same seed and the same actions play out the same game
+    seed: int
+    rng: random.Random
+    # when the action being handled arrived, auctions time themselves off it so a replay gets the same timestamps
+    actionTime: float
+    # the write-ahead log (see wal.py), None when the game is not persisted
+    log: "ActionLog | None"
+    # messages waiting to go out, each recipient gets them as one frame (see flushOutbox), None is everyone
+    outbox: list[tuple[Client | None, dict[str, Any]]]
+    flushTimer: Timer | None
+    # every frame the game sends ends with {"response": "seq", "value": seq}, a reconnecting
+    # client says the last one it saw and gets what it missed from recent (see resume)
+    seq: int
+    # (seq, the frames sent with it by the id of the player each was for, None for everyone else)
+    recent: deque[tuple[int, dict[player_t | None, encoding.Frame]]]
+    # session token -> player, the token comes with the session message when a player joins
+    sessions: dict[str, Player]
+    # read-only watchers, they are not clients of the game and only get what every player gets
+    spectators: SpectatorStream
+    # called when the game is won, see RoomManager.create
+    onFinish: Callable[[], Any] | None
     
     def toJson(self):
         return {
@@ -53,28 +98,20 @@ class Game:
             "host": self.host,
         }
 
-    def __init__(self, boardname: str, dSides: int = 6):
-        boardFile = f"{self.boards_path}/{boardname}.json"
-        handlers: dict[str, ModuleType] = {}
-        generic_handlers = import_from_path("generic", f"{self.boards_path}/generic.py")
-        try:
-            handlers[boardname] = import_from_path(boardname, f"{self.boards_path}/{boardname}.py")
-        except Exception as e:
-            print(e)
-        handlers["generic"] = generic_handlers
-
-        if os.path.isdir(f"{self.boards_path}/{boardname}-chance.json"):
-            path = f"{self.boards_path}/{boardname}-chance.json"
-        else:
-            path = f"{self.boards_path}/generic-chance.json"
-        with open(path) as f:
-            cards = [Chance(**v) for v in json.load(f)]
+    def __init__(self, boardname: str, dSides: int = 6, id: gameid_t | None = None, seed: int | None = None):
+        # compiled the first time a board is used, the handler modules are shared by every game on it
+        template = loadTemplate(self.boards_path, boardname)
 
-        self.id = random.random()
+        # the id only names the room, it stays out of the game's own random stream
+        self.id = random.random() if id is None else id
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.actionTime = time.time()
 
         addgame(self.id, self)
 
-        self.board = Board(self.id, boardname, handlers, buildFromFile(self.id, boardFile), cards)
+        self.ledger = Ledger()
+        self.board = Board(self.id, boardname, template.handlers, template.build(self.id), list(template.cards), self.rng, self.ledger, template)
         self.players = {}
         self.curTurn = 0
         self.dSides = dSides
@@ -82,15 +119,32 @@ class Game:
         self.clients = []
         self.activeAuction = None
         self.activePlayers = []
-        self.loans = []
-        self.trades = []
+        self.tradebook = TradeBook()
         self.started = False
+        self.version = 0
+        self.inbox = asyncio.Queue()
+        self.task = None
+        self.auctionTimer = None
+        self.turnTimer = None
+        self.turnTimerFor = None
+        self.log = None
+        self.outbox = []
+        self.flushTimer = None
+        self.seq = 0
+        self.recent = deque(maxlen=RESUME_BUFFER)
+        self.sessions = {}
+        self.spectators = SpectatorStream(self)
+        self.onFinish = None
 
     @property
     def curPlayer(self) -> Player:
         values = list(self.activePlayers)
         return values[self.curTurn]
     
+    @property
+    def finished(self):
+        return self.started and len(self.activePlayers) < 2
+
     @property
     def host(self):
         if not self.started and len(self.activePlayers) > 0:
@@ -104,45 +158,85 @@ class Game:
         assert p, f"Player@:{id} does not exist"
         return p
 
-    async def join(self, player: Player, onjoin: Callable[[], Any] | None = None):
+    def playerColor(self):
+        return f"#{self.rng.randint(180, 255):x}{self.rng.randint(180, 255):x}{self.rng.randint(180, 255):x}"
+
+    def addPlayer(self, player: Player):
+        player.color = self.playerColor()
         self.players[player.id] = player
         self.activePlayers.append(player)
         self.board.addPlayer(player)
         self.clients.append(player.client)
+
+    async def join(self, player: Player, onjoin: Callable[[], Any] | None = None):
+        self.addPlayer(player)
+        if self.log:
+            self.log.append({"event": "join", "player": {
+                "id": player.id,
+                "playerNumber": player.playerNumber,
+                "name": player.name,
+                "piece": player.piece,
+                "color": player.color,
+                "address": player.address,
+                "bot": player.client.bot,
+            }})
         if onjoin:
             onjoin()
-        await player.client.write({"response": "assignment", "value": player.id})
-        await self.broadcast({"response": "board", "value": self.board.toJson()})
-        await self.broadcast({"response": "lobby-state", "value": self.toJson()})
-        await self.broadcast({"response": "player-list", "value": [player.toJson() for player in self.players.values()]})
+        player.session = secrets.token_urlsafe(16)
+        self.sessions[player.session] = player
+        player.client.post({"response": "assignment", "value": player.id})
+        player.client.post([*Actions.getFullState(self), self.sessionMessage(player)])
+        await self.broadcast(self.updatedState())
         await self.run(player)
 
     def disconnectClient(self, client: Client):
-        self.clients.remove(client)
+        client.closeQueue()
+        # players restored from the write-ahead log have no client in the list until they reconnect
+        if client in self.clients:
+            self.clients.remove(client)
         if not self.started:
             client
 
-    async def rejoin(self, player: Player):
+    async def rejoin(self, player: Player, lastSeq: int | None = None, client: Client | None = None):
+        """
+        puts a player's connection back in, client replaces the one they had.
+        lastSeq is the last frame it saw if it was here before
+        """
         assert player.space, f"{player} is not on a space"
+        # what is still in the outbox is numbered and kept for the old connection, so it comes back with the missed frames
+        self.flushOutbox()
+        if client is not None:
+            self.disconnectClient(player.client)
+            player.client = client
         self.clients.append(player.client)
-        await player.client.write({"response": "assignment", "value": player.id})
-        await self.broadcast({"response": "board", "value": self.board.toJson()})
-        await self.broadcast({"response": "next-turn", "value": self.curPlayer.toJson()})
-        await player.client.write({"response": "current-space", "value": player.space.toJson()})
-        await self.broadcast({"response": "player-list", "value": [player.toJson() for player in self.players.values()]})
-        await self.broadcast({"response": "lobby-state", "value": self.toJson()})
-        if len(self.loans) > 0:
-            await self.broadcast({"response": "loan-list", "value": [loan.toJson() for loan in self.loans]})
-        if len(self.trades) > 0:
-            await self.broadcast({"response": "loan-list", "value": [trade.toJson() for trade in self.trades]})
-        print("JOIN", self.activeAuction)
-        if self.activeAuction is not None: 
-             await self.broadcast({"response": "auction-status", "value": self.activeAuction})
+        if player.session is None:
+            player.session = secrets.token_urlsafe(16)
+            self.sessions[player.session] = player
+        player.client.post(self.resume(player, lastSeq))
         await self.run(player)
 
+    def resume(self, player: Player, lastSeq: int | None) -> list[dict[str, Any]]:
+        """one message list that brings a reconnecting player up to date, only the full state if it missed too much"""
+        session = self.sessionMessage(player)
+        if lastSeq is not None and lastSeq <= self.seq and (not self.recent or self.recent[0][0] <= lastSeq + 1):
+            # a player a frame was addressed to got it instead of the one for everyone
+            missed = [frames.get(player.id, frames.get(None)) for seq, frames in self.recent if seq > lastSeq]
+            return [message for frame in missed if frame for message in frame.data] + [session]
+        assert player.space
+        state: list[dict[str, Any]] = [{"response": "assignment", "value": player.id}, *Actions.getFullState(self)]
+        state.append({"response": "next-turn", "value": self.curPlayer.toJson()})
+        state.append({"response": "current-space", "value": player.space.toJson()})
+        if self.activeAuction is not None:
+            state.append({"response": "auction-status", "value": self.activeAuction})
+        return state + [session]
+
+    def sessionMessage(self, player: Player):
+        return {"response": "session", "value": {"token": player.session, "seq": self.seq}}
+
     def advanceTurn(self):
         self.playerTurn = (self.playerTurn % len(self.activePlayers)) + 1
         self.curTurn = self.playerTurn - 1
+        self.tradebook.onTurn()
 
     def createAuction(self, forSpace: spacetype_t, end_time: int=10000, starting_bid: int=0):
         self.activeAuction = {
@@ -150,72 +244,218 @@ class Game:
             "bidder": None,
             "end_time": end_time,
             "space": forSpace,
-            "end_timestamp": (time.time() * 1000) + end_time
+            "end_timestamp": (self.actionTime * 1000) + end_time
         }        
 
     def updateAuction(self, **kwargs):
         if not self.activeAuction: return
         for k, v in kwargs.items():
             self.activeAuction[k] = v
-        self.activeAuction["end_timestamp"] = self.activeAuction["end_time"] + (time.time() * 1000)
+        self.activeAuction["end_timestamp"] = self.activeAuction["end_time"] + (self.actionTime * 1000)
+        # a bid pushes the end back
+        if self.auctionTimer:
+            self.startAuctionTimer()
 
     async def endAuction(self):
         if not self.activeAuction: return
+        self.cancelTimer("auctionTimer")
+        if self.log:
+            self.log.append({"event": "auction-end"})
         if self.activeAuction["bidder"]:
             space = self.board.getSpaceById(self.activeAuction["space"])
             assert space, f"Space@:{self.activeAuction["space"]} does not exist"
             self.players[self.activeAuction["bidder"]].takeOwnership(space, self.activeAuction["current_bid"])
-            await self.broadcast([{"response": "auction-end"}, {"response": "board", "value": self.board.toJson()}])
-        else:
-            await self.broadcast({"response": "auction-end"})
-            await self.broadcast(Actions.getUpdatedState(self))
+        await self.broadcast([{"response": "auction-end"}, *self.updatedState()])
         self.activeAuction = None
 
 
 
-    async def handleAction(self, action: dict[str, Any], player: Player):
+    # what goes out to everyone after an action changes the game or ends a turn, headless games override these (see headless.py)
+    def updatedState(self) -> list[dict[str, Any]]:
+        return Actions.getUpdatedState(self)
+
+    def turnEnded(self, prevPlayer: Player) -> list[dict[str, Any]]:
+        return Actions.getTurnEnded(self, prevPlayer)
+
+    # runs the handler for an action without sending anything,
+    # yields (recipient, message) where the message may still be a status_t
+    def dispatch(self, action: dict[str, Any], player: Player):
+        if fn := actionHandler(action["action"]):
+            i = fn(self, action, player)
+            if i:
+                yield from i
+        if CHECK_INDEXES:
+            for p in self.players.values():
+                p.checkIndexes()
+
+    # at is when the action arrived, a replay passes the recorded time
+    async def handleAction(self, action: dict[str, Any], player: Player, at: float | None = None):
         client: Client = player.client
+        self.actionTime = time.time() if at is None else at
+        # only known actions get their own label, so clients can't grow the metrics without bound
+        name = action["action"] if actionHandler(action["action"]) else "unknown"
+        start = time.perf_counter()
+        if self.log and name != "unknown" and name not in UNLOGGED_ACTIONS:
+            self.log.append({"t": self.actionTime, "player": player.id, "action": action})
 
         #player-info is for the ui to know who the player is
         #player-list is generally how the ui knows the information about all the players
         #player-info should only be used when the ui is connecting or calling send-player-info
 
-        actionFnName = "".join(k.title() if i > 0 else k for i, k in enumerate(action["action"].split("-")))
-        if hasattr(Actions, actionFnName):
-            if (fn := getattr(Actions, actionFnName)) and callable(fn):
-                try:
-                    i = fn(self, action, player)
-                    if i:
-                        for broadcast, value in i:
-                            print(f"MESSAGE {actionFnName=} {broadcast=} {value=}")
-                            if isinstance(value, status_t):
-                                name = value.__class__.__name__
-                                value = dataclasses.asdict(value)
-                                value["status"] = name.lower().replace("_", "-")
-                                value = {"response": "notification", "value": value}
-                            if broadcast is True:
-                                await self.broadcast(value)
-                            elif broadcast is False:
-                                await client.write(value)
-                            elif isinstance(broadcast, Client):
-                                await broadcast.write(value)
-                except TypeError as e:
-                    print(traceback.format_exc())
-
-        await self.broadcast({"response": "player-list", "value": [player.toJson() for player in self.players.values()]})
+        try:
+            for broadcast, value in self.dispatch(action, player):
+                if isinstance(value, status_t):
+                    status = value.__class__.__name__
+                    value = dataclasses.asdict(value)
+                    value["status"] = status.lower().replace("_", "-")
+                    value = {"response": "notification", "value": value}
+                if broadcast is True:
+                    self.queueMessage(None, value)
+                elif broadcast is False:
+                    self.queueMessage(client, value)
+                elif isinstance(broadcast, Client):
+                    self.queueMessage(broadcast, value)
+        except TypeError as e:
+            metrics.actionErrors.inc(name)
+            print(traceback.format_exc())
+        except Exception:
+            metrics.actionErrors.inc(name)
+            raise
+
+        if patch := Actions.getStatePatch(self):
+            self.queueMessage(None, patch)
+
+        metrics.actionCalls.inc(name)
+        metrics.handlerTime.observe(name, time.perf_counter() - start)
+        if not FLUSH_WINDOW:
+            serializeTime, fanoutTime = self.flushOutbox()
+            metrics.serializeTime.observe(name, serializeTime)
+            metrics.fanoutTime.observe(name, fanoutTime)
+        elif self.flushTimer is None:
+            self.flushTimer = timers.at(time.time() + FLUSH_WINDOW / 1000, self.flushLater)
+        self.armTurnTimer(player)
+        if self.log:
+            self.log.maybeSnapshot()
 
     async def run(self, player: Player):
         async for message in player.client:
-            await self.handleAction(message, player)
+            await self.inbox.put((message, player))
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.loop())
+        return self.task
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.cancelTimer("auctionTimer")
+        self.cancelTimer("turnTimer")
+        self.spectators.stop()
+
+    async def loop(self):
+        while True:
+            message, player = await self.inbox.get()
+            try:
+                await self.handleAction(message, player)
+            except Exception:
+                print(traceback.format_exc())
+            finally:
+                # bots wait on this to know their last action went through
+                self.inbox.task_done()
 
     async def broadcast(self, message: dict[Any, Any] | list[dict[Any, Any]]):
+        # whatever the last actions left in the outbox goes first, so clients see it in order
+        self.flushOutbox()
+        # encoded once, every client drains its own queue, so this never waits on a socket
+        frame = self.sequenced({None: message if isinstance(message, list) else [message]})[None]
+        self.broadcastFrame(frame, frameKind(frame.data))
+
+    def sequenced(self, batches: dict[Client | None, list[dict[str, Any]]]) -> dict[Client | None, encoding.Frame]:
+        """
+        the frames for one send by the client each goes to, None for everyone else. they all get the same seq,
+        and are kept for players that reconnect
+        """
+        self.seq += 1
+        seq = {"response": "seq", "value": self.seq}
+        frames = {to: encoding.Frame([*messages, seq]) for to, messages in batches.items()}
+        playerOf = {player.client: player.id for player in self.players.values()} if frames.keys() != {None} else {}
+        # a client without a player (a bench client, say) is never resumed
+        self.recent.append((self.seq, {playerOf[to] if to is not None else None: frame for to, frame in frames.items() if to is None or to in playerOf}))
+        if None in frames:
+            self.spectators.push(frames[None])
+        return frames
+
+    def queueMessage(self, recipient: Client | None, value: dict[str, Any] | list[dict[str, Any]]):
+        self.outbox.extend((recipient, message) for message in (value if isinstance(value, list) else [value]))
+
+    def flushOutbox(self) -> tuple[float, float]:
+        """
+        sends the outbox, one frame per client with the state messages a later one replaces left out.
+        clients nothing was addressed to share one frame. returns the seconds spent encoding and queueing
+        """
+        self.cancelTimer("flushTimer")
+        if not self.outbox:
+            return 0, 0
+        start = time.perf_counter()
+        outbox, self.outbox = self.outbox, []
+        batches: dict[Client | None, list[dict[str, Any]]] = {}
+        for recipient in {recipient: None for recipient, _ in outbox if recipient is not None}:
+            batches[recipient] = dedupe([message for to, message in outbox if to is None or to is recipient])
+        if shared := dedupe([message for to, message in outbox if to is None]):
+            batches[None] = shared
+        frames = self.sequenced(batches)
+        for recipient, frame in frames.items():
+            if recipient is not None:
+                recipient.postFrame(frame.get(recipient.wireFormat), frameKind(frame.data))
+        if everyone := frames.get(None):
+            kind = frameKind(everyone.data)
+            for client in self.clients:
+                if client not in frames:
+                    client.postFrame(everyone.get(client.wireFormat), kind)
+        serializeTime = sum(frame.seconds for frame in frames.values())
+        return serializeTime, time.perf_counter() - start - serializeTime
+
+    def flushLater(self):
+        self.flushTimer = None
+        serializeTime, fanoutTime = self.flushOutbox()
+        metrics.serializeTime.observe("flush", serializeTime)
+        metrics.fanoutTime.observe("flush", fanoutTime)
+
+    def broadcastFrame(self, frame: encoding.Frame, kind: framekind_t):
         for client in self.clients:
-            await client.write(message)
+            client.postFrame(frame.get(client.wireFormat), kind)
 
-    async def auctionTimer(self):
-        assert self.activeAuction, "There is no auction running for auctionTimer to act on"
+    def queueStats(self):
+        return [client.sendQueue.stats() for client in self.clients if client.sendQueue]
 
-        while time.time() < self.activeAuction["end_timestamp"] / 1000:
-            await asyncio.sleep(1)
+    def cancelTimer(self, name: str):
+        if timer := getattr(self, name):
+            timer.cancel()
+            setattr(self, name, None)
 
-        await self.endAuction()
\ No newline at end of file
+    def startAuctionTimer(self):
+        # also moves a running one, a replayed auction may start a timer while a recovered one is already running
+        self.cancelTimer("auctionTimer")
+        if self.activeAuction:
+            self.auctionTimer = timers.at(self.activeAuction["end_timestamp"] / 1000, self.endAuction)
+
+    def armTurnTimer(self, actor: Player | None = None):
+        """restarts the idle turn clock when the turn changed hands or its player did something"""
+        if not TURN_TIMEOUT or not self.started or not self.activePlayers:
+            return
+        player = self.curPlayer
+        if self.turnTimer and self.turnTimerFor is player and actor is not player:
+            return
+        self.cancelTimer("turnTimer")
+        self.turnTimerFor = player
+        self.turnTimer = timers.at(time.time() + TURN_TIMEOUT, lambda: self.idleTurn(player))
+
+    def idleTurn(self, player: Player):
+        self.turnTimer = None
+        # through the inbox like any other action, so it is logged and cannot interleave with one
+        if player is self.curPlayer and not self.activeAuction:
+            self.inbox.put_nowait(({"action": "end-turn"}, player))
+        else:
+            self.armTurnTimer()
\ No newline at end of file
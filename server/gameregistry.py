@@ -9,3 +9,9 @@ def addgame(id: gameid_t, game: Any):
 
 def getgame(id: gameid_t):
     return registry.get(id)
+
+def removegame(id: gameid_t):
+    return registry.pop(id, None)
+
+def listgames():
+    return list(registry.values())
@@ -0,0 +1,295 @@
+"""
+plays games without sockets or asyncio: every player is a NullClient and
+turns are run straight through Game.dispatch, so a whole game is a plain function call
+"""
+from typing import Any
+
+from board import ST_RAILROAD, ST_UTILITY, Space
+from client import NullClient
+from game import Game
+from gameregistry import removegame
+from loan import Loan
+from monopolytypes import player_t
+from player import Player
+from trade import Trade
+
+
+class Policy:
+    """decides what a headless player does on its turn, subclass it for other play styles"""
+
+    name: str = "scripted"
+    # cash the player tries to keep in hand
+    reserve: int = 150
+
+    def wantsToBuy(self, game: Game, player: Player, space: Space) -> bool:
+        return space.purchaseable and space.owner is None and player.money - space.cost >= self.reserve
+
+    # the next space to put a house (or hotel) on, None when done building this turn
+    def nextBuild(self, game: Game, player: Player) -> Space | None:
+        for space in sorted(player.ownedSpaces, key=lambda s: s.houses):
+            if space.color not in player.sets or space.hotel or space.mortgaged:
+                continue
+            if player.money - space.house_cost < self.reserve:
+                continue
+            if space.houses == 4 and player.canBuyHotel(space):
+                return space
+            if player.canBuyHouse(space):
+                return space
+        return None
+
+    # spaces to mortgage, in order, when the player is in debt
+    def toMortgage(self, game: Game, player: Player) -> list[Space]:
+        return sorted(
+            (space for space in player.ownedSpaces if not space.mortgaged and not space.houses and not space.hotel),
+            key=lambda s: s.cost,
+        )
+
+
+    # called before the first decision, a strategy that needs more than the game state precomputes it here.
+    # bots (see bots.py) run it in a thread and decide with whatever is ready when their time budget is up
+    def prepare(self, game: Game):
+        pass
+
+    def ready(self, game: Game) -> bool:
+        return True
+
+    # what having the space is worth to the player, auctions and trades are judged by it
+    def worth(self, game: Game, player: Player, space: Space) -> float:
+        return space.cost
+
+    # the most the player bids for a space in an auction
+    def bidLimit(self, game: Game, player: Player, space: Space) -> int:
+        return min(int(self.worth(game, player, space)), player.money - self.reserve)
+
+    # what the recipient of a trade comes out ahead by
+    def tradeGain(self, game: Game, player: Player, trade: Trade) -> float:
+        gain = (trade.give.get("money") or 0) - (trade.want.get("money") or 0)
+        for side, sign in ((trade.give, 1), (trade.want, -1)):
+            for id in side.get("properties", []):
+                if space := game.board.getSpaceById(id):
+                    gain += sign * self.worth(game, player, space)
+        return gain
+
+    def acceptsTrade(self, game: Game, player: Player, trade: Trade) -> bool:
+        return self.tradeGain(game, player, trade) > 0 and player.money - (trade.want.get("money") or 0) >= self.reserve
+
+    # the player is the one asked to lend
+    def acceptsLoan(self, game: Game, player: Player, loan: Loan) -> bool:
+        return loan.interest > 0 and player.money - loan.amount >= self.reserve
+
+
+class GreedyPolicy(Policy):
+    """buys and builds whatever it can pay for"""
+
+    name = "greedy"
+    reserve = 0
+
+    def wantsToBuy(self, game: Game, player: Player, space: Space) -> bool:
+        return space.purchaseable and space.owner is None and player.money >= space.cost
+
+
+class SetCompleterPolicy(Policy):
+    """values a space by how close it gets the player to a set, and pays up for the one that finishes it"""
+
+    name = "set-completer"
+    reserve = 100
+
+    # how far worth moves off the price for a space that finishes a set, and for one an opponent blocks
+    completes: float = 2.5
+    blocked: float = 0.75
+
+    def holding(self, game: Game, player: Player, space: Space) -> tuple[int, int]:
+        """how many of the space's color the player and everyone else own, not counting the space itself"""
+        mine = others = 0
+        for other in game.board.spaces:
+            if other is space or other.color != space.color or other.owner is None:
+                continue
+            if other.owner is player:
+                mine += 1
+            else:
+                others += 1
+        return mine, others
+
+    def completesSet(self, game: Game, player: Player, space: Space) -> bool:
+        if not space.color or not space.set_size:
+            return False
+        mine, others = self.holding(game, player, space)
+        return not others and mine + 1 >= space.set_size
+
+    def worth(self, game: Game, player: Player, space: Space) -> float:
+        if space.spaceType == ST_RAILROAD:
+            return space.cost * (1 + 0.25 * player.getOwnedRailroads())
+        if not space.color or not space.set_size:
+            return space.cost
+        mine, others = self.holding(game, player, space)
+        if others:
+            return space.cost * self.blocked
+        if mine + 1 >= space.set_size:
+            return space.cost * self.completes
+        return space.cost * (1 + mine / space.set_size)
+
+    def wantsToBuy(self, game: Game, player: Player, space: Space) -> bool:
+        if not space.purchaseable or space.owner is not None or player.money < space.cost:
+            return False
+        if self.completesSet(game, player, space):
+            return True
+        return self.worth(game, player, space) >= space.cost and player.money - space.cost >= self.reserve
+
+
+class ValuationPolicy(SetCompleterPolicy):
+    """
+    values a space by the rent it is expected to bring in (markov.py's landing odds) over the next turns,
+    and plays like set-completer until that is worked out or if numpy is missing
+    """
+
+    name = "valuation"
+    reserve = 200
+    # opponent turns a space is expected to earn over
+    horizon: int = 40
+    # the odds put on getting a set someone else already has a piece of
+    longShot: float = 0.1
+
+    # (board, dice sides) -> space id -> expected rent per opponent turn at each level, railroads and
+    # utilities under "owned:<n>", shared by every player with this policy
+    rents: dict[tuple[str, int], dict[Any, dict[str, float]]] = {}
+
+    def prepare(self, game: Game):
+        key = (game.board.boardName, game.dSides)
+        if key in self.rents:
+            return
+        try:
+            from markov import analyzeBoard
+
+            analysis = analyzeBoard(game.board.boardName, game.boards_path, game.dSides)
+        except Exception as e:
+            print(f"valuation cannot analyze {key[0]}: {e!r}")
+            self.rents[key] = {}
+            return
+        rents: dict[Any, dict[str, float]] = {p["id"]: p["expectedRent"] for p in analysis["properties"]}
+        for kind in ("railroads", "utilities"):
+            byOwned = analysis[kind]["expectedRentByOwned"]
+            for id in analysis[kind]["spaces"]:
+                rents[id] = {f"owned:{n}": rent / int(n) for n, rent in byOwned.items()}
+        self.rents[key] = rents
+
+    def ready(self, game: Game) -> bool:
+        return (game.board.boardName, game.dSides) in self.rents
+
+    def worth(self, game: Game, player: Player, space: Space) -> float:
+        rents = self.rents.get((game.board.boardName, game.dSides), {}).get(space.id)
+        if not rents:
+            return super().worth(game, player, space)
+        if space.spaceType == ST_RAILROAD:
+            perTurn = rents.get(f"owned:{player.getOwnedRailroads() + 1}", 0)
+        elif space.spaceType == ST_UTILITY:
+            perTurn = rents.get(f"owned:{len(player.getUtilities()) + 1}", 0)
+        else:
+            # the rent it brings once built up to three houses, by the odds the player ever gets the set
+            mine, others = self.holding(game, player, space)
+            chance = 1 if not others and mine + 1 >= space.set_size else self.longShot if others else (mine + 1) / space.set_size
+            perTurn = rents["base"] + chance * rents["house3"]
+        # a space can always be mortgaged for half of what it cost
+        return space.cost / 2 + perTurn * max(len(game.activePlayers) - 1, 1) * self.horizon
+
+
+policies: dict[str, type[Policy]] = {
+    "scripted": Policy,
+    GreedyPolicy.name: GreedyPolicy,
+    SetCompleterPolicy.name: SetCompleterPolicy,
+    ValuationPolicy.name: ValuationPolicy,
+}
+
+
+class QuietGame(Game):
+    """a Game with nobody to send state to, so it never builds the state messages"""
+
+    def updatedState(self):
+        # still drained, or they would only ever grow
+        self.ledger.takeClosed()
+        self.tradebook.takeClosed()
+        return []
+
+    def turnEnded(self, prevPlayer: Player):
+        return []
+
+
+class HeadlessGame:
+    game: Game
+    policies: dict[player_t, Policy]
+    maxTurns: int
+    turn: int
+    # player id -> the turn they went bankrupt on
+    bankruptTurns: dict[player_t, int]
+    # how much the moving player's cash changed each turn
+    cashFlow: list[int]
+
+    def __init__(self, boardname: str, players: list[Policy], maxTurns: int = 1000, seed: int | None = None):
+        self.game = QuietGame(boardname, seed=seed)
+        self.policies = {}
+        for i, policy in enumerate(players):
+            player = Player(str(i), i, NullClient())
+            player.name = f"{policy.name} {i}"
+            player.gameid = self.game.id
+            self.policies[player.id] = policy
+            self.game.addPlayer(player)
+            policy.prepare(self.game)
+        self.game.started = True
+
+        self.maxTurns = maxTurns
+        self.turn = 0
+        self.bankruptTurns = {}
+        self.cashFlow = []
+
+    def act(self, player: Player, action: str, **kwargs: Any) -> list[Any]:
+        return [value for _, value in self.game.dispatch({"action": action, **kwargs}, player)]
+
+    def playTurn(self):
+        game = self.game
+        player = game.curPlayer
+        policy = self.policies[player.id]
+        before = player.money
+
+        self.act(player, "roll")
+        if player.space and policy.wantsToBuy(game, player, player.space):
+            self.act(player, "buy", spaceid=player.space.id)
+
+        while space := policy.nextBuild(game, player):
+            money = player.money
+            self.act(player, "buy-hotel" if space.houses == 4 else "buy-house", spaceid=space.id)
+            if player.money == money:
+                break
+
+        if player.money < 0:
+            for space in policy.toMortgage(game, player):
+                self.act(player, "mortgage", spaceid=space.id)
+                if player.money >= 0:
+                    break
+
+        self.cashFlow.append(player.money - before)
+        if player.money < 0:
+            self.bankruptTurns[player.id] = self.turn
+            # bankrupt takes the player out of the turn order, so the next player is already up
+            self.act(player, "bankrupt")
+        else:
+            self.act(player, "end-turn")
+        self.turn += 1
+
+    def play(self) -> dict[str, Any]:
+        game = self.game
+        try:
+            while len(game.activePlayers) > 1 and self.turn < self.maxTurns:
+                self.playTurn()
+        finally:
+            removegame(game.id)
+
+        finished = len(game.activePlayers) == 1
+        winner = max(game.activePlayers, key=lambda p: p.money + p.propertyWorth)
+        return {
+            "winner": winner.id,
+            "strategy": self.policies[winner.id].name,
+            "finished": finished,
+            "turns": self.turn,
+            "bankruptTurns": self.bankruptTurns,
+            "cashFlow": self.cashFlow,
+            "finalMoney": {p.id: p.money for p in game.players.values()},
+        }
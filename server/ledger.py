@@ -0,0 +1,117 @@
+"""
+the loans of a game: the live ones by id, a heap of what each accepted loan does on which of its loanee's
+turns, and a compact history of the ones that were settled or declined
+"""
+import heapq
+from typing import TYPE_CHECKING, Generator
+
+from loan import Loan
+from monopolytypes import player_t
+from status import DUE_LOAN, status_t
+
+if TYPE_CHECKING:
+    from player import Player
+
+# what a loan does when it comes up, within one turn they run in this order
+EV_COMPOUND = 0
+EV_PAY_TURN = 1
+EV_DEADLINE = 2
+
+type event_t = tuple[int, int, int, float]  # (loanee's turn, event, order, loan id)
+
+
+class Ledger:
+    # proposed and accepted loans
+    loans: dict[float, Loan]
+    # loanee id -> heap of event_t, events of closed loans are skipped when they come up
+    schedule: dict[player_t, list[event_t]]
+    # (id, loaner id or None for the bank, loanee id, amount, status)
+    history: list[tuple[float, player_t | None, player_t, int, str]]
+    # closed since the last state patch, they go out once more so clients see how they ended
+    closed: list[Loan]
+    # breaks ties between events on the same turn, so they run in the order they were scheduled
+    order: int
+
+    def __init__(self):
+        self.loans = {}
+        self.schedule = {}
+        self.history = []
+        self.closed = []
+        self.order = 0
+
+    def get(self, id: float) -> Loan | None:
+        return self.loans.get(id)
+
+    def add(self, loan: Loan):
+        self.loans[loan.id] = loan
+
+    def push(self, loan: Loan, turn: int, event: int):
+        self.order += 1
+        heapq.heappush(self.schedule.setdefault(loan.loanee.id, []), (turn, event, self.order, loan.id))
+
+    def accept(self, loan: Loan):
+        """starts the loan's clock, the money has to have changed hands already"""
+        loan.status = "accepted"
+        loan.startTurn = loan.loanee.turns
+        self.scheduleLoan(loan)
+
+    # (re)builds the events of an accepted loan from where its clock is
+    def scheduleLoan(self, loan: Loan):
+        turn = loan.loanee.turns
+        if loan.interestType == "compound":
+            self.push(loan, turn + 1, EV_COMPOUND)
+        if loan.type == "per-turn" and loan.amountPerTurn:
+            self.push(loan, turn + 1, EV_PAY_TURN)
+        if loan.deadline:
+            assert loan.startTurn is not None, f"loan {loan.id} is scheduled but was never accepted"
+            self.push(loan, max(loan.startTurn + loan.deadline + 1, turn + 1), EV_DEADLINE)
+
+    def close(self, loan: Loan, status: str):
+        loan.status = status
+        self.loans.pop(loan.id, None)
+        if loan in loan.loanee.loans:
+            loan.loanee.loans.remove(loan)
+            loan.loanee.markDirty()
+        self.history.append((loan.id, loan.loaner.id if loan.loaner else None, loan.loanee.id, loan.amount, status))
+        self.closed.append(loan)
+
+    def takeClosed(self):
+        closed, self.closed = self.closed, []
+        return closed
+
+    def settleIfPaid(self, loan: Loan):
+        if loan.totalOwed <= 0 and loan.id in self.loans:
+            loan.loanee.increaseCreditScore(loan.amount)
+            self.close(loan, "settled")
+
+    def onTurn(self, player: "Player") -> Generator[status_t]:
+        """advances the player's loan clock by a turn and runs whatever fell due"""
+        player.turns += 1
+        # their turnsPassed counts off the player's turns, the loan itself is never assigned to
+        for loan in player.loans:
+            if loan.status == "accepted":
+                loan.markDirty()
+        heap = self.schedule.get(player.id)
+        while heap and heap[0][0] <= player.turns:
+            turn, event, _, id = heapq.heappop(heap)
+            loan = self.loans.get(id)
+            if loan is None:
+                continue
+            if event == EV_COMPOUND:
+                loan.compound()
+                self.push(loan, turn + 1, EV_COMPOUND)
+            elif event == EV_PAY_TURN:
+                loan.payTurnAmount()
+                if player.money < 0:
+                    player.inDebtTo = loan.loaner
+                    player.creditScore -= 100
+                if loan.totalOwed > 0:
+                    self.push(loan, turn + 1, EV_PAY_TURN)
+                self.settleIfPaid(loan)
+            elif event == EV_DEADLINE:
+                player.payLoan(loan, loan.totalOwed)
+                player.creditScore -= 100
+                yield DUE_LOAN(loan.id, player.id)
+                # paying it off in full settles it, without the credit score bump of paying on time
+                if loan.totalOwed <= 0:
+                    self.close(loan, "settled")
@@ -1,14 +1,14 @@
 from typing import TYPE_CHECKING
-import random
 
 from monopolytypes import *
 from gameregistry import *
+from tracking import Tracked
 
 if TYPE_CHECKING:
     from player import Player
 
 
-class Loan:
+class Loan(Tracked):
     id: float
     type: str  # deadline | per-turn
     amountPerTurn: int
@@ -16,8 +16,9 @@ class Loan:
     amount: int
     interest: int
     interestType: str  # simple | compound
-    status: str  # declined | accepted | proposed
-    turnsPassed: int
+    status: str  # declined | accepted | proposed | settled
+    # the loanee's Player.turns when the loan was accepted, None until then
+    startTurn: int | None
     gameid: gameid_t
 
     totalOwed: int
@@ -37,7 +38,6 @@ class Loan:
         amountPerTurn: int = 0,
         deadline: int = 0,
     ) -> None:
-        self.id = random.random()
         self.gameid = gameid
         self.type = type
         self.amount = amount
@@ -48,12 +48,14 @@ class Loan:
         self.amountPerTurn = amountPerTurn
         self.deadline = deadline
 
-        self.turnsPassed = 0
+        self.startTurn = None
 
         game = getgame(self.gameid)
 
         assert game, f"game (id = {self.gameid}) is undefined"
 
+        self.id = game.rng.random()
+
         self.loaner = game.getplayer(loaner) if loaner != "Bank" else None
         self.loanee = game.getplayer(loanee)
 
@@ -61,6 +63,12 @@ class Loan:
         if self.type == "simple":
             self.totalOwed = round(self.totalOwed * (1 + (interest / 100)))
 
+    @property
+    def turnsPassed(self):
+        if self.startTurn is None:
+            return 0
+        return self.loanee.turns - self.startTurn
+
     def compound(self):
         if self.interestType == "simple":
             return
@@ -0,0 +1,311 @@
+"""
+landing probabilities and expected rent for a board file, solved as a markov chain instead of simulated
+
+    python server/markov.py main
+
+run from the repository root so ./boards resolves. the chain follows the rules the handlers implement:
+a turn is one roll with no extra turn for doubles, go to jail sends the player to the first jail,
+a chance card is drawn with replacement and may move the player again, and a jailed player
+gets 3 tries at doubles (or unlimited tries at 9+ if the jail is owned) without moving that turn.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from typing import Any
+
+import numpy as np
+
+from board import ST_CHANCE, ST_GOTO_JAIL, ST_JAIL, ST_PROPERTY, ST_RAILROAD, ST_UTILITY, Chance, Space, str2spacetype
+from boardbuilder import buildFromFile, chanceFile, loadChance
+
+# a chance card may send the player somewhere that draws another card, stop following after this many
+MAX_CHAIN = 4
+
+# rent levels of a property, in the order they are built
+LEVELS = ("base", "set", "house1", "house2", "house3", "house4", "hotel")
+
+# same table as generic.onrent_railroad
+RAILROAD_RENT = {1: 25, 2: 50, 3: 100, 4: 100}
+
+cacheDir = os.environ.get("MONOPOLY_CACHE", ".cache") + "/analysis"
+_cache: dict[str, dict[str, Any]] = {}
+
+
+def diceDistribution(dSides: int):
+    """probability of each total of two dice, indexed by total, and the chance of doubles"""
+    totals = np.zeros(2 * dSides + 1)
+    faces = np.arange(1, dSides + 1)
+    np.add.at(totals, np.add.outer(faces, faces).ravel(), 1 / dSides**2)
+    return totals, 1 / dSides
+
+
+class Chain:
+    spaces: list[Space]
+    cards: list[Chance]
+    byName: dict[str, list[int]]
+    jail: int | None
+    # states 0..n-1 are the spaces, n.. are "in jail with k tries left"
+    n: int
+    jailStates: int
+
+    def __init__(self, spaces: list[Space], cards: list[Chance], dSides: int = 6, jailOwned: bool = False):
+        self.spaces = spaces
+        self.cards = cards
+        self.n = len(spaces)
+        self.byName = {}
+        for i, space in enumerate(spaces):
+            self.byName.setdefault(space.name.lower(), []).append(i)
+        jails = [i for i, space in enumerate(spaces) if space.spaceType == ST_JAIL]
+        self.jail = jails[0] if jails else None
+        # an owned jail never runs out of tries, so one state is enough
+        self.jailStates = 0 if self.jail is None else (1 if jailOwned else 3)
+        self.dSides = dSides
+        self.jailOwned = jailOwned
+
+    @property
+    def size(self):
+        return self.n + self.jailStates
+
+    def landingDistribution(self, i: int, depth: int = 0) -> dict[int, float]:
+        """where a player who lands on space i ends up, as state -> probability"""
+        space = self.spaces[i]
+        if space.spaceType == ST_GOTO_JAIL and self.jail is not None:
+            return {self.n: 1}
+        if space.spaceType != ST_CHANCE or not self.cards or depth >= MAX_CHAIN:
+            return {i: 1}
+
+        outcome: dict[int, float] = {}
+        for card in self.cards:
+            for state, p in self.cardDistribution(i, card, depth).items():
+                outcome[state] = outcome.get(state, 0) + p / len(self.cards)
+        return outcome
+
+    # mirrors Board.executeChanceCard
+    def cardDistribution(self, i: int, card: Chance, depth: int) -> dict[int, float]:
+        match card.type:
+            case "move":
+                # Board.move walks range(amount), so a negative amount lands on the same space again
+                amount = max(int(card.data), 0)
+                return self.landingDistribution((i + amount) % self.n, depth + 1)
+            case "teleport":
+                name = card.data.lower().strip()
+                if name not in self.byName:
+                    return {i: 1}
+                n = 1
+                if match := re.match(r"n=(\d+)", name):
+                    n = int(match.group(1))
+                    name = name.replace(match.group(0), "").strip()
+                spaces = self.byName.get(name, [])
+                if not 0 < n <= len(spaces):
+                    return {i: 1}
+                return self.landingDistribution(spaces[n - 1], depth + 1)
+            case "teleport-next-type":
+                ty = str2spacetype(card.data)
+                for step in range(1, self.n + 1):
+                    j = (i + step) % self.n
+                    if self.spaces[j].spaceType == ty:
+                        return self.landingDistribution(j, depth + 1)
+                return {i: 1}
+            case _:
+                return {i: 1}
+
+    def matrices(self):
+        """
+        the turn to turn transition matrix over every state,
+        and the matrix of where each state's turn lands (rows are states, columns are spaces)
+        """
+        n = self.n
+        totals, doubles = diceDistribution(self.dSides)
+
+        # roll[i, j]: chance of rolling from space i straight onto space j
+        roll = np.zeros((n, n))
+        rows = np.arange(n)
+        for total in np.nonzero(totals)[0]:
+            np.add.at(roll, (rows, (rows + total) % n), totals[total])
+
+        # resolve[j, s]: chance that landing on space j leaves the player in state s
+        resolve = np.zeros((n, self.size))
+        for j in range(n):
+            for state, p in self.landingDistribution(j).items():
+                resolve[j, state] += p
+
+        transition = np.zeros((self.size, self.size))
+        transition[:n] = roll @ resolve
+
+        # a turn ends on the space the player rests on, going to jail ends on the jail
+        landing = np.zeros((self.size, n))
+        landing[:n] = transition[:n, :n]
+        if self.jail is not None:
+            landing[:n, self.jail] += transition[:n, n:].sum(axis=1)
+
+            # in jail the player does not move, they either leave (and sit on the jail) or try again next turn
+            escape = doubles if not self.jailOwned else totals[9:].sum()
+            for k in range(self.jailStates):
+                state = n + k
+                if self.jailOwned:
+                    transition[state, self.jail] = escape
+                    transition[state, state] = 1 - escape
+                elif k == self.jailStates - 1:
+                    transition[state, self.jail] = 1
+                else:
+                    transition[state, self.jail] = escape
+                    transition[state, state + 1] = 1 - escape
+
+        return transition, landing
+
+    def stationary(self, transition: np.ndarray):
+        # solve pi @ P = pi with sum(pi) = 1 by swapping one equation for the normalization
+        size = transition.shape[0]
+        a = transition.T - np.eye(size)
+        a[-1] = 1
+        b = np.zeros(size)
+        b[-1] = 1
+        return np.linalg.solve(a, b)
+
+
+def propertyRents(space: Space) -> dict[str, int]:
+    attrs = space.attrs
+    return {
+        "base": attrs.get("rent", 0),
+        "set": attrs.get("rent", 0) * 2,
+        **{f"house{n}": attrs.get(f"house{n}", 0) for n in range(1, 5)},
+        "hotel": attrs.get("hotel", 0),
+    }
+
+
+# what owning a set costs up to a level: the spaces, then houses, then hotels (bought at the house cost, see Player.buyHotel)
+def setInvestment(spaces: list[Space], level: str):
+    cost = sum(space.cost for space in spaces)
+    houses = {"base": 0, "set": 0, "hotel": 5}.get(level)
+    if houses is None:
+        houses = int(level.removeprefix("house"))
+    return cost + houses * sum(space.house_cost for space in spaces)
+
+
+def analyze(spaces: list[Space], cards: list[Chance], dSides: int = 6, jailOwned: bool = False) -> dict[str, Any]:
+    chain = Chain(spaces, cards, dSides, jailOwned)
+    transition, landing = chain.matrices()
+    pi = chain.stationary(transition)
+    # chance that one opponent turn lands on each space
+    land = pi @ landing
+    totals, _ = diceDistribution(dSides)
+    expectedRoll = float(np.arange(len(totals)) @ totals)
+
+    properties = []
+    sets: dict[str, list[Space]] = {}
+    for i, space in enumerate(spaces):
+        if space.spaceType == ST_PROPERTY and space.purchaseable:
+            rents = propertyRents(space)
+            properties.append({
+                "id": i,
+                "name": space.name,
+                "color": space.color,
+                "cost": space.cost,
+                "expectedRent": {level: float(land[i] * rents[level]) for level in LEVELS},
+            })
+            if space.color:
+                sets.setdefault(space.color, []).append(space)
+
+    railroads = [i for i, space in enumerate(spaces) if space.spaceType == ST_RAILROAD]
+    utilities = [i for i, space in enumerate(spaces) if space.spaceType == ST_UTILITY]
+
+    setReturns = []
+    for color, setSpaces in sets.items():
+        ids = [spaces.index(space) for space in setSpaces]
+        levels = {}
+        for level in LEVELS[1:]:
+            income = float(sum(land[i] * propertyRents(spaces[i])[level] for i in ids))
+            investment = setInvestment(setSpaces, level)
+            levels[level] = {
+                "investment": investment,
+                "incomePerOpponentTurn": income,
+                "roi": income / investment if investment else 0,
+                "paybackTurns": investment / income if income else None,
+            }
+        setReturns.append({"color": color, "spaces": ids, "levels": levels})
+    setReturns.sort(key=lambda s: s["levels"]["hotel"]["roi"], reverse=True)
+
+    return {
+        "dSides": dSides,
+        "jailOwned": jailOwned,
+        "landing": [{"id": i, "name": space.name, "probability": float(land[i])} for i, space in enumerate(spaces)],
+        "inJail": float(pi[chain.n:].sum()),
+        "properties": properties,
+        # income per opponent turn from owning that many of them, the count is a string key so
+        # the analysis is the same fresh as from the json cache, and every encoder takes it
+        "railroads": {
+            "spaces": railroads,
+            "expectedRentByOwned": {
+                str(owned): float(land[railroads].mean() * owned * rent) for owned, rent in RAILROAD_RENT.items()
+            } if railroads else {},
+        },
+        "utilities": {
+            "spaces": utilities,
+            "expectedRentByOwned": {
+                str(owned): float(land[utilities].mean() * owned * owned * expectedRoll) for owned in range(1, len(utilities) + 1)
+            },
+        },
+        "sets": setReturns,
+    }
+
+
+def fileHash(*paths: str, extra: str = ""):
+    h = hashlib.sha256(extra.encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def analyzeBoard(boardname: str, boardsPath: str = "./boards", dSides: int = 6, jailOwned: bool = False, useDisk: bool = True) -> dict[str, Any]:
+    """the analysis for boards/<boardname>.json, cached by the hash of the board and chance files"""
+    boardFile = f"{boardsPath}/{boardname}.json"
+    cardsFile = chanceFile(boardsPath, boardname)
+    key = fileHash(boardFile, cardsFile, extra=f"{dSides}:{jailOwned}")
+    if key in _cache:
+        return _cache[key]
+
+    path = f"{cacheDir}/{key}.json"
+    if useDisk and os.path.isfile(path):
+        with open(path) as f:
+            result = json.load(f)
+    else:
+        start = buildFromFile(0, boardFile)
+        result = {"board": boardname, "hash": key, **analyze(list(start.iterSpaces()), loadChance(cardsFile), dSides, jailOwned)}
+        if useDisk:
+            os.makedirs(cacheDir, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(result, f)
+    _cache[key] = result
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("board", nargs="?", default="main")
+    parser.add_argument("--sides", type=int, default=6)
+    parser.add_argument("--jail-owned", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print the whole analysis as json")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    result = analyzeBoard(args.board, dSides=args.sides, jailOwned=args.jail_owned, useDisk=not args.no_cache)
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        return
+
+    print(f"{'space':<24} {'landing':>8}")
+    for space in sorted(result["landing"], key=lambda s: s["probability"], reverse=True)[:10]:
+        print(f"{space['name']:<24} {space['probability']:>8.2%}")
+    print(f"in jail {result['inJail']:.2%} of turns\n")
+    print(f"{'set':<10} {'hotel roi/turn':>15} {'payback turns':>14}")
+    for s in result["sets"]:
+        hotel = s["levels"]["hotel"]
+        print(f"{s['color']:<10} {hotel['roi']:>15.4%} {hotel['paybackTurns'] or 0:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+in-process metrics served in the prometheus text format
+
+    curl http://127.0.0.1:9100/metrics
+
+everything is plain counters and fixed bucket histograms, so recording is a few additions
+"""
+import asyncio
+import bisect
+import time
+from typing import Any, Callable
+
+# seconds, from 50us to 2.5s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+class Histogram:
+    bounds: tuple[float, ...]
+    counts: list[int]
+    sum: float
+    count: int
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        # the last slot is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str):
+        sep = "," if labels else ""
+        cumulative = 0
+        for bound, n in zip(self.bounds, self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}'
+        labels = f"{{{labels}}}" if labels else ""
+        yield f"{name}_sum{labels} {self.sum}"
+        yield f"{name}_count{labels} {self.count}"
+
+
+class Family:
+    """one metric name split by a single label"""
+
+    name: str
+    help: str
+    kind: str  # counter | histogram
+    label: str
+    values: dict[str, Any]
+
+    def __init__(self, name: str, help: str, kind: str, label: str = ""):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label = label
+        self.values = {}
+
+    def inc(self, key: str = "", amount: float = 1):
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def observe(self, key: str, value: float):
+        if (h := self.values.get(key)) is None:
+            h = self.values[key] = Histogram()
+        h.observe(value)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for key, value in sorted(self.values.items()):
+            labels = f'{self.label}="{key}"' if self.label else ""
+            if self.kind == "histogram":
+                yield from value.render(self.name, labels)
+            else:
+                yield f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}"
+
+
+class Metrics:
+    actionCalls: Family
+    actionErrors: Family
+    handlerTime: Family
+    serializeTime: Family
+    fanoutTime: Family
+    sendLatency: Family
+    loopLag: Family
+    timerLag: Family
+    # name -> (help, function returning the current value)
+    gauges: dict[str, tuple[str, Callable[[], float]]]
+
+    def __init__(self):
+        self.actionCalls = Family("monopoly_action_calls_total", "actions handled", "counter", "action")
+        self.actionErrors = Family("monopoly_action_errors_total", "actions whose handler raised", "counter", "action")
+        self.handlerTime = Family("monopoly_action_handler_seconds", "time spent in the action handler", "histogram", "action")
+        self.serializeTime = Family("monopoly_action_serialize_seconds", "time spent encoding the action's messages", "histogram", "action")
+        self.fanoutTime = Family("monopoly_action_fanout_seconds", "time spent queueing the action's messages for clients", "histogram", "action")
+        self.sendLatency = Family("monopoly_send_latency_seconds", "time from queueing a frame to the socket taking it", "histogram", "policy")
+        self.loopLag = Family("monopoly_event_loop_lag_seconds", "how late the event loop wakes a sleeping task", "histogram")
+        self.timerLag = Family("monopoly_timer_lag_seconds", "how late a game deadline fired", "histogram")
+        self.gauges = {}
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]):
+        self.gauges[name] = (help, fn)
+
+    def render(self):
+        lines = []
+        for family in (self.actionCalls, self.actionErrors, self.handlerTime, self.serializeTime, self.fanoutTime, self.sendLatency, self.loopLag, self.timerLag):
+            lines.extend(family.render())
+        for name, (help, fn) in self.gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {fn()}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+async def watchLoopLag(interval: float = 0.25):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        metrics.loopLag.observe("", max(loop.time() - start - interval, 0))
+
+
+async def handleHttp(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await reader.readline()
+        # the headers are not needed, but they have to be read
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.split()
+        if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", metrics.render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serveMetrics(host: str = "127.0.0.1", port: int = 9100):
+    asyncio.create_task(watchLoopLag())
+    return await asyncio.start_server(handleHttp, host, port)
+
+
+def now():
+    return time.perf_counter()
@@ -1,18 +1,35 @@
 from typing import TYPE_CHECKING, override, Self
 
 import math
-import random
+import os
 
 from status import PAY_OTHER
 
 from board import *
+from tracking import Tracked
 
 if TYPE_CHECKING:
     from client import Client
     from trade import Trade
     from loan import Loan
 
-class Player:
+# MONOPOLY_CHECK_INDEXES=1 rebuilds every player's indexes after each action and compares, see Player.checkIndexes
+CHECK_INDEXES = os.environ.get("MONOPOLY_CHECK_INDEXES") == "1"
+
+
+# what a space adds to Player.propertyWorth
+def spaceWorth(space: "Space"):
+    if space.mortgaged:
+        return 0
+    worth = space.cost // 2
+    if space.houses != 0:
+        worth += int(space.house_cost * space.houses / 2)
+    if space.hotel:
+        worth += int(space.hotel_cost / 2)
+    return worth
+
+
+class Player(Tracked):
     client: "Client"
     money: int
     id: str
@@ -24,11 +41,17 @@ class Player:
     space: "Space | None"
     piece: str
     lastRoll: int
+    # how many times the player has rolled, loans count their turns off it (see ledger.py)
+    turns: int
     bankrupt: bool
     inDebtTo: "Player | None"
     creditScore: int
     color: str
     host: bool
+    # where the player connected from, so they can reconnect to a game restored after a restart
+    address: str | None
+    # the token a reconnecting client resumes its seat with, see Game.resume
+    session: str | None
 
     inJail: bool
     jailDoublesRemaining: int
@@ -37,6 +60,15 @@ class Player:
 
     gameid: float
 
+    # indexes over ownedSpaces so the ownership queries don't rescan it,
+    # every change to ownership, buildings or mortgages goes through _addSpace/_removeSpace or _account
+    _colorSpaces: dict[str, list["Space"]]
+    _typeSpaces: dict[spacetype_t, list["Space"]]
+    # color -> how many owned spaces of that color have 0..4 houses, and how many have a hotel
+    _houseLevels: dict[str, list[int]]
+    _hotels: dict[str, int]
+    _worth: int
+
     JAIL_FAIL: int = 0
     JAIL_ESCAPE: int = 1
     JAIL_FORCE_LEAVE: int = -1
@@ -46,6 +78,11 @@ class Player:
         self.id = id
         self.playerNumber = playerNumber
         self.ownedSpaces = []
+        self._colorSpaces = {}
+        self._typeSpaces = {}
+        self._houseLevels = {}
+        self._hotels = {}
+        self._worth = 0
         self.name = "Timmy 3 (You were the third Timmy!)"
         # this is PIECE
         self.piece = "PIECE"
@@ -54,14 +91,18 @@ class Player:
         self.bankrupt = False
         self.sets = []
         self.lastRoll = 0
+        self.turns = 0
         self.inJail = False
         self.jailDoublesRemaining = 3
         self.loans = []
         self.inDebtTo = None
         self.gameid = 0
-        self.color = f"#{random.randint(180, 255):x}{random.randint(180, 255):x}{random.randint(180, 255):x}"
+        # picked from the game's rng when the player is added, see Game.addPlayer
+        self.color = "#ffffff"
         self.creditScore = 300
         self.host = False
+        self.address = None
+        self.session = None
 
     @override
     def __str__(self):
@@ -69,26 +110,55 @@ class Player:
 
     @property
     def propertyWorth(self):
-        propertyWorth = 0
-        for space in self.ownedSpaces:
-            if not space.mortgaged:
-                propertyWorth += space.cost // 2
+        return self._worth
 
-                if space.houses != 0:
-                    propertyWorth += int(space.house_cost * space.houses / 2)
+    # adds (sign=1) or takes back (sign=-1) what a space's buildings and mortgage put in the indexes,
+    # changing the houses, hotel or mortgage of an owned space is _account(space, -1), change it, _account(space, 1)
+    def _account(self, space: "Space", sign: int):
+        # colorless spaces (railroads, utilities) count under "", hasSet has always counted them that way
+        self._houseLevels.setdefault(space.color, [0] * 5)[space.houses] += sign
+        self._hotels[space.color] = self._hotels.get(space.color, 0) + sign * space.hotel
+        self._worth += sign * spaceWorth(space)
 
-                if space.hotel:
-                    propertyWorth += int(space.hotel_cost / 2)
-
-        return propertyWorth
+    def _addSpace(self, space: "Space"):
+        self.ownedSpaces.append(space)
+        space.owner = self
+        self._colorSpaces.setdefault(space.color, []).append(space)
+        self._typeSpaces.setdefault(space.spaceType, []).append(space)
+        self._account(space, 1)
+
+    def _removeSpace(self, space: "Space"):
+        self.ownedSpaces.remove(space)
+        self._colorSpaces[space.color].remove(space)
+        self._typeSpaces[space.spaceType].remove(space)
+        self._account(space, -1)
+
+    def checkIndexes(self):
+        """asserts the indexes match a rescan of ownedSpaces"""
+        colors: dict[str, list[Space]] = {}
+        types: dict[spacetype_t, list[Space]] = {}
+        levels: dict[str, list[int]] = {}
+        hotels: dict[str, int] = {}
+        for space in self.ownedSpaces:
+            assert space.owner is self, f"{self} has {space.name} in ownedSpaces but it is owned by {space.owner}"
+            colors.setdefault(space.color, []).append(space)
+            levels.setdefault(space.color, [0] * 5)[space.houses] += 1
+            hotels[space.color] = hotels.get(space.color, 0) + space.hotel
+            types.setdefault(space.spaceType, []).append(space)
+        nonEmpty = lambda d: {k: v for k, v in d.items() if v and (not isinstance(v, list) or any(v))}
+        assert nonEmpty(colors) == nonEmpty(self._colorSpaces), f"{self} color index is off"
+        assert nonEmpty(types) == nonEmpty(self._typeSpaces), f"{self} type index is off"
+        assert nonEmpty(levels) == nonEmpty(self._houseLevels), f"{self} house index is off"
+        assert nonEmpty(hotels) == nonEmpty(self._hotels), f"{self} hotel index is off"
+        worth = sum(spaceWorth(space) for space in self.ownedSpaces)
+        assert worth == self._worth, f"{self} propertyWorth is {self._worth}, should be {worth}"
 
     def takeOwnership(self, space: Space, cost: int = 0):
         assert (
             cost <= self.money
         ), f"Cannot buy {space.name} for ${cost} because {self} only has ${self.money}"
         self.money -= cost
-        self.ownedSpaces.append(space)
-        space.owner = self
+        self._addSpace(space)
 
     def loanPlayer(self, other: Self, loan: "Loan"):
         assert (
@@ -98,20 +168,6 @@ class Player:
         self.money -= loan.amount
         other.money += loan.amount
 
-    def payTurnLoans(self):
-        for loan in self.loans:
-            if loan.type == "per-turn":
-                loan.payTurnAmount()
-                # FIXME: lets say the player has 3 loans, if the player goes bankrupt
-                # while paying the first one, the other 2 will not get paid this turn.
-                if self.money < 0:
-                    self.inDebtTo = loan.loaner
-                    self.creditScore -= 100
-                    break
-                if loan.totalOwed <= 0:
-                    self.loans.remove(loan)
-                    self.increaseCreditScore(loan.amount)
-
     def payLoan(self, loan: "Loan", amount: int):
         loan.payAmount(amount)
         if self.money < 0:
@@ -131,9 +187,9 @@ class Player:
             space = board.getSpaceById(id)
             if not space or space in other.ownedSpaces:
                 continue
-            other.ownedSpaces.append(space)
-            self.ownedSpaces.remove(space)
-            space.owner = other
+            self._removeSpace(space)
+            other._addSpace(space)
+            self.markDirty()
 
         if a := trade.give.get("money"):
             other.gain(a)
@@ -143,9 +199,9 @@ class Player:
             space = board.getSpaceById(id)
             if not space or space in self.ownedSpaces:
                 continue
-            other.ownedSpaces.remove(space)
-            self.ownedSpaces.append(space)
-            space.owner = self
+            other._removeSpace(space)
+            self._addSpace(space)
+            other.markDirty()
 
         if a := trade.want.get("money"):
             other.money -= a
@@ -222,31 +278,26 @@ class Player:
         if self.inDebtTo != None:
             self.inDebtTo.money += self.propertyWorth
 
-        for property in self.ownedSpaces:
+        for property in list(self.ownedSpaces):
+            self._removeSpace(property)
             property.owner = None
+        self.markDirty()
 
     def getUtilities(self):
-        return [space for space in self.ownedSpaces if space.spaceType == ST_UTILITY]
+        return self._typeSpaces.get(ST_UTILITY, [])
 
     def hasSet(self, color: str, necessaryForSet: int):
         if color in self.sets:
             return True
-
-        count = 0
-        for space in self.ownedSpaces:
-            if space.color == color:
-                count += 1
-                if count == necessaryForSet:
-                    return True
-        return False
+        # counting owned spaces up to necessaryForSet, a set size of 0 is never reached
+        return 0 < necessaryForSet <= len(self._colorSpaces.get(color, ()))
 
     def buy(self, space: "Space"):
         if space.cost > self.money or not space.purchaseable or space.owner:
             return BUY_FAIL(space.id)
 
         self.money -= space.cost
-        space.owner = self
-        self.ownedSpaces.append(space)
+        self._addSpace(space)
 
         if (
             space.color not in self.sets
@@ -261,14 +312,18 @@ class Player:
         if self is not space.owner or space.owner is None:
             return FAIL(self.id)
         self.gain(int(space.cost * 0.50))
+        self._account(space, -1)
         space.mortgaged = True
+        self._account(space, 1)
         return MORTGAGE_SUCCESS(self.id, space.id)
 
     def unmortgage(self, space: "Space"):
         if self is not space.owner or space.owner is None:
             return FAIL(self.id)
         self.money -= int(space.cost * 0.10)
+        self._account(space, -1)
         space.mortgaged = False
+        self._account(space, 1)
         return UNMORTGAGE_SUCCESS(self.id, space.id)
 
     def buyHouse(self, space: "Space"):
@@ -276,7 +331,9 @@ class Player:
             return BUY_HOUSE_FAIL(space.id)
 
         self.money -= space.house_cost
+        self._account(space, -1)
         space.houses += 1
+        self._account(space, 1)
         return BUY_HOUSE_SUCCESS(space.id)
 
     def buyHotel(self, space: "Space"):
@@ -284,7 +341,9 @@ class Player:
             return BUY_HOTEL_FAIL(space.id)
 
         self.money -= space.house_cost
+        self._account(space, -1)
         space.hotel = True
+        self._account(space, 1)
         return BUY_HOTEL_SUCCESS(space.id)
 
     def canBuyHouse(self, space: "Space"):
@@ -297,31 +356,28 @@ class Player:
         if space.houses == 4:
             return False
 
-        set_spaces = [s for s in self.ownedSpaces if s.color == space.color]
-        for player_space in set_spaces:
-            if space.houses > player_space.houses:
-                return False
+        # houses go up evenly, nothing in the set may have fewer than this space
+        if space.houses > self.fewestHouses(space.color):
+            return False
 
         return True
 
     def sellHouse(self, space: "Space"):
-        canSellHouse = True
-        set_spaces = [s for s in self.ownedSpaces if s.color == space.color]
-        for player_space in set_spaces:
-            if space.houses < player_space.houses or (
-                space.hotel and not player_space.hotel
-            ):
-                canSellHouse = False
-
-        if not canSellHouse:
+        # and come down evenly, a hotel only goes once the whole set has one
+        if space.houses < self.mostHouses(space.color) or (
+            space.hotel and self._hotels.get(space.color, 0) < len(self._colorSpaces.get(space.color, ()))
+        ):
             return False
 
+        self._account(space, -1)
         if space.hotel:
             space.hotel = False
-            self.gain(space.hotel_cost / 2)
+            self._account(space, 1)
+            self.gain(int(space.hotel_cost / 2))
         else:
             space.houses -= 1
-            self.gain(space.house_cost / 2)
+            self._account(space, 1)
+            self.gain(int(space.house_cost / 2))
 
     def canBuyHotel(self, space: "Space"):
         if self.money < space.house_cost:
@@ -330,33 +386,26 @@ class Player:
         if space.houses < 4:
             return False
 
-        set_spaces = [s for s in self.ownedSpaces if s.color == space.color]
-        for player_space in set_spaces:
-            if player_space.houses < 4:
-                return False
+        if self.fewestHouses(space.color) < 4:
+            return False
 
         return True
 
     def getOwnedRailroads(self):
-        number = 0
-        for space in self.ownedSpaces:
-            if space.spaceType == ST_RAILROAD:
-                number += 1
-        return number
+        return len(self._typeSpaces.get(ST_RAILROAD, ()))
 
-    def incLoanDeadline(self):
-        for loan in self.loans:
-            if not loan.deadline:
-                continue
-            loan.turnsPassed += 1
-            if loan.turnsPassed > loan.deadline:
-                yield loan
+    def ownedOfColor(self, color: str):
+        return len(self._colorSpaces.get(color, ()))
 
-    def compoundLoans(self):
-        for loan in self.loans:
-            if loan.interestType != "compound":
-                continue
-            loan.compound()
+    # the fewest and most houses on an owned space of a color,
+    # when none are owned nothing holds building back (4) or selling (0)
+    def fewestHouses(self, color: str):
+        levels = self._houseLevels.get(color, ())
+        return next((houses for houses, n in enumerate(levels) if n), 4)
+
+    def mostHouses(self, color: str):
+        levels = self._houseLevels.get(color, ())
+        return next((houses for houses in range(len(levels) - 1, -1, -1) if levels[houses]), 0)
 
     def toJson(self):
         return {
@@ -0,0 +1,105 @@
+"""
+replays a game the write-ahead log recorded, at full speed and without sockets
+
+    python server/replay.py .cache/wal/<game id>
+    python server/replay.py .cache/wal/<game id> --profile
+
+run from the repository root so ./boards resolves. the server only keeps what recovery needs unless it runs
+with MONOPOLY_WAL_KEEP=1, then every snapshot and log segment stays and the whole game can be replayed.
+the game is rebuilt from the earliest snapshot, every record after it goes through Game.handleAction,
+and the state is checked byte for byte against every later snapshot on the way.
+"""
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+from typing import Any
+
+from gameregistry import removegame
+from wal import dumpGame, readRecords, replay, restoreGame
+
+
+def encodeState(state: dict[str, Any]):
+    return json.dumps(state, sort_keys=True)
+
+
+def loadSnapshots(directory: str) -> list[dict[str, Any]]:
+    """every snapshot in the directory, oldest first, one per seq"""
+    snapshots: dict[int, dict[str, Any]] = {}
+    for name in os.listdir(directory):
+        if name.startswith("snapshot") and name.endswith(".json"):
+            with open(f"{directory}/{name}") as f:
+                snapshot = json.load(f)
+            snapshots[snapshot["seq"]] = snapshot
+    return [snapshots[seq] for seq in sorted(snapshots)]
+
+
+async def replayGame(directory: str) -> dict[str, Any]:
+    snapshots = loadSnapshots(directory)
+    assert snapshots, f"no snapshot in {directory}"
+    first, checkpoints = snapshots[0], {s["seq"]: s for s in snapshots[1:]}
+
+    game = restoreGame(first["state"])
+    records = 0
+    # seq -> the first top level key that differed, None if the state was identical
+    checks: dict[int, str | None] = {}
+    start = time.perf_counter()
+    try:
+        for record in readRecords(directory, first["seq"]):
+            await replay(game, record)
+            records += 1
+            if checkpoint := checkpoints.get(record["seq"]):
+                state = json.loads(encodeState(dumpGame(game)))
+                expected = checkpoint["state"]
+                checks[record["seq"]] = None if encodeState(state) == encodeState(expected) else next(
+                    key for key in expected if state.get(key) != expected[key]
+                )
+    finally:
+        removegame(game.id)
+    return {
+        "from": first["seq"],
+        "records": records,
+        "seconds": time.perf_counter() - start,
+        "checks": checks,
+        "state": dumpGame(game),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--profile", action="store_true", help="print where the replay spent its time")
+    parser.add_argument("--state", help="write the final state here as json")
+    args = parser.parse_args()
+
+    profile = cProfile.Profile() if args.profile else None
+    # the handlers print as they go, nobody is reading it
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if profile:
+            profile.enable()
+        result = asyncio.run(replayGame(args.directory))
+        if profile:
+            profile.disable()
+
+    rate = result["records"] / result["seconds"] if result["seconds"] else 0
+    print(f"replayed {result['records']} records after seq {result['from']} in {result['seconds'] * 1000:.1f}ms ({rate:.0f}/s)")
+    failed = {seq: key for seq, key in result["checks"].items() if key}
+    print(f"{len(result['checks']) - len(failed)}/{len(result['checks'])} snapshots matched")
+    for seq, key in failed.items():
+        print(f"  seq {seq}: {key} differs")
+
+    if args.state:
+        with open(args.state, "w") as f:
+            json.dump(result["state"], f, indent=2)
+    if profile:
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(25)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
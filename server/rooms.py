@@ -0,0 +1,182 @@
+import os
+import re
+import time
+from typing import Any
+
+from game import Game
+from gameregistry import gameid_t, getgame, listgames, removegame
+from timers import Timer, timers
+from wal import ActionLog, recoverAll
+from bots import resumeBots
+
+# seconds a game nobody is connected to is kept for its players to come back
+ROOM_IDLE = float(os.environ.get("MONOPOLY_ROOM_IDLE", "300"))
+# seconds a finished game stays open so its players see how it ended
+ROOM_FINISHED = float(os.environ.get("MONOPOLY_ROOM_FINISHED", "60"))
+# games open at once, and games one address can have open, 0 is no limit
+MAX_ROOMS = int(os.environ.get("MONOPOLY_MAX_ROOMS", "1000"))
+MAX_ROOMS_PER_ADDRESS = int(os.environ.get("MONOPOLY_MAX_ROOMS_PER_ADDRESS", "4"))
+
+
+class RoomLimitError(Exception):
+    pass
+
+
+class RoomManager:
+    # every game lives in gameregistry.registry, the manager only decides
+    # which one a connection ends up in and starts/stops the game tasks
+
+    defaultBoard: str
+    default: Game | None
+    # every game gets a write-ahead log under here (see wal.py), None keeps games in memory only
+    walDir: str | None
+    keepHistory: bool
+    maxRooms: int
+    maxRoomsPerAddress: int
+    # game id -> the address that created it, for the games created through route
+    creators: dict[gameid_t, str]
+    # game id -> when it is closed, for games that are finished or have nobody connected
+    closing: dict[gameid_t, Timer]
+
+    def __init__(
+        self,
+        defaultBoard: str = "main",
+        walDir: str | None = None,
+        keepHistory: bool = False,
+        maxRooms: int = MAX_ROOMS,
+        maxRoomsPerAddress: int = MAX_ROOMS_PER_ADDRESS,
+    ):
+        self.defaultBoard = defaultBoard
+        self.default = None
+        self.walDir = walDir
+        self.keepHistory = keepHistory
+        self.maxRooms = maxRooms
+        self.maxRoomsPerAddress = maxRoomsPerAddress
+        self.creators = {}
+        self.closing = {}
+
+    def create(self, boardname: str | None = None, creator: str | None = None) -> Game:
+        """raises RoomLimitError if there are too many games, or creator has too many"""
+        if self.maxRooms and len(listgames()) >= self.maxRooms:
+            raise RoomLimitError(f"the server already has {self.maxRooms} games")
+        if creator is not None and self.maxRoomsPerAddress:
+            if sum(1 for id, c in self.creators.items() if c == creator and getgame(id)) >= self.maxRoomsPerAddress:
+                raise RoomLimitError(f"{creator} already has {self.maxRoomsPerAddress} games open")
+        game = Game(boardname or self.defaultBoard)
+        if creator is not None:
+            self.creators[game.id] = creator
+        game.onFinish = lambda: self.closeIn(game, ROOM_FINISHED)
+        if self.walDir:
+            game.log = ActionLog(game, f"{self.walDir}/{game.id}", keepHistory=self.keepHistory)
+            # recovery needs a snapshot to start from, even for a game nobody has joined
+            game.log.snapshot()
+            game.log.start()
+        game.start()
+        if self.default is None:
+            self.default = game
+        # closed unless someone joins it
+        self.release(game)
+        return game
+
+    # brings back the games a previous process left in walDir, the ones that had finished are closed instead
+    async def recover(self) -> list[Game]:
+        if not self.walDir:
+            return []
+        games = []
+        for game in await recoverAll(self.walDir, self.keepHistory):
+            assert game.log
+            if game.finished:
+                removegame(game.id)
+                await game.log.close(remove=True)
+                continue
+            games.append(game)
+            game.onFinish = lambda game=game: self.closeIn(game, ROOM_FINISHED)
+            game.log.start()
+            game.start()
+            if game.activeAuction is not None:
+                game.startAuctionTimer()
+            game.armTurnTimer()
+            resumeBots(game)
+            # its players have ROOM_IDLE to come back
+            self.release(game)
+        if games and self.default is None:
+            self.default = games[0]
+        return games
+
+    def get(self, id: gameid_t) -> Game | None:
+        return getgame(id)
+
+    def list(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "id": game.id,
+                "board": game.board.boardName,
+                "players": len(game.activePlayers),
+                "clients": len(game.clients),
+                **game.toJson(),
+            }
+            for game in listgames()
+        ]
+
+    def connected(self, game: Game):
+        """if a person is playing or watching, bots do not count"""
+        return len(game.spectators) > 0 or any(client.bot is None for client in game.clients)
+
+    def closeIn(self, game: Game, seconds: float):
+        if game.id in self.closing:
+            self.closing.pop(game.id).cancel()
+        self.closing[game.id] = timers.at(time.time() + seconds, lambda: self.close(game.id))
+
+    def hold(self, game: Game):
+        """a connection is joining the game, it is not closed while one is"""
+        if game.id in self.closing and not game.finished:
+            self.closing.pop(game.id).cancel()
+
+    def release(self, game: Game):
+        """a connection left the game, it is closed after ROOM_IDLE if it was the last one"""
+        if not game.finished and not self.connected(game) and getgame(game.id) is game:
+            self.closeIn(game, ROOM_IDLE)
+
+    async def close(self, id: gameid_t):
+        self.creators.pop(id, None)
+        if timer := self.closing.pop(id, None):
+            timer.cancel()
+        game: Game | None = removegame(id)
+        if not game:
+            return
+        game.stop()
+        if game.log:
+            await game.log.close(remove=True)
+        await game.broadcast({"response": "game-closed", "value": id})
+        if game is self.default:
+            self.default = None
+
+    # /                   -> the default game
+    # /rooms/new[/<board>] -> a new game on <board>, created by address
+    # /rooms/<id>          -> the game with that id
+    # the game is held open until release is called for it, raises RoomLimitError when it would be a new one over the limits
+    def route(self, path: str, address: str | None = None) -> Game | None:
+        game = self.find(path, address)
+        if game:
+            self.hold(game)
+        return game
+
+    def find(self, path: str, address: str | None) -> Game | None:
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if not parts:
+            return self.default or self.create()
+        if parts[0] != "rooms" or len(parts) < 2:
+            return None
+        if parts[1] == "new":
+            boardname = parts[2] if len(parts) > 2 else None
+            if boardname and not re.fullmatch(r"[\w-]+", boardname):
+                return None
+            try:
+                return self.create(boardname, address)
+            except OSError as e:
+                print(e)
+                return None
+        try:
+            return self.get(float(parts[1]))
+        except ValueError:
+            return None
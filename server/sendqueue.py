@@ -0,0 +1,242 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from metrics import metrics
+
+# responses that only carry state, a newer frame of the same kind makes an older one useless
+STATE_RESPONSES = {
+    "board",
+    "player-list",
+    "trade-list",
+    "loan-list",
+    "lobby-state",
+    "next-turn",
+    "state-patch",
+    "state-version",
+    "auction-status",
+    "seq",
+}
+
+# state responses only the newest of in a batch matters, state patches build on each other so they all stay
+SUPERSEDED_RESPONSES = STATE_RESPONSES - {"state-patch"}
+
+# what a SendQueue does with a new frame when it is full
+# coalesce: merge two neighbouring state-only frames into one (see mergeState), and give up on the client if
+#   there are none, it resumes from the frames it missed when it reconnects (see Game.resume)
+# drop: drop the new frame
+# disconnect: give up on the client
+POLICY_COALESCE = "coalesce"
+POLICY_DROP = "drop"
+POLICY_DISCONNECT = "disconnect"
+POLICIES = (POLICY_COALESCE, POLICY_DROP, POLICY_DISCONNECT)
+
+# frames a client can have queued before the policy kicks in, and the policy, for every client
+SEND_QUEUE_SIZE = int(os.environ.get("MONOPOLY_SEND_QUEUE_SIZE", "256"))
+SLOW_CONSUMER_POLICY = os.environ.get("MONOPOLY_SLOW_CONSUMER_POLICY", POLICY_COALESCE)
+if SLOW_CONSUMER_POLICY not in POLICIES:
+    raise ValueError(f"MONOPOLY_SLOW_CONSUMER_POLICY must be one of {', '.join(POLICIES)}, not {SLOW_CONSUMER_POLICY!r}")
+
+type framekind_t = tuple[str, ...] | None
+
+
+def frameKind(data: Any) -> framekind_t:
+    """the responses in a state-only frame, or None if the frame has anything else in it"""
+    messages = data if isinstance(data, list) else [data]
+    kind = tuple(message.get("response") for message in messages if isinstance(message, dict))
+    if len(kind) != len(messages) or not all(response in STATE_RESPONSES for response in kind):
+        return None
+    return tuple(str(response) for response in kind)
+
+
+def dedupe(messages: list[Any]) -> list[Any]:
+    """drops the state messages a later one with the same response replaces, the rest keep their order"""
+    seen = set()
+    out = []
+    for message in reversed(messages):
+        response = message.get("response") if isinstance(message, dict) else None
+        if response in SUPERSEDED_RESPONSES:
+            if response in seen:
+                continue
+            seen.add(response)
+        out.append(message)
+    out.reverse()
+    return out
+
+
+def asList(data: Any) -> list[Any]:
+    return data if isinstance(data, list) else [data]
+
+
+def mergePatches(older: dict[str, Any], newer: dict[str, Any]) -> dict[str, Any] | None:
+    """one state-patch that takes a client from older's base to newer's version, None if newer does not follow older"""
+    a, b = older["value"], newer["value"]
+    if a["version"] != b["base"]:
+        return None
+    value = {**a, **b, "base": a["base"]}
+    # each entity's json is all of it, so the newer one replaces the older
+    for key, entities in b.items():
+        if isinstance(entities, list):
+            value[key] = list(({e["id"]: e for e in a.get(key, [])} | {e["id"]: e for e in entities}).values())
+        elif isinstance(entities, dict):
+            value[key] = a.get(key, {}) | entities
+    return {"response": "state-patch", "value": value}
+
+
+def mergeState(messages: list[Any]) -> list[Any]:
+    """state messages with the same effect as these, with patches that follow each other folded into one"""
+    # a full state has everything the patches before it had
+    fullState = max((i for i, message in enumerate(messages) if message.get("response") == "state-version"), default=-1)
+    out = []
+    patch = None
+    for i, message in enumerate(messages):
+        if message.get("response") == "state-patch":
+            if i < fullState:
+                continue
+            if patch is not None and (merged := mergePatches(patch, message)):
+                out.remove(patch)
+                message = merged
+            patch = message
+        out.append(message)
+    return dedupe(out)
+
+
+class SendQueue:
+    """
+    a bounded queue of outbound frames for one client, drained by its own writer task
+    so a slow socket only ever holds up itself
+    """
+
+    write: Callable[[Any], Awaitable[Any]]
+    # what the frames are encoded with, coalesce decodes the ones it merges
+    decode: Callable[[Any], Any] | None
+    encode: Callable[[Any], Any] | None
+    maxsize: int
+    policy: str
+    onoverflow: Callable[[], Any] | None
+    pending: deque[tuple[float, framekind_t, Any]]
+    task: asyncio.Task[None] | None
+    closed: bool
+
+    sent: int
+    dropped: int
+    coalesced: int
+    maxDepth: int
+    latencyTotal: float
+    latencyMax: float
+
+    def __init__(
+        self,
+        write: Callable[[Any], Awaitable[Any]],
+        maxsize: int = SEND_QUEUE_SIZE,
+        policy: str = SLOW_CONSUMER_POLICY,
+        onoverflow: Callable[[], Any] | None = None,
+        decode: Callable[[Any], Any] | None = None,
+        encode: Callable[[Any], Any] | None = None,
+    ):
+        self.write = write
+        self.decode = decode
+        self.encode = encode
+        assert policy in POLICIES, f"unknown slow consumer policy {policy!r}"
+        self.maxsize = maxsize
+        self.policy = policy
+        self.onoverflow = onoverflow
+        self.pending = deque()
+        self.ready = asyncio.Event()
+        self.task = None
+        self.closed = False
+
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.maxDepth = 0
+        self.latencyTotal = 0
+        self.latencyMax = 0
+
+    @property
+    def depth(self):
+        return len(self.pending)
+
+    def put(self, data: Any, kind: framekind_t) -> bool:
+        """queues a frame, returns False if it was dropped"""
+        if self.closed:
+            return False
+        self.pending.append((time.perf_counter(), kind, data))
+        if len(self.pending) > self.maxsize and not self.makeRoom():
+            return False
+
+        self.maxDepth = max(self.maxDepth, len(self.pending))
+        self.ready.set()
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return True
+
+    # called with the new frame already at the end of pending, one over maxsize
+    def makeRoom(self):
+        if self.policy == POLICY_COALESCE and self.coalesce():
+            return True
+        if self.policy in (POLICY_COALESCE, POLICY_DISCONNECT):
+            # anything dropped now would be lost without the client knowing
+            self.dropped += len(self.pending)
+            self.close()
+            if self.onoverflow:
+                self.onoverflow()
+            return False
+        self.pending.pop()
+        self.dropped += 1
+        return False
+
+    def coalesce(self):
+        """merges the first two neighbouring state-only frames, False if there are none"""
+        if self.decode is None or self.encode is None:
+            return False
+        pending = self.pending
+        for i in range(len(pending) - 1):
+            (queuedAt, kind, data), (_, nextKind, nextData) = pending[i], pending[i + 1]
+            if kind is None or nextKind is None:
+                continue
+            messages = mergeState([*asList(self.decode(data)), *asList(self.decode(nextData))])
+            pending[i] = (queuedAt, frameKind(messages), self.encode(messages))
+            del pending[i + 1]
+            self.coalesced += 1
+            return True
+        return False
+
+    async def run(self):
+        while not self.closed:
+            if not self.pending:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            queuedAt, _, data = self.pending.popleft()
+            try:
+                await self.write(data)
+            except Exception as e:
+                print(f"send failed, closing queue: {e!r}")
+                self.close()
+                return
+            latency = time.perf_counter() - queuedAt
+            self.sent += 1
+            self.latencyTotal += latency
+            self.latencyMax = max(self.latencyMax, latency)
+            metrics.sendLatency.observe(self.policy, latency)
+
+    def close(self):
+        self.closed = True
+        self.pending.clear()
+        if self.task and self.task is not asyncio.current_task():
+            self.task.cancel()
+        self.task = None
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "maxDepth": self.maxDepth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "avgLatency": self.latencyTotal / self.sent if self.sent else 0,
+            "maxLatency": self.latencyMax,
+        }
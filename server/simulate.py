@@ -0,0 +1,174 @@
+"""
+plays lots of headless games across a process pool and summarizes them
+
+    python server/simulate.py --games 100000 --board main --players scripted greedy set-completer valuation
+
+run from the repository root so ./boards resolves. every game gets its own seed (--seed + game number),
+so any single game can be played again with HeadlessGame(board, policies, seed=...)
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from headless import HeadlessGame, policies
+
+
+class Histogram:
+    """counts values in fixed width buckets so results from many processes can be merged"""
+
+    width: int
+    buckets: dict[int, int]
+    count: int
+    total: int
+
+    def __init__(self, width: int):
+        self.width = width
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+
+    def add(self, value: int):
+        bucket = value // self.width
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other: "Histogram"):
+        for bucket, n in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + n
+        self.count += other.count
+        self.total += other.total
+
+    # the lower edge of the bucket the q'th quantile falls in
+    def quantile(self, q: float):
+        target = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return bucket * self.width
+        return 0
+
+    def toJson(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0,
+            "p10": self.quantile(0.10),
+            "p50": self.quantile(0.50),
+            "p90": self.quantile(0.90),
+            "buckets": {bucket * self.width: n for bucket, n in sorted(self.buckets.items())},
+        }
+
+
+class Results:
+    games: int
+    finished: int
+    # seat -> wins, strategy -> wins
+    wins: dict[str, int]
+    strategyWins: dict[str, int]
+    gameLength: Histogram
+    bankruptTurn: Histogram
+    cashFlow: Histogram
+    finalMoney: Histogram
+
+    def __init__(self):
+        self.games = 0
+        self.finished = 0
+        self.wins = {}
+        self.strategyWins = {}
+        self.gameLength = Histogram(25)
+        self.bankruptTurn = Histogram(25)
+        self.cashFlow = Histogram(50)
+        self.finalMoney = Histogram(250)
+
+    def add(self, result: dict[str, Any]):
+        self.games += 1
+        self.finished += result["finished"]
+        self.wins[result["winner"]] = self.wins.get(result["winner"], 0) + 1
+        self.strategyWins[result["strategy"]] = self.strategyWins.get(result["strategy"], 0) + 1
+        self.gameLength.add(result["turns"])
+        for turn in result["bankruptTurns"].values():
+            self.bankruptTurn.add(turn)
+        for delta in result["cashFlow"]:
+            self.cashFlow.add(delta)
+        for money in result["finalMoney"].values():
+            self.finalMoney.add(money)
+
+    def merge(self, other: "Results"):
+        self.games += other.games
+        self.finished += other.finished
+        for seat, n in other.wins.items():
+            self.wins[seat] = self.wins.get(seat, 0) + n
+        for strategy, n in other.strategyWins.items():
+            self.strategyWins[strategy] = self.strategyWins.get(strategy, 0) + n
+        self.gameLength.merge(other.gameLength)
+        self.bankruptTurn.merge(other.bankruptTurn)
+        self.cashFlow.merge(other.cashFlow)
+        self.finalMoney.merge(other.finalMoney)
+
+    def toJson(self) -> dict[str, Any]:
+        return {
+            "games": self.games,
+            "finished": self.finished,
+            "winRates": {seat: n / self.games for seat, n in sorted(self.wins.items())},
+            "strategyWinRates": {name: n / self.games for name, n in sorted(self.strategyWins.items())},
+            "gameLength": self.gameLength.toJson(),
+            "bankruptTurn": self.bankruptTurn.toJson(),
+            "cashFlowPerTurn": self.cashFlow.toJson(),
+            "finalMoney": self.finalMoney.toJson(),
+        }
+
+
+def runChunk(board: str, players: list[str], seeds: range, maxTurns: int) -> Results:
+    results = Results()
+    # the handlers print as they go, nobody is reading it
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for seed in seeds:
+            game = HeadlessGame(board, [policies[name]() for name in players], maxTurns, seed)
+            results.add(game.play())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--board", default="main")
+    parser.add_argument("--players", nargs="+", default=["scripted"] * 4, choices=sorted(policies))
+    parser.add_argument("--max-turns", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", type=int, default=250, help="games per task sent to a worker")
+    parser.add_argument("--json", help="write the full results here")
+    args = parser.parse_args()
+
+    results = Results()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool:
+        chunks = [
+            pool.submit(runChunk, args.board, args.players, range(first, min(first + args.chunk, args.seed + args.games)), args.max_turns)
+            for first in range(args.seed, args.seed + args.games, args.chunk)
+        ]
+        for chunk in chunks:
+            results.merge(chunk.result())
+    elapsed = time.perf_counter() - start
+
+    summary = results.toJson()
+    print(f"{results.games} games in {elapsed:.1f}s ({results.games / elapsed:.0f} games/s), {results.finished} played to the end")
+    for seat, rate in summary["winRates"].items():
+        print(f"  seat {seat} ({args.players[int(seat)]}): {rate:.1%}")
+    for name, key in (("game length", "gameLength"), ("bankruptcy turn", "bankruptTurn"), ("cash flow per turn", "cashFlowPerTurn")):
+        h = summary[key]
+        print(f"  {name}: mean {h['mean']:.1f}, p10 {h['p10']}, p50 {h['p50']}, p90 {h['p90']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), **summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+read-only watchers of a game, kept apart from its players
+
+a spectator gets the frames every player gets, the same encoded bytes, from a task of its own so the
+game only appends to a queue while it handles an action. the stream can run behind the game by a delay,
+and caps how many frames a second it sends by merging what piled up into one frame.
+"""
+import asyncio
+import os
+import time
+from typing import TYPE_CHECKING, Any
+
+import actions
+import encoding
+from client import Client
+from sendqueue import dedupe, frameKind
+
+if TYPE_CHECKING:
+    from game import Game
+
+# seconds spectators run behind the players
+SPECTATOR_DELAY = float(os.environ.get("MONOPOLY_SPECTATOR_DELAY", "0"))
+# frames a second a stream sends at most, 0 sends every frame as it comes
+SPECTATOR_RATE = float(os.environ.get("MONOPOLY_SPECTATOR_RATE", "10"))
+# spectators a stream posts to before it lets the game have the loop again
+FANOUT_CHUNK = 256
+
+
+class SpectatorStream:
+    game: "Game"
+    delay: float
+    rate: float
+    spectators: set[Client]
+    # (due at, frame, or the spectator to add with the snapshot it starts from)
+    pending: list[tuple[float, encoding.Frame, Client | None]]
+    ready: asyncio.Event
+    task: asyncio.Task[None] | None
+    # (game seq, full state) shared by every spectator that joins before the game sends anything else,
+    # the state version alone misses changes that are not in a patch, like whose turn it is
+    snapshot: tuple[int, encoding.Frame] | None
+
+    def __init__(self, game: "Game", delay: float = SPECTATOR_DELAY, rate: float = SPECTATOR_RATE):
+        self.game = game
+        self.delay = delay
+        self.rate = rate
+        self.spectators = set()
+        self.pending = []
+        self.ready = asyncio.Event()
+        self.task = None
+        self.snapshot = None
+
+    def __len__(self):
+        return len(self.spectators)
+
+    def push(self, frame: encoding.Frame):
+        """queues a frame every player got, called by the game for each one"""
+        if self.spectators or self.pending:
+            self.pending.append((time.time() + self.delay, frame, None))
+            self.ready.set()
+
+    def subscribe(self, client: Client):
+        """the client starts from the state as it is now, at the same delay as everything after it"""
+        seq = self.game.seq
+        if self.snapshot is None or self.snapshot[0] != seq:
+            self.snapshot = (seq, encoding.Frame([*actions.getFullState(self.game), {"response": "spectating", "value": self.game.id}]))
+        self.pending.append((time.time() + self.delay, self.snapshot[1], client))
+        self.ready.set()
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def watch(self, client: Client):
+        """keeps the client subscribed until it goes away, whatever it sends is ignored"""
+        self.subscribe(client)
+        try:
+            async for _ in client:
+                pass
+        finally:
+            self.unsubscribe(client)
+
+    def unsubscribe(self, client: Client):
+        self.spectators.discard(client)
+        client.closeQueue()
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        for client in self.spectators:
+            client.closeQueue()
+        self.spectators.clear()
+        self.pending.clear()
+
+    async def run(self):
+        while True:
+            if not self.pending:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            if (wait := self.pending[0][0] - time.time()) > 0:
+                await asyncio.sleep(wait)
+                continue
+            now = time.time()
+            due = 0
+            while due < len(self.pending) and self.pending[due][0] <= now:
+                due += 1
+            batch, self.pending = self.pending[:due], self.pending[due:]
+            await self.send(batch)
+            if self.rate:
+                # whatever comes in meanwhile goes out merged in the next frame
+                await asyncio.sleep(1 / self.rate)
+
+    async def send(self, batch: list[tuple[float, encoding.Frame, Client | None]]):
+        frames: list[encoding.Frame] = []
+        for _, frame, joining in batch:
+            if joining is None:
+                frames.append(frame)
+                continue
+            # the frames before it are older than its snapshot
+            await self.fanout(frames)
+            frames = []
+            joining.postFrame(frame.get(joining.wireFormat), None)
+            self.spectators.add(joining)
+        await self.fanout(frames)
+
+    async def fanout(self, frames: list[encoding.Frame]):
+        if not frames:
+            return
+        # a single frame goes out as the bytes the players got, several are merged and encoded once
+        frame = frames[0] if len(frames) == 1 else encoding.Frame(dedupe([m for f in frames for m in f.data]))
+        kind = frameKind(frame.data)
+        for i, client in enumerate(list(self.spectators)):
+            if i and i % FANOUT_CHUNK == 0:
+                await asyncio.sleep(0)
+            client.postFrame(frame.get(client.wireFormat), kind)
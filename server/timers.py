@@ -0,0 +1,109 @@
+"""
+one timer heap for every game's deadlines: auction ends, bid extensions and idle turns
+
+a single loop callback is armed for the earliest deadline, so a pending timer costs a heap entry and nothing
+else until it fires. cancelled timers stay in the heap and are skipped when they come up, the heap is
+rebuilt once they are the majority
+"""
+import asyncio
+import heapq
+import time
+from typing import Any, Callable
+
+from metrics import metrics
+
+
+class Timer:
+    __slots__ = ("when", "fn", "cancelled")
+
+    # wall clock seconds, like time.time()
+    when: float
+    fn: Callable[[], Any]
+    # also set once it has fired
+    cancelled: bool
+
+    def __init__(self, when: float, fn: Callable[[], Any]):
+        self.when = when
+        self.fn = fn
+        self.cancelled = False
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            timers.dropped += 1
+            timers.compact()
+
+
+class Timers:
+    heap: list[tuple[float, int, Timer]]
+    order: int
+    # cancelled timers still in the heap
+    dropped: int
+    handle: asyncio.TimerHandle | None
+    wakeAt: float
+    # coroutines the timers started, kept so they are not collected while running
+    tasks: set[asyncio.Task[Any]]
+
+    def __init__(self):
+        self.heap = []
+        self.order = 0
+        self.dropped = 0
+        self.handle = None
+        self.wakeAt = 0
+        self.tasks = set()
+
+    def __len__(self):
+        return len(self.heap) - self.dropped
+
+    def at(self, when: float, fn: Callable[[], Any]) -> Timer:
+        """calls fn at wall clock time `when`, or right away if that has passed. a coroutine it returns is run as a task"""
+        timer = Timer(when, fn)
+        self.order += 1
+        heapq.heappush(self.heap, (when, self.order, timer))
+        if self.handle is None or when < self.wakeAt:
+            self.arm()
+        return timer
+
+    def compact(self):
+        if self.dropped > 64 and self.dropped * 2 > len(self.heap):
+            self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+            heapq.heapify(self.heap)
+            self.dropped = 0
+
+    def arm(self):
+        heap = self.heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+            self.dropped -= 1
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+        if not heap:
+            return
+        loop = asyncio.get_running_loop()
+        self.wakeAt = heap[0][0]
+        self.handle = loop.call_at(loop.time() + max(self.wakeAt - time.time(), 0), self.fire)
+
+    def fire(self):
+        self.handle = None
+        now = time.time()
+        # the loop clock and the wall clock drift apart a little, anything within a millisecond is due
+        while self.heap and self.heap[0][0] <= now + 0.001:
+            when, _, timer = heapq.heappop(self.heap)
+            if timer.cancelled:
+                self.dropped -= 1
+                continue
+            timer.cancelled = True
+            metrics.timerLag.observe("", max(now - when, 0))
+            try:
+                result = timer.fn()
+                if asyncio.iscoroutine(result):
+                    task = asyncio.create_task(result)
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+            except Exception as e:
+                print(f"timer failed: {e!r}")
+        self.arm()
+
+
+timers = Timers()
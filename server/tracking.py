@@ -0,0 +1,29 @@
+from typing import Any
+
+
+class Tracked:
+    """
+    marks an object dirty whenever one of its public attributes is assigned,
+    so the state patch (see actions.getStatePatch) only has to serialize what changed.
+    in-place changes (list.append, dict item assignment) are not seen, call markDirty() after those
+    """
+
+    # so a subclass can keep its attributes in slots
+    __slots__ = ()
+
+    _dirty: bool = True
+
+    def __setattr__(self, name: str, value: Any):
+        object.__setattr__(self, name, value)
+        if not name.startswith("_"):
+            object.__setattr__(self, "_dirty", True)
+
+    def markDirty(self):
+        object.__setattr__(self, "_dirty", True)
+
+    def markClean(self):
+        object.__setattr__(self, "_dirty", False)
+
+    @property
+    def dirty(self):
+        return self._dirty
@@ -1,25 +1,28 @@
-import random
 from typing import Any
 
 from monopolytypes import player_t
+from tracking import Tracked
 
-class Trade:
+class Trade(Tracked):
     trade: Any
     sender: player_t
     recipient: player_t
     id: float
     give: Any
     want: Any
-    status: str #declined | accepted | proposed
+    status: str #declined | accepted | proposed | expired | invalid
+    # the trade book's turn it expires on
+    expiresAt: int
 
-    def __init__(self, trade: dict[Any, Any], sender: player_t, recipient: player_t, status: str):
+    def __init__(self, trade: dict[Any, Any], sender: player_t, recipient: player_t, status: str, id: float):
         self.give = trade['give']
         self.want = trade['want']
         self.trade = trade
         self.sender = sender
         self.recipient = recipient
         self.status = status
-        self.id = random.random()
+        self.id = id
+        self.expiresAt = 0
 
     def toJson(self):
         return {
@@ -0,0 +1,113 @@
+"""
+the trades of a game: the open ones by id and by who is in them, a heap of when each one expires,
+and a compact history of the ones that were accepted, declined or dropped
+"""
+import heapq
+import os
+from typing import TYPE_CHECKING, Any
+
+from monopolytypes import player_t
+from trade import Trade
+
+if TYPE_CHECKING:
+    from board import Board
+    from player import Player
+
+# how many turns, any player's, an unanswered trade stays open
+TRADE_EXPIRY = int(os.environ.get("MONOPOLY_TRADE_EXPIRY", "8"))
+
+
+class TradeBook:
+    # proposed trades
+    trades: dict[float, Trade]
+    # player id -> ids of the open trades they send or receive
+    byPlayer: dict[player_t, set[float]]
+    # (turn it expires on, order, trade id), trades closed before then are skipped when they come up
+    expiry: list[tuple[int, int, float]]
+    # (id, sender id, recipient id, status)
+    history: list[tuple[float, player_t, player_t, str]]
+    # closed since the last state patch, they go out once more so clients see how they ended
+    closed: list[Trade]
+    # turns ended in this game
+    turn: int
+    expireAfter: int
+    order: int
+
+    def __init__(self, expireAfter: int = TRADE_EXPIRY):
+        self.trades = {}
+        self.byPlayer = {}
+        self.expiry = []
+        self.history = []
+        self.closed = []
+        self.turn = 0
+        self.expireAfter = expireAfter
+        self.order = 0
+
+    def get(self, id: float) -> Trade | None:
+        return self.trades.get(id)
+
+    def forPlayer(self, id: player_t) -> list[Trade]:
+        return [self.trades[tradeId] for tradeId in self.byPlayer.get(id, ())]
+
+    def add(self, trade: Trade):
+        self.trades[trade.id] = trade
+        self.byPlayer.setdefault(trade.sender, set()).add(trade.id)
+        self.byPlayer.setdefault(trade.recipient, set()).add(trade.id)
+        self.order += 1
+        heapq.heappush(self.expiry, (trade.expiresAt, self.order, trade.id))
+
+    def propose(self, trade: Trade):
+        trade.expiresAt = self.turn + self.expireAfter
+        self.add(trade)
+
+    def close(self, trade: Trade, status: str):
+        trade.status = status
+        self.trades.pop(trade.id, None)
+        for id in (trade.sender, trade.recipient):
+            if ids := self.byPlayer.get(id):
+                ids.discard(trade.id)
+                if not ids:
+                    del self.byPlayer[id]
+        self.history.append((trade.id, trade.sender, trade.recipient, status))
+        self.closed.append(trade)
+
+    def takeClosed(self):
+        closed, self.closed = self.closed, []
+        return closed
+
+    def onTurn(self):
+        """ends a turn and drops the trades nobody answered in time"""
+        self.turn += 1
+        while self.expiry and self.expiry[0][0] <= self.turn:
+            _, _, id = heapq.heappop(self.expiry)
+            if trade := self.trades.get(id):
+                self.close(trade, "expired")
+
+    def dropInvalid(self, board: "Board", players: dict[player_t, "Player"], ids: tuple[player_t, ...]):
+        """closes the open trades of these players that a change of hands or money made impossible"""
+        for id in ids:
+            for trade in self.forPlayer(id):
+                if checkTrade(board, players, trade.sender, trade.recipient, trade.trade):
+                    self.close(trade, "invalid")
+
+
+def checkTrade(board: "Board", players: dict[player_t, "Player"], sender: player_t, recipient: player_t, trade: dict[str, Any]) -> str | None:
+    """why the trade cannot happen as things stand, None if it can"""
+    if not isinstance(trade, dict) or not isinstance(trade.get("give"), dict) or not isinstance(trade.get("want"), dict):
+        return "That trade is malformed"
+    s, r = players.get(sender), players.get(recipient)
+    if not s or not r or s is r:
+        return "invalid player id"
+    if s.bankrupt or r.bankrupt:
+        return "Bankrupt players cannot trade"
+    for side, owner in ((trade["give"], s), (trade["want"], r)):
+        money = side.get("money") or 0
+        if not isinstance(money, int) or money < 0:
+            return "That trade is malformed"
+        if money > owner.money:
+            return f"{owner.name} does not have ${money}"
+        for id in side.get("properties", []):
+            space = board.getSpaceById(id)
+            if not space or space not in owner.ownedSpaces:
+                return f"{owner.name} does not own that property"
+    return None
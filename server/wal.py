@@ -0,0 +1,410 @@
+"""
+write-ahead log of the actions a game accepts, plus periodic snapshots, so a restarted server can rebuild its games
+
+    <dir>/<game id>/snapshot.json          the full state after record `seq`
+    <dir>/<game id>/log-<first seq>.jsonl  one record per line, a new segment starts at every snapshot
+
+appending only buffers the record, a writer task writes and fsyncs whatever piled up every flushInterval
+in a worker thread, so handleAction never waits on the disk and a record is durable at most about
+flushInterval after the action ran. recovery loads the snapshot and runs the records after it through
+Game.handleAction, snapshotEvery / snapshotInterval bound how long that tail can get.
+"""
+import asyncio
+import json
+import os
+import shutil
+import time
+from typing import TYPE_CHECKING, Any
+
+from boardbuilder import buildFromFile
+from client import NullClient
+from loan import Loan
+from player import Player
+from trade import Trade
+
+if TYPE_CHECKING:
+    from game import Game
+
+# left in a closed game's directory when its history is kept, see ActionLog.close
+CLOSED = "closed"
+
+# board file -> the attrs of every space as built, so snapshots only keep spaces that changed
+_pristine: dict[str, list[dict[str, Any]]] = {}
+
+
+def pristineAttrs(boardFile: str):
+    if boardFile not in _pristine:
+        _pristine[boardFile] = [dict(space.attrs) for space in buildFromFile(0, boardFile).iterSpaces()]
+    return _pristine[boardFile]
+
+
+def dumpPlayer(player: Player):
+    return {
+        "id": player.id,
+        "playerNumber": player.playerNumber,
+        "name": player.name,
+        "piece": player.piece,
+        "color": player.color,
+        "address": player.address,
+        "bot": player.client.bot,
+        "money": player.money,
+        "space": player.space.id if player.space else None,
+        "ownedSpaces": [space.id for space in player.ownedSpaces],
+        "sets": player.sets,
+        "lastRoll": player.lastRoll,
+        "turns": player.turns,
+        "bankrupt": player.bankrupt,
+        "inDebtTo": player.inDebtTo.id if player.inDebtTo else None,
+        "creditScore": player.creditScore,
+        "host": player.host,
+        "inJail": player.inJail,
+        "jailDoublesRemaining": player.jailDoublesRemaining,
+        "loans": [loan.id for loan in player.loans],
+    }
+
+
+def dumpLoan(loan: Loan):
+    return {
+        "id": loan.id,
+        "loaner": loan.loaner.id if loan.loaner else None,
+        "loanee": loan.loanee.id,
+        "type": loan.type,
+        "amount": loan.amount,
+        "interest": loan.interest,
+        "interestType": loan.interestType,
+        "status": loan.status,
+        "amountPerTurn": loan.amountPerTurn,
+        "deadline": loan.deadline,
+        "startTurn": loan.startTurn,
+        "totalOwed": loan.totalOwed,
+    }
+
+
+def dumpGame(game: "Game") -> dict[str, Any]:
+    pristine = pristineAttrs(f"{game.boards_path}/{game.board.boardName}.json")
+    spaces = {}
+    for space in game.board.spaces:
+        # players standing on a space are rebuilt from their own space, ownership from ownedSpaces
+        if space.houses or space.hotel or space.mortgaged or space.attrs != pristine[space.id]:
+            spaces[str(space.id)] = {"houses": space.houses, "hotel": space.hotel, "mortgaged": space.mortgaged, "attrs": dict(space.attrs)}
+    return {
+        "id": game.id,
+        "board": game.board.boardName,
+        "dSides": game.dSides,
+        "seed": game.seed,
+        "rng": game.rng.getstate(),
+        "curTurn": game.curTurn,
+        "playerTurn": game.playerTurn,
+        "started": game.started,
+        "version": game.version,
+        "activeAuction": game.activeAuction,
+        # in turn order, every player in game.players keeps their join order
+        "activePlayers": [player.id for player in game.activePlayers],
+        "players": [dumpPlayer(player) for player in game.players.values()],
+        "spaces": spaces,
+        "loans": [dumpLoan(loan) for loan in game.ledger.loans.values()],
+        "loanHistory": game.ledger.history,
+        "trades": [trade.toJson() | {"expiresAt": trade.expiresAt} for trade in game.tradebook.trades.values()],
+        "tradeTurn": game.tradebook.turn,
+        "tradeHistory": game.tradebook.history,
+    }
+
+
+def newPlayer(game: "Game", data: dict[str, Any]):
+    if data.get("bot"):
+        # bots come back on their own, see bots.resumeBots
+        from bots import newBot
+        player = newBot(game, data["bot"], data["id"])
+        player.playerNumber = data["playerNumber"]
+    else:
+        # nobody is connected until the player reconnects, see Game.disconnectClient
+        player = Player(data["id"], data["playerNumber"], NullClient())
+    for key in ("name", "piece", "color", "address"):
+        setattr(player, key, data[key])
+    player.gameid = game.id
+    return player
+
+
+def restoreGame(data: dict[str, Any]) -> "Game":
+    from game import Game
+
+    game = Game(data["board"], data["dSides"], id=data["id"], seed=data["seed"])
+    board = game.board
+    for id, s in data["spaces"].items():
+        space = board.spaces[int(id)]
+        space.houses = s["houses"]
+        space.hotel = s["hotel"]
+        space.mortgaged = s["mortgaged"]
+        space.attrs = s["attrs"]
+
+    for p in data["players"]:
+        player = newPlayer(game, p)
+        for id in p["ownedSpaces"]:
+            player.takeOwnership(board.spaces[id])
+        for key in ("money", "sets", "lastRoll", "turns", "bankrupt", "creditScore", "host", "inJail", "jailDoublesRemaining"):
+            setattr(player, key, p[key])
+        space = board.spaces[p["space"]]
+        space.players.append(player)
+        player.space = space
+        board.players[player.id] = player
+        board.playerSpaces[player.id] = space
+        game.players[player.id] = player
+    game.activePlayers = [game.players[id] for id in data["activePlayers"]]
+
+    loans = {}
+    for l in data["loans"]:
+        loan = Loan(
+            game.id, l["loaner"] or "Bank", l["loanee"], l["type"], l["amount"], l["interest"], l["interestType"], l["status"],
+            l["amountPerTurn"], l["deadline"],
+        )
+        loan.id = l["id"]
+        loan.startTurn = l["startTurn"]
+        loan.totalOwed = l["totalOwed"]
+        loans[loan.id] = loan
+        game.ledger.add(loan)
+    for p in data["players"]:
+        player = game.players[p["id"]]
+        player.loans = [loans[id] for id in p["loans"]]
+        player.inDebtTo = game.players.get(p["inDebtTo"]) if p["inDebtTo"] else None
+    for loan in game.ledger.loans.values():
+        if loan.status == "accepted":
+            game.ledger.scheduleLoan(loan)
+    game.ledger.history = [tuple(entry) for entry in data["loanHistory"]]
+
+    for t in data["trades"]:
+        trade = Trade(t["trade"], t["sender"], t["recipient"], t["status"], t["id"])
+        trade.expiresAt = t["expiresAt"]
+        game.tradebook.add(trade)
+    game.tradebook.turn = data["tradeTurn"]
+    game.tradebook.history = [tuple(entry) for entry in data["tradeHistory"]]
+
+    game.curTurn = data["curTurn"]
+    game.playerTurn = data["playerTurn"]
+    game.started = data["started"]
+    game.version = data["version"]
+    game.activeAuction = data["activeAuction"]
+    # last, rebuilding the loans above draws from it
+    version, internal, gauss = data["rng"]
+    game.rng.setstate((version, tuple(internal), gauss))
+    return game
+
+
+async def replay(game: "Game", record: dict[str, Any]):
+    match record:
+        case {"event": "join", "player": p}:
+            player = newPlayer(game, p)
+            game.addPlayer(player)
+            game.clients.remove(player.client)
+            # what Game.join does to the state after adding the player
+            game.updatedState()
+        case {"event": "auction-end"}:
+            await game.endAuction()
+        case {"action": action, "player": id}:
+            # an action that blew up live blows up the same way here, the state it left behind is what counts
+            try:
+                await game.handleAction(action, game.getplayer(id), at=record.get("t"))
+            except Exception as e:
+                print(f"replaying {record['seq']}: {e!r}")
+
+
+class ActionLog:
+    game: "Game"
+    directory: str
+    flushInterval: float
+    snapshotEvery: int
+    snapshotInterval: float
+    # keep every snapshot and log segment instead of only what recovery needs, see replay.py
+    keepHistory: bool
+    seq: int
+    # records since the last snapshot, and when it was taken
+    sinceSnapshot: int
+    snapshotAt: float
+    # ("record", line) or ("snapshot", seq, encoded state), written in order by the writer task
+    pending: list[tuple[Any, ...]]
+    ready: asyncio.Event
+    task: asyncio.Task[None] | None
+    segment: Any
+    batches: int
+    written: int
+
+    def __init__(
+        self,
+        game: "Game",
+        directory: str,
+        flushInterval: float = 0.05,
+        snapshotEvery: int = 1000,
+        snapshotInterval: float = 60,
+        seq: int = 0,
+        keepHistory: bool = False,
+    ):
+        self.game = game
+        self.directory = directory
+        self.flushInterval = flushInterval
+        self.snapshotEvery = snapshotEvery
+        self.snapshotInterval = snapshotInterval
+        self.keepHistory = keepHistory
+        self.seq = seq
+        self.sinceSnapshot = 0
+        self.snapshotAt = time.monotonic()
+        self.pending = []
+        self.ready = asyncio.Event()
+        self.task = None
+        self.segment = None
+        self.batches = 0
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def append(self, record: dict[str, Any]):
+        self.seq += 1
+        self.sinceSnapshot += 1
+        self.pending.append(("record", json.dumps({"seq": self.seq, **record})))
+        self.ready.set()
+
+    def snapshot(self):
+        # encoded here, the game keeps changing while the writer thread runs
+        text = json.dumps({"seq": self.seq, "time": time.time(), "state": dumpGame(self.game)})
+        self.pending.append(("snapshot", self.seq, text))
+        self.sinceSnapshot = 0
+        self.snapshotAt = time.monotonic()
+        self.ready.set()
+
+    # called between actions, when the game is in a consistent state
+    def maybeSnapshot(self):
+        if self.sinceSnapshot >= self.snapshotEvery or (
+            self.sinceSnapshot and time.monotonic() - self.snapshotAt >= self.snapshotInterval
+        ):
+            self.snapshot()
+
+    async def run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                # let a batch pile up, this is the bound on how late a record hits the disk
+                await asyncio.sleep(self.flushInterval)
+                await self.flush()
+        except asyncio.CancelledError:
+            await self.flush()
+            raise
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        self.ready.clear()
+        if batch:
+            await asyncio.to_thread(self.write, batch)
+
+    def write(self, batch: list[tuple[Any, ...]]):
+        lines = []
+        for op in batch:
+            if op[0] == "record":
+                lines.append(op[1])
+                continue
+            self.writeLines(lines)
+            lines = []
+            self.writeSnapshot(op[1], op[2])
+        self.writeLines(lines)
+        self.batches += 1
+
+    def writeLines(self, lines: list[str]):
+        if not lines:
+            return
+        if self.segment is None:
+            first = json.loads(lines[0])["seq"]
+            self.segment = open(f"{self.directory}/log-{first:012d}.jsonl", "a")
+        self.segment.write("\n".join(lines) + "\n")
+        self.segment.flush()
+        os.fsync(self.segment.fileno())
+        self.written += len(lines)
+
+    def writeSnapshot(self, seq: int, text: str):
+        path = f"{self.directory}/snapshot.json"
+        with open(path + ".tmp", "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        if self.keepHistory:
+            with open(f"{self.directory}/snapshot-{seq:012d}.json", "w") as f:
+                f.write(text)
+        # everything up to seq is in the snapshot now
+        if self.segment:
+            self.segment.close()
+            self.segment = None
+        if self.keepHistory:
+            return
+        for name in os.listdir(self.directory):
+            if name.startswith("log-") and int(name[4:-6]) <= seq:
+                os.remove(f"{self.directory}/{name}")
+
+    async def close(self, remove: bool = False):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        # the task may have been cancelled before it ever ran
+        await self.flush()
+        if self.segment:
+            self.segment.close()
+            self.segment = None
+        if not remove:
+            return
+        if self.keepHistory:
+            # replay.py still wants it, recovery skips it
+            open(f"{self.directory}/{CLOSED}", "w").close()
+        else:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def readRecords(directory: str, after: int):
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith("log-"):
+            continue
+        with open(f"{directory}/{name}") as f:
+            for line in f:
+                # a crash can leave half a line at the end
+                if not line.endswith("\n"):
+                    return
+                record = json.loads(line)
+                if record["seq"] > after:
+                    yield record
+
+
+async def recoverGame(directory: str, keepHistory: bool = False):
+    """rebuilds a game from its snapshot and log tail, returns it and the log reattached to it"""
+    with open(f"{directory}/snapshot.json") as f:
+        snapshot = json.load(f)
+    game = restoreGame(snapshot["state"])
+    seq = snapshot["seq"]
+    for record in readRecords(directory, seq):
+        await replay(game, record)
+        seq = record["seq"]
+    log = game.log = ActionLog(game, directory, seq=seq, keepHistory=keepHistory)
+    # fold the tail into a fresh snapshot so the next restart starts from here
+    log.snapshot()
+    return game, log
+
+
+async def recoverAll(root: str, keepHistory: bool = False):
+    games = []
+    if not os.path.isdir(root):
+        return games
+    for name in sorted(os.listdir(root)):
+        directory = f"{root}/{name}"
+        if not os.path.isfile(f"{directory}/snapshot.json") or os.path.exists(f"{directory}/{CLOSED}"):
+            continue
+        start = time.perf_counter()
+        try:
+            game, log = await recoverGame(directory, keepHistory)
+        except Exception as e:
+            print(f"could not recover {directory}: {e!r}")
+            continue
+        print(f"recovered game {game.id} ({log.seq} actions) in {(time.perf_counter() - start) * 1000:.1f}ms")
+        games.append(game)
+    return games
@@ -0,0 +1,202 @@
+"""
+the binary wire format, messagepack with a key dictionary
+
+map keys that are in KEYS go out as their index, a positive fixint, instead of the string, everything else is
+plain messagepack, so a client decodes a frame with any messagepack library and swaps the int keys back.
+the server sends KEYS to a client that asked for this format before anything else (see WSClient)
+"""
+import json
+import struct
+from typing import Any
+
+# the keys of the toJson shapes (Space, Player, Loan, Trade, Game, auctions, the state patch and status_t).
+# only append to it, a client may have cached an older table
+KEYS = (
+    "response", "value",
+    # Space
+    "id", "name", "attrs", "spaceType", "cost", "mortgaged", "owner", "gameId", "purchaseable", "houses", "hotel",
+    "players", "rent", "set_size", "color", "house1", "house2", "house3", "house4", "house_cost", "bailcost", "logo",
+    "level", "taxname",
+    # Player
+    "money", "playerNumber", "piece", "space", "sets", "ownedSpaces", "bankrupt", "injail", "loans", "creditScore",
+    # Loan
+    "interest", "interestType", "amount", "amountPerTurn", "loaner", "loanee", "status", "type", "deadline",
+    "turnsPassed", "remainingToPay",
+    # Trade
+    "trade", "sender", "recipient", "give", "want", "properties",
+    # Game, auctions, state patches
+    "started", "host", "current_bid", "bidder", "end_time", "end_timestamp", "base", "version", "spaces",
+    "playerSpaces", "trades",
+    # the status_t notifications
+    "broadcast", "player", "earned", "other", "onland", "event",
+)  # fmt: skip
+assert len(KEYS) < 128, "keys have to fit a positive fixint"
+
+KEY_INDEX = {key: i for i, key in enumerate(KEYS)}
+
+packDouble = struct.Struct(">Bd").pack
+packU16 = struct.Struct(">BH").pack
+packU32 = struct.Struct(">BI").pack
+packI64 = struct.Struct(">Bq").pack
+packU64 = struct.Struct(">BQ").pack
+
+# what an instance of a subclass is packed as
+PACKED_BASES: tuple[type, ...] = (str, int, float, dict, list, tuple)
+
+
+def pack(data: Any) -> bytes:
+    out = bytearray()
+    packInto(out, data)
+    return bytes(out)
+
+
+def packInto(out: bytearray, o: Any):
+    # most common first, bool before int because it is one
+    t = type(o)
+    if t is str:
+        b = o.encode()
+        n = len(b)
+        if n < 32:
+            out.append(0xA0 | n)
+        elif n < 0x100:
+            out += bytes((0xD9, n))
+        elif n < 0x10000:
+            out += packU16(0xDA, n)
+        else:
+            out += packU32(0xDB, n)
+        out += b
+    elif t is dict:
+        n = len(o)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n < 0x10000:
+            out += packU16(0xDE, n)
+        else:
+            out += packU32(0xDF, n)
+        for k, v in o.items():
+            if (i := KEY_INDEX.get(k)) is not None:
+                out.append(i)
+            else:
+                # keys are strings, like json makes them, an int key would read as a KEYS index
+                packInto(out, k if type(k) is str else json.dumps(k).strip('"'))
+            packInto(out, v)
+    elif t is bool:
+        out.append(0xC3 if o else 0xC2)
+    elif t is int:
+        if 0 <= o < 128:
+            out.append(o)
+        elif -32 <= o < 0:
+            out.append(o & 0xFF)
+        elif not -(2**63) <= o < 2**64:
+            raise OverflowError(f"{o} does not fit messagepack")
+        elif o < 0:
+            out += packI64(0xD3, o)
+        elif o < 0x10000:
+            out += packU16(0xCD, o)
+        elif o < 2**32:
+            out += packU32(0xCE, o)
+        else:
+            out += packU64(0xCF, o)
+    elif o is None:
+        out.append(0xC0)
+    elif t is float:
+        out += packDouble(0xCB, o)
+    elif t is list or t is tuple:
+        n = len(o)
+        if n < 16:
+            out.append(0x90 | n)
+        elif n < 0x10000:
+            out += packU16(0xDC, n)
+        else:
+            out += packU32(0xDD, n)
+        for v in o:
+            packInto(out, v)
+    else:
+        # subclasses, like the enums
+        for base in PACKED_BASES:
+            if isinstance(o, base):
+                return packInto(out, base(o))
+        raise TypeError(f"cannot pack {t.__name__}")
+
+
+def unpack(frame: bytes) -> Any:
+    """decodes a frame, int map keys that are in KEYS come back as their names"""
+    value, end = unpackFrom(memoryview(frame), 0)
+    assert end == len(frame), f"{len(frame) - end} bytes after the message"
+    return value
+
+
+def unpackFrom(b: memoryview, i: int) -> tuple[Any, int]:
+    c = b[i]
+    i += 1
+    if c < 0x80:
+        return c, i
+    if c >= 0xE0:
+        return c - 0x100, i
+    if 0xA0 <= c < 0xC0:
+        n = c & 0x1F
+        return str(b[i : i + n], "utf-8"), i + n
+    if 0x80 <= c < 0x90:
+        return unpackMap(b, i, c & 0x0F)
+    if 0x90 <= c < 0xA0:
+        return unpackArray(b, i, c & 0x0F)
+    match c:
+        case 0xC0:
+            return None, i
+        case 0xC2:
+            return False, i
+        case 0xC3:
+            return True, i
+        case 0xCA:
+            return struct.unpack_from(">f", b, i)[0], i + 4
+        case 0xCB:
+            return struct.unpack_from(">d", b, i)[0], i + 8
+        case 0xCC:
+            return b[i], i + 1
+        case 0xCD:
+            return struct.unpack_from(">H", b, i)[0], i + 2
+        case 0xCE:
+            return struct.unpack_from(">I", b, i)[0], i + 4
+        case 0xCF:
+            return struct.unpack_from(">Q", b, i)[0], i + 8
+        case 0xD0:
+            return struct.unpack_from(">b", b, i)[0], i + 1
+        case 0xD1:
+            return struct.unpack_from(">h", b, i)[0], i + 2
+        case 0xD2:
+            return struct.unpack_from(">i", b, i)[0], i + 4
+        case 0xD3:
+            return struct.unpack_from(">q", b, i)[0], i + 8
+        case 0xD9 | 0xDA | 0xDB:
+            fmt = {0xD9: ">B", 0xDA: ">H", 0xDB: ">I"}[c]
+            n = struct.unpack_from(fmt, b, i)[0]
+            i += struct.calcsize(fmt)
+            return str(b[i : i + n], "utf-8"), i + n
+        case 0xDC:
+            return unpackArray(b, i + 2, struct.unpack_from(">H", b, i)[0])
+        case 0xDD:
+            return unpackArray(b, i + 4, struct.unpack_from(">I", b, i)[0])
+        case 0xDE:
+            return unpackMap(b, i + 2, struct.unpack_from(">H", b, i)[0])
+        case 0xDF:
+            return unpackMap(b, i + 4, struct.unpack_from(">I", b, i)[0])
+    raise ValueError(f"unsupported messagepack type 0x{c:02x}")
+
+
+def unpackArray(b: memoryview, i: int, n: int) -> tuple[list[Any], int]:
+    out = []
+    for _ in range(n):
+        v, i = unpackFrom(b, i)
+        out.append(v)
+    return out, i
+
+
+def unpackMap(b: memoryview, i: int, n: int) -> tuple[dict[Any, Any], int]:
+    out = {}
+    for _ in range(n):
+        k, i = unpackFrom(b, i)
+        if type(k) is int and 0 <= k < len(KEYS):
+            k = KEYS[k]
+        v, i = unpackFrom(b, i)
+        out[k] = v
+    return out, i
@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from gameregistry import listgames, removegame
+from timers import timers
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch: pytest.MonkeyPatch):
+    # Game.boards_path is relative to the repository root
+    monkeypatch.chdir(ROOT)
+    yield
+    # every test runs its own event loop, nothing of one may be left for the next
+    for game in listgames():
+        game.stop()
+        removegame(game.id)
+    timers.__init__()
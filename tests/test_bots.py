@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+import bots
+from game import Game
+from player import Player
+from util import drain, makeGame, responses
+
+
+def addBot(game: Game, player: Player):
+    return list(game.dispatch({"action": "add-bot", "strategy": "greedy"}, player))
+
+
+def test_only_the_host_adds_bots_before_the_start():
+    async def main():
+        game, _ = makeGame(start=False)
+        host, other = game.players["0"], game.players["1"]
+        [(_, refused)] = addBot(game, other)
+        assert refused["response"] == "notification"
+        assert addBot(game, host) == []
+        await drain()
+        assert len(game.players) == 3
+
+        game.started = True
+        host.host = True
+        [(_, refused)] = addBot(game, host)
+        assert refused["response"] == "notification"
+        game.stop()
+
+    asyncio.run(main())
+
+
+def test_bots_stop_at_the_seat_cap(monkeypatch: pytest.MonkeyPatch):
+    async def main():
+        monkeypatch.setattr(bots, "MAX_SEATS", 3)
+        game, received = makeGame(start=False)
+        host = game.players["0"]
+        for _ in range(3):
+            await game.handleAction({"action": "add-bot", "strategy": "greedy"}, host)
+            await drain()
+        assert len(game.players) == 3
+        assert any("full" in str(n) for n in responses(received["0"], "notification"))
+        game.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+import actions
+import encoding
+from util import makeGame
+
+try:
+    import markov
+except ImportError:
+    markov = None
+
+
+@pytest.mark.parametrize("name", sorted(encoding.encoders))
+def test_full_state_encodes_like_json(name: str):
+    game, _ = makeGame()
+    state = actions.getFullState(game)
+    assert json.loads(encoding.encoders[name](state)) == json.loads(json.dumps(state))
+
+
+@pytest.mark.skipif(markov is None, reason="board analysis needs numpy")
+@pytest.mark.parametrize("name", sorted(encoding.encoders))
+def test_board_analysis_encodes_like_json(name: str):
+    assert markov
+    analysis = markov.analyzeBoard("main", "./boards", useDisk=False)
+    assert json.loads(encoding.encoders[name](analysis)) == json.loads(json.dumps(analysis))
+
+
+@pytest.mark.parametrize("name", sorted(encoding.encoders))
+def test_int_keys_become_strings(name: str):
+    assert json.loads(encoding.encoders[name]({1: "a"})) == {"1": "a"}
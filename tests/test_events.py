@@ -0,0 +1,27 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+import boardbuilder
+from game import Game
+
+
+def test_reloading_handlers_recompiles_every_games_chains(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    shutil.copytree("boards", tmp_path, dirs_exist_ok=True)
+    monkeypatch.setattr(Game, "boards_path", str(tmp_path))
+    # compiled boards and handler modules are cached by content, the reload must not reach other tests' games
+    for cache in ("_templates", "_seen", "_modules"):
+        monkeypatch.setattr(boardbuilder, cache, {})
+    games = [Game("main"), Game("main")]
+    assert games[0].board.eventTable is games[1].board.eventTable
+    start = games[0].board.startSpace
+    _, before = games[0].board.eventTable["onland"][start.id]
+
+    with open(tmp_path / "generic.py", "a") as f:
+        f.write("\n\ndef onland_passing_go(board, space, player):\n    yield from ()\n")
+    boardbuilder.reloadHandlers()
+
+    for game in games:
+        _, handler = game.board.compileEvent("onland")[start.id]
+        assert handler is not before and handler and handler.__name__ == "onland_passing_go"
@@ -0,0 +1,65 @@
+import pytest
+
+import game as gamemodule
+from util import makeGame
+
+
+@pytest.fixture(autouse=True)
+def checkIndexes(monkeypatch: pytest.MonkeyPatch):
+    # every dispatched action rebuilds the players' indexes and compares
+    monkeypatch.setattr(gamemodule, "CHECK_INDEXES", True)
+
+
+def act(game, player, action: str, **kwargs):
+    return list(game.dispatch({"action": action, **kwargs}, player))
+
+
+def test_has_set():
+    game, _ = makeGame()
+    player = game.players["0"]
+    brown = [space for space in game.board.spaces if space.color == "brown"]
+    player.takeOwnership(brown[0])
+    assert not player.hasSet("brown", 2)
+    player.takeOwnership(brown[1])
+    assert player.hasSet("brown", 2)
+    assert not player.hasSet("green", 0)
+
+
+def test_indexes_follow_trades_mortgages_and_bankruptcy():
+    game, _ = makeGame()
+    host, other = game.players["0"], game.players["1"]
+    spaces = {space.name: space for space in game.board.spaces}
+    for name in ("Mediterranean Avenue", "Baltic Avenue", "Reading Railroad"):
+        host.buy(spaces[name])
+    for name in ("Oriental Avenue", "Vermont Avenue", "Electric Company"):
+        other.buy(spaces[name])
+
+    act(game, host, "buy-house", spaceid=spaces["Baltic Avenue"].id)
+    assert spaces["Baltic Avenue"].houses == 1
+
+    trade = {"give": {"properties": [spaces["Reading Railroad"].id], "money": 50}, "want": {"properties": [spaces["Oriental Avenue"].id]}}
+    act(game, host, "propose-trade", playerid=other.id, trade=trade)
+    [proposed] = game.tradebook.trades.values()
+    act(game, other, "accept-trade", id=proposed.id)
+    assert spaces["Reading Railroad"].owner is other and spaces["Oriental Avenue"].owner is host
+
+    act(game, other, "mortgage", spaceid=spaces["Vermont Avenue"].id)
+    act(game, host, "mortgage", spaceid=spaces["Mediterranean Avenue"].id)
+    act(game, host, "unmortgage", spaceid=spaces["Mediterranean Avenue"].id)
+    assert spaces["Vermont Avenue"].mortgaged and not spaces["Mediterranean Avenue"].mortgaged
+
+    other.inDebtTo = host
+    act(game, other, "bankrupt")
+    assert other.bankrupt and not other.ownedSpaces and game.finished
+    for player in game.players.values():
+        player.checkIndexes()
+
+
+def test_check_indexes_catches_a_stale_index():
+    game, _ = makeGame()
+    player = game.players["0"]
+    space = next(space for space in game.board.spaces if space.color == "brown")
+    player.takeOwnership(space)
+    player.ownedSpaces.remove(space)
+    with pytest.raises(AssertionError):
+        act(game, player, "send-player-info")
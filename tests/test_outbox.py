@@ -0,0 +1,74 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+import game as gamemodule
+from util import drain, makeGame
+
+
+def framesOf(game) -> dict[str, list[Any]]:
+    """every frame each player gets from now on, by player id"""
+    frames: dict[str, list[Any]] = {}
+    for id, player in game.players.items():
+        player.client.onwrite = frames.setdefault(id, []).append
+    return frames
+
+
+def responses(frame: list[dict[str, Any]]):
+    return [message["response"] for message in frame if message["response"] != "seq"]
+
+
+def test_one_frame_per_client():
+    async def main():
+        game, _ = makeGame(players=3)
+        frames = framesOf(game)
+        game.queueMessage(None, {"response": "turn-ended", "value": 1})
+        game.queueMessage(game.players["0"].client, {"response": "player-info", "value": 2})
+        game.queueMessage(None, {"response": "roll-complete", "value": 3})
+        game.flushOutbox()
+        await drain()
+
+        assert [len(f) for f in frames.values()] == [1, 1, 1]
+        # the addressed client gets its own message where it was sent, among the broadcast ones
+        assert responses(frames["0"][0]) == ["turn-ended", "player-info", "roll-complete"]
+        assert responses(frames["1"][0]) == responses(frames["2"][0]) == ["turn-ended", "roll-complete"]
+
+    asyncio.run(main())
+
+
+def test_superseded_state_is_left_out():
+    async def main():
+        game, _ = makeGame()
+        frames = framesOf(game)
+        for i in range(2):
+            game.queueMessage(None, {"response": "player-list", "value": i})
+            game.queueMessage(None, {"response": "state-patch", "value": {"base": i, "version": i + 1}})
+        game.flushOutbox()
+        await drain()
+
+        [frame] = frames["1"]
+        assert responses(frame) == ["state-patch", "player-list", "state-patch"]
+        assert [m["value"] for m in frame if m["response"] == "player-list"] == [1]
+
+    asyncio.run(main())
+
+
+def test_flush_window_joins_actions(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(gamemodule, "FLUSH_WINDOW", 20)
+
+    async def main():
+        game, _ = makeGame()
+        frames = framesOf(game)
+        player = game.players["0"]
+        await game.handleAction({"action": "send-player-info"}, player)
+        await game.handleAction({"action": "send-player-info"}, player)
+        await drain()
+        assert frames["0"] == []
+
+        await asyncio.sleep(0.05)
+        await drain()
+        [frame] = frames["0"]
+        assert responses(frame).count("player-info") == 2
+
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+import game as gamemodule
+from client import MemoryClient
+from util import drain, makeGame, responses
+
+
+def seqs(messages: list[dict[str, Any]]):
+    return responses(messages, "seq")
+
+
+def test_a_flush_has_one_seq():
+    async def main():
+        game, received = makeGame(players=3)
+        game.queueMessage(None, {"response": "turn-ended", "value": 1})
+        game.queueMessage(game.players["0"].client, {"response": "player-info", "value": 2})
+        game.flushOutbox()
+        await drain()
+        assert seqs(received["0"]) == seqs(received["1"]) == seqs(received["2"]) == [game.seq]
+
+    asyncio.run(main())
+
+
+def test_resume_replays_each_frame_once():
+    async def main():
+        game, _ = makeGame()
+        host = game.players["0"]
+        before = game.seq
+        game.queueMessage(None, {"response": "turn-ended", "value": 1})
+        game.queueMessage(host.client, {"response": "player-info", "value": 2})
+        game.flushOutbox()
+        game.queueMessage(None, {"response": "roll-complete", "value": 3})
+        game.flushOutbox()
+
+        missed = game.resume(host, before)
+        assert [m["response"] for m in missed] == ["turn-ended", "player-info", "seq", "roll-complete", "seq", "session"]
+        assert seqs(missed) == [before + 1, before + 2]
+
+        # the other player gets the frame for everyone, without what was only for the host
+        missed = game.resume(game.players["1"], before)
+        assert [m["response"] for m in missed] == ["turn-ended", "seq", "roll-complete", "seq", "session"]
+
+    asyncio.run(main())
+
+
+def test_too_far_behind_gets_the_full_state(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(gamemodule, "RESUME_BUFFER", 2)
+
+    async def main():
+        game, _ = makeGame()
+        for i in range(3):
+            game.queueMessage(None, {"response": "roll-complete", "value": i})
+            game.flushOutbox()
+        state = game.resume(game.players["1"], 0)
+        assert responses(state, "state-version") == [game.version]
+        assert not responses(state, "roll-complete")
+
+    asyncio.run(main())
+
+
+def test_rejoin_gets_what_the_old_connection_missed():
+    async def main():
+        game, _ = makeGame()
+        host = game.players["0"]
+        before = game.seq
+        # still in the outbox when the old connection drops
+        game.queueMessage(host.client, {"response": "player-info", "value": 1})
+
+        messages: list[dict[str, Any]] = []
+        client = MemoryClient(lambda data: messages.extend(data if isinstance(data, list) else [data]))
+        task = asyncio.create_task(game.rejoin(host, before, client))
+        await drain()
+        assert host.client is client and client in game.clients
+        assert responses(messages, "player-info") == [1]
+        assert responses(messages, "session")[0]["seq"] == game.seq
+        client.send(None)
+        await task
+
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+import rooms
+from gameregistry import getgame
+from player import Player
+from client import NullClient
+from rooms import RoomLimitError, RoomManager
+
+
+def test_room_limits():
+    async def main():
+        manager = RoomManager(maxRooms=3, maxRoomsPerAddress=2)
+        assert manager.route("/rooms/new", "1.1.1.1")
+        assert manager.route("/rooms/new", "1.1.1.1")
+        with pytest.raises(RoomLimitError):
+            manager.route("/rooms/new", "1.1.1.1")
+        assert manager.route("/rooms/new", "2.2.2.2")
+        with pytest.raises(RoomLimitError):
+            manager.route("/rooms/new", "3.3.3.3")
+
+    asyncio.run(main())
+
+
+def test_closing_frees_the_address():
+    async def main():
+        manager = RoomManager(maxRoomsPerAddress=1)
+        game = manager.route("/rooms/new", "1.1.1.1")
+        assert game
+        await manager.close(game.id)
+        assert manager.route("/rooms/new", "1.1.1.1")
+
+    asyncio.run(main())
+
+
+def test_idle_game_is_closed(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(rooms, "ROOM_IDLE", 0.01)
+
+    async def main():
+        manager = RoomManager()
+        game = manager.route("/rooms/new", "1.1.1.1")
+        assert game
+        # held while its connection joins
+        await asyncio.sleep(0.05)
+        assert getgame(game.id) is game
+        manager.release(game)
+        await asyncio.sleep(0.05)
+        assert getgame(game.id) is None
+
+    asyncio.run(main())
+
+
+def test_connected_game_stays_open(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(rooms, "ROOM_IDLE", 0.01)
+
+    async def main():
+        manager = RoomManager()
+        game = manager.route("/rooms/new", "1.1.1.1")
+        assert game
+        game.addPlayer(Player("0", 0, NullClient()))
+        manager.release(game)
+        await asyncio.sleep(0.05)
+        assert getgame(game.id) is game
+
+    asyncio.run(main())
+
+
+def test_finished_game_is_closed(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(rooms, "ROOM_FINISHED", 0.01)
+
+    async def main():
+        manager = RoomManager()
+        game = manager.route("/rooms/new", "1.1.1.1")
+        assert game
+        for i in range(2):
+            game.addPlayer(Player(str(i), i, NullClient()))
+        game.started = True
+        game.players["0"].host = True
+        await game.handleAction({"action": "bankrupt"}, game.players["1"])
+        assert game.finished
+        await asyncio.sleep(0.05)
+        assert getgame(game.id) is None
+
+    asyncio.run(main())
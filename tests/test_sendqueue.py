@@ -0,0 +1,121 @@
+import asyncio
+import json
+from typing import Any
+
+from metrics import metrics
+from sendqueue import POLICY_COALESCE, POLICY_DISCONNECT, POLICY_DROP, SendQueue, frameKind, mergeState
+
+
+def patch(base: int, players: list[dict[str, Any]], **playerSpaces: Any):
+    return {
+        "response": "state-patch",
+        "value": {"base": base, "version": base + 1, "spaces": [], "players": players, "playerSpaces": playerSpaces, "trades": [], "loans": []},
+    }
+
+
+def makeQueue(maxsize: int, policy: str):
+    written: list[Any] = []
+    overflowed: list[bool] = []
+
+    async def write(data: Any):
+        written.append(json.loads(data))
+
+    queue = SendQueue(write, maxsize, policy, lambda: overflowed.append(True), lambda data: json.loads(data), json.dumps)
+    return queue, written, overflowed
+
+
+def put(queue: SendQueue, messages: list[dict[str, Any]]):
+    return queue.put(json.dumps(messages), frameKind(messages))
+
+
+def test_merged_patches_keep_the_version_chain():
+    merged = mergeState([
+        patch(3, [{"id": "0", "money": 1}, {"id": "1", "money": 1}], **{"0": {"id": 1}}),
+        {"response": "seq", "value": 1},
+        patch(4, [{"id": "0", "money": 2}], **{"1": {"id": 2}}),
+        {"response": "seq", "value": 2},
+    ])
+    assert [message["response"] for message in merged] == ["state-patch", "seq"]
+    value = merged[0]["value"]
+    assert (value["base"], value["version"]) == (3, 5)
+    assert value["players"] == [{"id": "0", "money": 2}, {"id": "1", "money": 1}]
+    assert value["playerSpaces"] == {"0": {"id": 1}, "1": {"id": 2}}
+    assert merged[1]["value"] == 2
+
+
+def test_full_state_supersedes_earlier_patches():
+    merged = mergeState([
+        patch(3, []),
+        {"response": "state-version", "value": 7},
+        {"response": "player-list", "value": []},
+        patch(7, []),
+    ])
+    assert [message["response"] for message in merged] == ["state-version", "player-list", "state-patch"]
+
+
+def test_patches_that_do_not_follow_each_other_are_kept():
+    merged = mergeState([patch(3, []), patch(5, [])])
+    assert [message["value"]["base"] for message in merged] == [3, 5]
+
+
+def test_coalesce_merges_state_frames():
+    async def main():
+        queue, written, overflowed = makeQueue(2, POLICY_COALESCE)
+        for base in range(4):
+            assert put(queue, [patch(base, [{"id": "0", "money": base}]), {"response": "seq", "value": base}])
+        assert len(queue.pending) == 2 and queue.coalesced == 2
+        await asyncio.sleep(0.01)
+        queue.close()
+        patches = [message["value"] for frame in written for message in frame if message["response"] == "state-patch"]
+        assert (patches[0]["base"], patches[-1]["version"]) == (0, 4)
+        assert all(a["version"] == b["base"] for a, b in zip(patches, patches[1:]))
+        assert not overflowed
+
+    asyncio.run(main())
+
+
+def test_coalesce_disconnects_instead_of_dropping_other_frames():
+    async def main():
+        queue, _, overflowed = makeQueue(2, POLICY_COALESCE)
+        for i in range(2):
+            assert put(queue, [{"response": "notification", "value": i}])
+        assert not put(queue, [{"response": "notification", "value": 2}])
+        assert queue.closed and overflowed == [True]
+        assert queue.dropped == 3
+
+    asyncio.run(main())
+
+
+def test_drop_policy_drops_the_new_frame():
+    async def main():
+        queue, _, overflowed = makeQueue(1, POLICY_DROP)
+        assert put(queue, [{"response": "notification", "value": 0}])
+        assert not put(queue, [{"response": "notification", "value": 1}])
+        assert len(queue.pending) == 1 and queue.dropped == 1
+        assert not queue.closed and not overflowed
+        queue.close()
+
+    asyncio.run(main())
+
+
+def test_disconnect_policy():
+    async def main():
+        queue, _, overflowed = makeQueue(1, POLICY_DISCONNECT)
+        assert put(queue, [patch(0, [])])
+        assert not put(queue, [patch(1, [])])
+        assert queue.closed and overflowed == [True]
+
+    asyncio.run(main())
+
+
+def test_send_latency_is_labelled_by_policy():
+    async def main():
+        queue, written, _ = makeQueue(4, POLICY_DROP)
+        before = metrics.sendLatency.values[POLICY_DROP].count if POLICY_DROP in metrics.sendLatency.values else 0
+        assert put(queue, [{"response": "notification", "value": 0}])
+        await asyncio.sleep(0.01)
+        queue.close()
+        assert written and metrics.sendLatency.values[POLICY_DROP].count == before + 1
+        assert "" not in metrics.sendLatency.values
+
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+import asyncio
+from typing import Any
+
+from client import MemoryClient
+from spectators import SpectatorStream
+from util import drain, makeGame, responses
+
+
+def spectator() -> tuple[MemoryClient, list[list[dict[str, Any]]]]:
+    frames: list[list[dict[str, Any]]] = []
+    return MemoryClient(frames.append), frames
+
+
+def test_late_spectator_sees_the_current_turn():
+    async def main():
+        game, _ = makeGame()
+        game.spectators = SpectatorStream(game, rate=0)
+        await game.handleAction({"action": "end-turn"}, game.curPlayer)
+        await game.handleAction({"action": "roll"}, game.curPlayer)
+        early, _ = spectator()
+        game.spectators.subscribe(early)
+        await drain()
+
+        # ending a turn changes whose turn it is without a state patch
+        version = game.version
+        await game.handleAction({"action": "end-turn"}, game.curPlayer)
+        assert game.version == version
+        late, frames = spectator()
+        game.spectators.subscribe(late)
+        await drain()
+        [snapshot] = frames
+        assert responses(snapshot, "next-turn")[0]["id"] == game.curPlayer.id
+        assert responses(snapshot, "spectating") == [game.id]
+        game.stop()
+
+    asyncio.run(main())
+
+
+def test_spectators_get_the_players_frames():
+    async def main():
+        game, received = makeGame()
+        game.spectators = SpectatorStream(game, rate=0)
+        client, frames = spectator()
+        game.spectators.subscribe(client)
+        await drain()
+        received["1"].clear()
+
+        await game.handleAction({"action": "roll"}, game.players["0"])
+        await drain()
+        assert client not in game.clients
+        assert [m for frame in frames[1:] for m in frame] == received["1"]
+        game.stop()
+
+    asyncio.run(main())
+
+
+def test_rate_merges_frames():
+    async def main():
+        game, _ = makeGame()
+        game.spectators = SpectatorStream(game, rate=20)
+        client, frames = spectator()
+        game.spectators.subscribe(client)
+        await drain()
+
+        for i in range(3):
+            await game.broadcast({"response": "player-list", "value": i})
+        await asyncio.sleep(0.1)
+        await drain()
+        # the stream waits out its rate after the snapshot, so all three go out in one frame with the newest only
+        assert [responses(frame, "player-list") for frame in frames[1:]] == [[2]]
+        game.stop()
+
+    asyncio.run(main())
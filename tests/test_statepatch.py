@@ -0,0 +1,106 @@
+import asyncio
+
+import actions
+from loan import Loan
+from util import drain, makeGame, responses
+
+
+def test_patch_has_only_what_changed():
+    async def main():
+        game, _ = makeGame()
+        # everything is new at first
+        assert actions.getStatePatch(game)
+        assert actions.getStatePatch(game) is None
+
+        player = game.players["1"]
+        version = game.version
+        player.money += 50
+        patch = actions.getStatePatch(game)
+        assert patch
+        value = patch["value"]
+        assert (value["base"], value["version"]) == (version, version + 1)
+        assert [p["id"] for p in value["players"]] == ["1"]
+        assert value["players"][0]["money"] == player.money
+        # the space a changed player stands on comes along, its json lists who is there
+        assert player.space and [s["id"] for s in value["spaces"]] == [player.space.id]
+        assert value["trades"] == [] and value["loans"] == []
+
+    asyncio.run(main())
+
+
+def test_players_on_a_changed_space_get_its_new_json():
+    async def main():
+        game, _ = makeGame()
+        owner, other = game.players["0"], game.players["1"]
+        space = game.board.spaces[1]
+        owner.buy(space)
+        game.board.playerSpaces[other.id] = space
+        actions.getStatePatch(game)
+
+        owner.mortgage(space)
+        patch = actions.getStatePatch(game)
+        assert patch
+        playerSpaces = patch["value"]["playerSpaces"]
+        assert sorted(playerSpaces) == ["0", "1"]
+        assert playerSpaces["1"]["mortgaged"]
+
+    asyncio.run(main())
+
+
+def test_accepted_loans_go_out_after_each_roll():
+    async def main():
+        game, received = makeGame()
+        player = game.curPlayer
+        loan = Loan(game.id, "Bank", player.id, "deadline", 100, 10, "simple", "proposed", deadline=3)
+        game.ledger.add(loan)
+        player.loans.append(loan)
+        game.ledger.accept(loan)
+        actions.getStatePatch(game)
+
+        await game.handleAction({"action": "roll"}, player)
+        await drain()
+        sent = [l for patch in responses(received["1"], "state-patch") for l in patch["loans"] if l["id"] == loan.id]
+        assert sent and sent[-1]["turnsPassed"] == 1
+
+    asyncio.run(main())
+
+
+def test_patches_chain_by_version():
+    async def main():
+        game, received = makeGame()
+        actions.getStatePatch(game)
+        for _ in range(6):
+            player = game.curPlayer
+            await game.handleAction({"action": "roll"}, player)
+            await game.handleAction({"action": "end-turn"}, player)
+        await drain()
+
+        patches = responses(received["0"], "state-patch")
+        assert patches
+        version = patches[0]["base"]
+        for patch in patches:
+            assert patch["base"] == version
+            version = patch["version"]
+        assert version == game.version
+
+    asyncio.run(main())
+
+
+def test_resync_sends_the_full_state():
+    async def main():
+        game, received = makeGame()
+        actions.getStatePatch(game)
+        game.players["0"].money += 1
+        await game.handleAction({"action": "resync"}, game.players["1"])
+        await drain()
+
+        # the full state is at the version it was sent at, the patch the action ends with goes on top of it
+        [version] = responses(received["1"], "state-version")
+        [patch] = responses(received["1"], "state-patch")
+        assert (patch["base"], patch["version"]) == (version, game.version)
+        players = responses(received["1"], "player-list")[0]
+        assert {p["id"]: p["money"] for p in players} == {p.id: p.money for p in game.players.values()}
+        # only the player that asked gets it
+        assert responses(received["0"], "state-version") == []
+
+    asyncio.run(main())
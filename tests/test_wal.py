@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import rooms
+from client import MemoryClient
+from game import Game
+from gameregistry import getgame, removegame
+from player import Player
+from rooms import RoomManager
+from wal import CLOSED, dumpGame, recoverAll, recoverGame
+
+
+async def playedGame(manager: RoomManager, turns: int = 10) -> Game:
+    """a game from manager with two players that played some turns, its log flushed"""
+    game = manager.create()
+    for i in range(2):
+        player = Player(str(i), i, MemoryClient())
+        player.address = f"10.0.0.{i}"
+        asyncio.create_task(game.join(player))
+    await asyncio.sleep(0.01)
+    host = game.players["0"]
+    await game.handleAction({"action": "start-game"}, host)
+    for _ in range(turns):
+        player = game.curPlayer
+        await game.handleAction({"action": "roll"}, player)
+        space = player.space
+        if space and space.purchaseable and not space.owner:
+            await game.handleAction({"action": "buy", "spaceid": space.id}, player)
+        await game.handleAction({"action": "end-turn"}, player)
+    assert game.log
+    await game.log.flush()
+    return game
+
+
+async def crash(game: Game):
+    """stops the game without a last snapshot, as if the process died"""
+    assert game.log and game.log.task
+    game.stop()
+    game.log.task.cancel()
+    await asyncio.sleep(0.01)
+    removegame(game.id)
+
+
+def test_recovery_rebuilds_the_game(tmp_path):
+    async def main():
+        game = await playedGame(RoomManager(walDir=str(tmp_path)))
+        before = json.dumps(dumpGame(game), sort_keys=True)
+        assert game.log
+        seq = game.log.seq
+        await crash(game)
+
+        recovered, log = await recoverGame(f"{tmp_path}/{game.id}")
+        assert log.seq == seq and recovered.log is log
+        assert json.dumps(dumpGame(recovered), sort_keys=True) == before
+        await log.close()
+
+    asyncio.run(main())
+
+
+def test_finished_games_are_not_recovered(tmp_path):
+    async def main():
+        game = await playedGame(RoomManager(walDir=str(tmp_path)), turns=2)
+        await game.handleAction({"action": "bankrupt"}, game.players["1"])
+        assert game.finished and game.log
+        await game.log.flush()
+        await crash(game)
+
+        assert await RoomManager(walDir=str(tmp_path)).recover() == []
+        assert not os.path.exists(f"{tmp_path}/{game.id}")
+
+    asyncio.run(main())
+
+
+def test_recovered_game_closes_when_nobody_comes_back(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    async def main():
+        game = await playedGame(RoomManager(walDir=str(tmp_path)))
+        await crash(game)
+        monkeypatch.setattr(rooms, "ROOM_IDLE", 0.01)
+
+        recovered = await RoomManager(walDir=str(tmp_path)).recover()
+        assert [g.id for g in recovered] == [game.id]
+        await asyncio.sleep(0.05)
+        assert getgame(game.id) is None
+        assert not os.path.exists(f"{tmp_path}/{game.id}")
+
+    asyncio.run(main())
+
+
+def test_closing_a_room_deletes_its_log(tmp_path):
+    async def main():
+        manager = RoomManager(walDir=str(tmp_path))
+        game = await playedGame(manager, turns=1)
+        await manager.close(game.id)
+        assert os.listdir(tmp_path) == []
+
+    asyncio.run(main())
+
+
+def test_kept_history_is_not_recovered_once_closed(tmp_path):
+    async def main():
+        manager = RoomManager(walDir=str(tmp_path), keepHistory=True)
+        game = await playedGame(manager, turns=1)
+        await manager.close(game.id)
+        assert os.path.exists(f"{tmp_path}/{game.id}/{CLOSED}")
+        assert await recoverAll(str(tmp_path), keepHistory=True) == []
+
+    asyncio.run(main())
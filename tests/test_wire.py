@@ -0,0 +1,50 @@
+import json
+from enum import IntEnum
+
+import pytest
+
+import actions
+import wire
+from util import makeGame
+
+
+def roundTrip(data):
+    return wire.unpack(wire.pack(data))
+
+
+def test_full_state_round_trips_like_json():
+    game, _ = makeGame()
+    state = actions.getFullState(game)
+    assert roundTrip(state) == json.loads(json.dumps(state))
+
+
+@pytest.mark.parametrize("n", [0, 127, 128, -1, -32, -33, 0xFFFF, 0x10000, 2**32 - 1, 2**32, 2**64 - 1, -(2**63)])
+def test_ints(n: int):
+    assert roundTrip(n) == n
+
+
+@pytest.mark.parametrize("n", [2**64, -(2**63) - 1])
+def test_ints_out_of_range(n: int):
+    with pytest.raises(OverflowError):
+        wire.pack(n)
+
+
+@pytest.mark.parametrize("n", [31, 32, 0xFF, 0x100, 0x10000])
+def test_long_strings_lists_and_maps(n: int):
+    data = {"s": "x" * n, "l": list(range(n)), "m": {f"k{i}": i for i in range(n)}}
+    assert roundTrip(data) == data
+
+
+def test_known_keys_go_out_as_their_index():
+    assert wire.pack({"response": "seq"}) == bytes((0x81, wire.KEY_INDEX["response"], 0xA3)) + b"seq"
+    # an int key would read as a KEYS index, so it goes out as a string the way json has it
+    assert roundTrip({1: "a", "unknown": None}) == {"1": "a", "unknown": None}
+
+
+def test_subclasses_pack_as_their_base():
+    class Level(IntEnum):
+        TOP = 3
+
+    assert wire.pack(Level.TOP) == wire.pack(3)
+    with pytest.raises(TypeError):
+        wire.pack(object())
@@ -0,0 +1,32 @@
+import asyncio
+from typing import Any
+
+from client import MemoryClient
+from game import Game
+from player import Player
+
+
+def makeGame(players: int = 2, seed: int = 1, start: bool = True) -> tuple[Game, dict[str, list[dict[str, Any]]]]:
+    """a game on the main board with MemoryClient players, and every message each of them got by player id"""
+    game = Game("main", seed=seed)
+    received: dict[str, list[dict[str, Any]]] = {}
+    for i in range(players):
+        messages = received[str(i)] = []
+        client = MemoryClient(lambda data, messages=messages: messages.extend(data if isinstance(data, list) else [data]))
+        player = Player(str(i), i, client)
+        player.gameid = game.id
+        game.addPlayer(player)
+    if start:
+        game.started = True
+        game.players["0"].host = True
+    return game, received
+
+
+async def drain():
+    """lets the send queue writer tasks hand over what they have"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def responses(messages: list[dict[str, Any]], name: str) -> list[Any]:
+    return [message["value"] for message in messages if message.get("response") == name]